@@ -1,15 +1,147 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, Response, render_template, request, jsonify, send_file, stream_with_context
+import math
 import os
-from stegano_png import hide_text_png, extract_text_png
-from stegano_jpg import hide_text_jpg, extract_text_jpg
-from stegano_bmp import hide_text_bmp, extract_text_bmp
-from stegano_webp import hide_text_webp, extract_text_webp
+import shutil
+import uuid
+import zipfile
+from urllib.parse import urlencode
+from stegano_formats import (
+    UNSUPPORTED_FORMAT_MESSAGE,
+    CapacityError,
+    OUTPUT_EXTENSIONS,
+    OUTPUT_MIMETYPES,
+    extract_auto,
+    extract_image_keys,
+    resolve_format,
+    sniff_format,
+    stego_filename,
+    hide_image_to_file,
+    hide_image_to_stream,
+    check_capacity,
+    image_capacity,
+    payload_capacity,
+    encoder_profile,
+    extract_image_text,
+)
+from encoder_profiles import AUTO_PROFILE, PROFILE_NAMES
+from jobs import JobManager, JobQueueFull, run_extract_job, run_hide_job
+from batch import BatchTooLarge, assign_texts, collect_batch_items, iter_batch_zip, new_batch_dir, parse_manifest
+from result_cache import ResultCache, result_key
+from storage import STORAGE_TTL, ArtifactStore
+from stegano_lsb import DEFAULT_POSITION_SCHEME
+from stegano_payload import COMPRESSION_METHODS, LSB_DEPTHS, MAX_DECOMPRESSED_SIZE, PAYLOAD_COMPRESSION, encode_payload
 import io
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['STEGANO_KEY'] = 'my_secret_stegano_key_2026'
+# Бюджет времени кодирования (секунды) для профиля 'auto'
+app.config['ENCODER_LATENCY_BUDGET'] = 2.0
+# Во сколько раз файл /hide_file может быть больше ёмкости изображения
+# (в расчёте на сжатие); больше не читается
+app.config['HIDE_FILE_MAX_RATIO'] = 32
+# Бит данных на канал для PNG, BMP и WebP, если в форме нет depth
+app.config['LSB_DEPTH'] = 1
+# Сколько ключей можно перебрать в одном запросе /extract_keys
+app.config['MAX_EXTRACT_KEYS'] = 1000
+# Загрузки и результаты асинхронных задач
+app.config['JOB_FOLDER'] = os.path.join('uploads', 'jobs')
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+os.makedirs(app.config['JOB_FOLDER'], exist_ok=True)
+
+job_manager = JobManager()
+# Результаты /hide_text: файлы по хешу содержимого с квотой и сроком жизни,
+# поверх них - кэш по хешу входных данных запроса
+artifact_store = ArtifactStore(app.config['UPLOAD_FOLDER'])
+result_cache = ResultCache(artifact_store)
+
+def _encoder_options():
+    """
+    Профиль кодировщика и бюджет времени из формы; профиль None, если он
+    неизвестен, бюджет None, если это не конечное неотрицательное число.
+    """
+    # По умолчанию профиль выбирается по бюджету времени
+    profile = request.form.get('profile', AUTO_PROFILE)
+    if profile != AUTO_PROFILE and profile not in PROFILE_NAMES:
+        profile = None
+    try:
+        latency_budget = float(request.form.get('latency_budget', app.config['ENCODER_LATENCY_BUDGET']))
+    except ValueError:
+        return profile, None
+    if not math.isfinite(latency_budget) or latency_budget < 0:
+        return profile, None
+    return profile, latency_budget
+
+def _latency_budget_error():
+    return jsonify({'error': f"Invalid latency budget: {request.form['latency_budget']}"}), 400
+
+def _lsb_depth():
+    """Глубина LSB (бит данных на канал) из формы; None, если она недопустима"""
+    try:
+        depth = int(request.form.get('depth', app.config['LSB_DEPTH']))
+    except ValueError:
+        return None
+    return depth if depth in LSB_DEPTHS else None
+
+def _depth_error():
+    return jsonify({'error': f"LSB depth must be one of {', '.join(map(str, LSB_DEPTHS))}"}), 400
+
+def _compression():
+    """Метод сжатия сообщения из формы; None, если он неизвестен"""
+    compression = request.form.get('compression', PAYLOAD_COMPRESSION)
+    return compression if compression in COMPRESSION_METHODS else None
+
+def _compression_error():
+    return jsonify({'error': f"Compression must be one of {', '.join(COMPRESSION_METHODS)}"}), 400
+
+def _wants_binary(fmt: str) -> bool:
+    """
+    Вернуть изображение прямо в ответе вместо JSON: ?binary=1
+    или Accept, в котором тип изображения предпочтительнее JSON.
+    """
+    if request.args.get('binary', '').lower() in ('1', 'true', 'yes'):
+        return True
+    best = request.accept_mimetypes.best_match(['application/json', OUTPUT_MIMETYPES[fmt]])
+    return best == OUTPUT_MIMETYPES[fmt]
+
+def _hide_response(image_file, fmt: str, payload, profile: str, latency_budget: float, depth: int,
+                   compression: str):
+    """
+    Встраивает payload (текст или bytes) и отвечает JSON со ссылкой
+    на результат или, по запросу, самим изображением (_wants_binary).
+    Повтор того же запроса получает уже готовый файл.
+    Профиль 'auto' разрешается до построения ключа, поэтому запросы
+    с разными бюджетами времени получают результат своего профиля.
+    """
+    profile = encoder_profile(fmt, image_file, profile, latency_budget)
+    key = result_key(image_file, payload, app.config['STEGANO_KEY'], fmt, DEFAULT_POSITION_SCHEME, profile,
+                     depth, compression)
+    output_filename = stego_filename(image_file.filename, fmt)
+
+    if _wants_binary(fmt):
+        # Один запрос вместо двух: результат сразу в ответе, без записи на диск
+        artifact = result_cache.get(key)
+        output = artifact_store.get(artifact) if artifact is not None else None
+        if output is None:
+            output = hide_image_to_stream(fmt, image_file, payload, app.config['STEGANO_KEY'],
+                                          profile, latency_budget, job_manager.executor(), depth, compression)
+        return send_file(output, mimetype=OUTPUT_MIMETYPES[fmt],
+                         as_attachment=True, download_name=output_filename)
+
+    def produce(output_path):
+        # Длинные сообщения встраиваются пулом процессов через разделяемую память
+        hide_image_to_file(fmt, image_file, output_path, payload, app.config['STEGANO_KEY'],
+                           profile, latency_budget, job_manager.executor(), depth, compression=compression)
+
+    artifact, cached = result_cache.get_or_create(key, OUTPUT_EXTENSIONS[fmt], produce)
+
+    return jsonify({
+        'success': True,
+        'message': 'Text hidden successfully',
+        'stego_filename': output_filename,
+        'download_url': f'/download/{artifact}?{urlencode({"name": output_filename})}',
+        'cached': cached
+    })
 
 @app.route('/')
 def index():
@@ -31,43 +163,128 @@ def hide_text():
         if not text:
             return jsonify({'error': 'No text provided'}), 400
 
-        # Определяем формат изображения
-        filename_lower = image_file.filename.lower()
-        
-        if filename_lower.endswith('.png'):
-            output_stream = hide_text_png(image_file, text, app.config['STEGANO_KEY'])
-            output_extension = '.png'
-            
-        elif filename_lower.endswith(('.jpg', '.jpeg', '.jpe')):
-            output_stream = hide_text_jpg(image_file, text)
-            output_extension = '.jpg'
-            
-        elif filename_lower.endswith('.bmp'):
-            output_stream = hide_text_bmp(image_file, text, app.config['STEGANO_KEY'])
-            output_extension = '.bmp'
-            
-        elif filename_lower.endswith('.webp'):
-            output_stream = hide_text_webp(image_file, text, app.config['STEGANO_KEY'])
-            output_extension = '.webp'
-            
-        else:
-            return jsonify({'error': 'Unsupported image format. Use PNG, JPG, BMP, or WebP'}), 400
+        profile, latency_budget = _encoder_options()
+        if profile is None:
+            return jsonify({'error': f"Unknown encoder profile: {request.form['profile']}"}), 400
+        if latency_budget is None:
+            return _latency_budget_error()
+        depth = _lsb_depth()
+        if depth is None:
+            return _depth_error()
+        compression = _compression()
+        if compression is None:
+            return _compression_error()
+
+        # Определяем формат изображения: по сигнатуре, затем по имени
+        fmt = resolve_format(image_file, image_file.filename)
+        if fmt is None:
+            return jsonify({'error': UNSUPPORTED_FORMAT_MESSAGE}), 400
+
+        return _hide_response(image_file, fmt, text, profile, latency_budget, depth, compression)
+
+    except CapacityError as e:
+        return jsonify({'error': str(e)}), 413
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/hide_file', methods=['POST'])
+def hide_file():
+    """
+    Скрытие файла: изображение и файл данных в одном запросе, без передачи
+    текста через браузер. .txt в UTF-8 встраивается как текст, остальные
+    файлы - как байты. Файл читается не дальше ёмкости изображения,
+    умноженной на HIDE_FILE_MAX_RATIO (запас на сжатие), и не дальше
+    MAX_DECOMPRESSED_SIZE; поместится ли он после сжатия, проверяет
+    check_capacity при встраивании.
+    """
+    try:
+        if 'image' not in request.files:
+            return jsonify({'error': 'No image file'}), 400
+        if 'payload' not in request.files:
+            return jsonify({'error': 'No payload file'}), 400
+
+        image_file = request.files['image']
+        payload_file = request.files['payload']
+
+        if image_file.filename == '':
+            return jsonify({'error': 'No image selected'}), 400
+        if payload_file.filename == '':
+            return jsonify({'error': 'No payload file selected'}), 400
+
+        profile, latency_budget = _encoder_options()
+        if profile is None:
+            return jsonify({'error': f"Unknown encoder profile: {request.form['profile']}"}), 400
+        if latency_budget is None:
+            return _latency_budget_error()
+        depth = _lsb_depth()
+        if depth is None:
+            return _depth_error()
+        compression = _compression()
+        if compression is None:
+            return _compression_error()
+
+        fmt = resolve_format(image_file, image_file.filename)
+        if fmt is None:
+            return jsonify({'error': UNSUPPORTED_FORMAT_MESSAGE}), 400
+
+        # Сжимаемый файл может быть больше ёмкости, но память ограничена ёмкостью
+        # изображения: дальше HIDE_FILE_MAX_RATIO ёмкостей не читаем
+        capacity = payload_capacity(fmt, image_file, depth)
+        limit = max(capacity, min(capacity * app.config['HIDE_FILE_MAX_RATIO'], MAX_DECOMPRESSED_SIZE))
+        payload = payload_file.stream.read(limit + 1)
+        if len(payload) > limit:
+            return jsonify({'error': f'Payload file is too large for this image (max {limit} bytes)'}), 413
+        if not payload:
+            return jsonify({'error': 'Payload file is empty'}), 400
+
+        if payload_file.filename.lower().endswith('.txt'):
+            try:
+                payload = payload.decode('utf-8')
+            except UnicodeDecodeError:
+                pass
+
+        return _hide_response(image_file, fmt, payload, profile, latency_budget, depth, compression)
+
+    except CapacityError as e:
+        return jsonify({'error': str(e)}), 413
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/capacity', methods=['POST'])
+def capacity():
+    """
+    Ёмкость изображения по его заголовку, без декодирования пикселей.
+    С text в форме ответ также говорит, поместится ли этот текст;
+    depth - глубина LSB, для которой считается ёмкость.
+    """
+    try:
+        if 'image' not in request.files:
+            return jsonify({'error': 'No image file'}), 400
+
+        image_file = request.files['image']
+        if image_file.filename == '':
+            return jsonify({'error': 'No image selected'}), 400
+
+        depth = _lsb_depth()
+        if depth is None:
+            return _depth_error()
+        compression = _compression()
+        if compression is None:
+            return _compression_error()
+
+        fmt = resolve_format(image_file, image_file.filename)
+        if fmt is None:
+            return jsonify({'error': UNSUPPORTED_FORMAT_MESSAGE}), 400
+
+        result = {'success': True, 'format': fmt, **image_capacity(fmt, image_file, depth)}
+        text = request.form.get('text', '').strip()
+        if text:
+            # Встраивается сжатый текст - он и сравнивается с ёмкостью
+            result['text_bytes'] = len(text.encode('utf-8'))
+            result['embedded_bytes'] = len(encode_payload(text, compression).data)
+            result['fits'] = result['embedded_bytes'] <= result['payload_bytes']
+        return jsonify(result)
 
-        # Сохраняем результат
-        original_name = os.path.splitext(image_file.filename)[0]
-        output_filename = f"{original_name}_stego{output_extension}"
-        output_path = os.path.join(app.config['UPLOAD_FOLDER'], output_filename)
-        
-        with open(output_path, 'wb') as f:
-            f.write(output_stream.getvalue())
-        
-        return jsonify({
-            'success': True,
-            'message': 'Text hidden successfully',
-            'stego_filename': output_filename,
-            'download_url': f'/download/{output_filename}'
-        })
-        
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -83,26 +300,27 @@ def extract_text():
         if image_file.filename == '':
             return jsonify({'error': 'No image selected'}), 400
 
-        # Определяем формат изображения
-        filename_lower = image_file.filename.lower()
+        # Определяем формат изображения: по сигнатуре, затем по имени
+        fmt = resolve_format(image_file, image_file.filename)
+        if fmt is None:
+            return jsonify({'error': UNSUPPORTED_FORMAT_MESSAGE}), 400
         
-        if filename_lower.endswith('.png'):
-            extracted_text = extract_text_png(image_file, app.config['STEGANO_KEY'])
-            
-        elif filename_lower.endswith(('.jpg', '.jpeg', '.jpe')):
-            extracted_text = extract_text_jpg(image_file)
-            
-        elif filename_lower.endswith('.bmp'):
-            extracted_text = extract_text_bmp(image_file, app.config['STEGANO_KEY'])
-            
-        elif filename_lower.endswith('.webp'):
-            extracted_text = extract_text_webp(image_file, app.config['STEGANO_KEY'])
-            
+        found = None
+        if request.form.get('mode', request.args.get('mode')) == 'auto':
+            # Алгоритм неизвестен: одно декодирование, кандидаты параллельно
+            found = extract_auto(image_file, app.config['STEGANO_KEY'])
+        if found is not None:
+            extracted_text = found.payload
         else:
-            return jsonify({'error': 'Unsupported image format. Use PNG, JPG, BMP, or WebP'}), 400
+            extracted_text = extract_image_text(fmt, image_file, app.config['STEGANO_KEY'])
         
         if not extracted_text:
             return jsonify({'error': 'No hidden text found in the image'}), 400
+
+        # Двоичные данные (/hide_file) отдаются файлом
+        if isinstance(extracted_text, bytes):
+            return send_file(io.BytesIO(extracted_text), mimetype='application/octet-stream',
+                             as_attachment=True, download_name='hidden_payload.bin')
         
         return jsonify({
             'success': True,
@@ -113,17 +331,296 @@ def extract_text():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/download/<filename>')
-def download_file(filename):
-    """Скачивание файла"""
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """
+    Ставит встраивание (action=hide) или извлечение (action=extract)
+    в пул процессов и сразу возвращает идентификатор задачи
+    """
+    try:
+        action = request.form.get('action', 'hide')
+        if action not in ('hide', 'extract'):
+            return jsonify({'error': f'Unknown action: {action}'}), 400
+
+        if 'image' not in request.files:
+            return jsonify({'error': 'No image file'}), 400
+
+        image_file = request.files['image']
+        if image_file.filename == '':
+            return jsonify({'error': 'No image selected'}), 400
+
+        fmt = resolve_format(image_file, image_file.filename)
+        if fmt is None:
+            return jsonify({'error': UNSUPPORTED_FORMAT_MESSAGE}), 400
+
+        if action == 'hide':
+            text = request.form.get('text', '').strip()
+            if not text:
+                return jsonify({'error': 'No text provided'}), 400
+            profile, latency_budget = _encoder_options()
+            if profile is None:
+                return jsonify({'error': f"Unknown encoder profile: {request.form['profile']}"}), 400
+            if latency_budget is None:
+                return _latency_budget_error()
+            depth = _lsb_depth()
+            if depth is None:
+                return _depth_error()
+            compression = _compression()
+            if compression is None:
+                return _compression_error()
+            # Не ставим в очередь задачу, которая заведомо не поместится;
+            # исполнителю уходит уже сжатое сообщение
+            text = check_capacity(fmt, image_file, text, depth, compression)
+
+        # Загрузка сохраняется на диск: исполнитель читает её сам, без передачи байтов
+        token = uuid.uuid4().hex
+        source_path = os.path.join(app.config['JOB_FOLDER'], f"{token}_source{OUTPUT_EXTENSIONS[fmt]}")
+        image_file.save(source_path)
+
+        try:
+            if action == 'hide':
+                output_path = os.path.join(app.config['JOB_FOLDER'], f"{token}_stego{OUTPUT_EXTENSIONS[fmt]}")
+                job_id = job_manager.submit('hide', run_hide_job, fmt, source_path, output_path, text,
+                                            app.config['STEGANO_KEY'], profile, latency_budget, depth,
+                                            download_name=stego_filename(image_file.filename, fmt))
+            else:
+                job_id = job_manager.submit('extract', run_extract_job, fmt, source_path,
+                                            app.config['STEGANO_KEY'])
+        except JobQueueFull as e:
+            os.remove(source_path)
+            return jsonify({'error': str(e)}), 503
+
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status_url': f'/jobs/{job_id}',
+            'result_url': f'/jobs/{job_id}/result'
+        }), 202
+
+    except CapacityError as e:
+        return jsonify({'error': str(e)}), 413
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Состояние задачи: статус, прогресс, ошибка"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    return jsonify({
+        'job_id': job_id,
+        'kind': job['kind'],
+        'status': job['status'],
+        'progress': job['progress'],
+        'error': job['error'],
+        'result_url': f'/jobs/{job_id}/result' if job['status'] == 'done' else None
+    })
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    """Результат задачи: файл со встроенным текстом или извлечённый текст"""
+    try:
+        job = job_manager.get(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+        if job['status'] == 'error':
+            return jsonify({'error': job['error']}), 500
+        if job['status'] != 'done':
+            return jsonify({'error': 'Job is not finished', 'status': job['status']}), 409
+
+        if job['kind'] == 'hide':
+            return send_file(job['result'], as_attachment=True, download_name=job['download_name'])
+
+        if not job['result']:
+            return jsonify({'error': 'No hidden text found in the image'}), 400
+
+        # Двоичные данные (/hide_file) отдаются файлом, как в /extract_text
+        if isinstance(job['result'], bytes):
+            return send_file(io.BytesIO(job['result']), mimetype='application/octet-stream',
+                             as_attachment=True, download_name='hidden_payload.bin')
+
+        return jsonify({
+            'success': True,
+            'message': 'Text extracted successfully',
+            'text': job['result']
+        })
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/hide_batch', methods=['POST'])
+def hide_batch():
+    """
+    Встраивание в пакет изображений: файлы images (несколько) и/или ZIP archive.
+    Текст - общий text или манифест manifest ({имя файла: текст}), в том числе
+    manifest.json внутри архива. Ответ - ZIP, который отдаётся по мере готовности.
+    """
+    try:
+        uploads = request.files.getlist('images')
+        archive = request.files.get('archive')
+        if not uploads and archive is None:
+            return jsonify({'error': 'No images provided'}), 400
+
+        profile, latency_budget = _encoder_options()
+        if profile is None:
+            return jsonify({'error': f"Unknown encoder profile: {request.form['profile']}"}), 400
+        if latency_budget is None:
+            return _latency_budget_error()
+        depth = _lsb_depth()
+        if depth is None:
+            return _depth_error()
+        compression = _compression()
+        if compression is None:
+            return _compression_error()
+
+        text = request.form.get('text', '').strip()
+        manifest_raw = request.form.get('manifest')
+        if not manifest_raw and 'manifest' in request.files:
+            manifest_raw = request.files['manifest'].read()
+
+        batch_dir = new_batch_dir(app.config['JOB_FOLDER'])
+        try:
+            items, zip_manifest = collect_batch_items(batch_dir, uploads, archive.stream if archive else None)
+            manifest = parse_manifest(manifest_raw or zip_manifest)
+        except Exception:
+            shutil.rmtree(batch_dir, ignore_errors=True)
+            raise
+
+        if not items:
+            shutil.rmtree(batch_dir, ignore_errors=True)
+            return jsonify({'error': 'No images provided'}), 400
+
+        assign_texts(items, text, manifest, depth, compression)
+        stream = iter_batch_zip(job_manager, batch_dir, items, app.config['STEGANO_KEY'],
+                                profile, latency_budget, depth)
+        return Response(stream_with_context(stream), mimetype='application/zip',
+                        headers={'Content-Disposition': 'attachment; filename=stego_batch.zip'})
+
+    except BatchTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    except (ValueError, zipfile.BadZipFile) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/extract_keys', methods=['POST'])
+def extract_keys():
+    """
+    Извлечение, когда ключ неизвестен: keys - несколько полей формы
+    или по одному ключу на строку. Изображение декодируется один раз,
+    для каждого ключа проверяется только заголовок.
+    """
+    try:
+        if 'image' not in request.files:
+            return jsonify({'error': 'No image file'}), 400
+
+        image_file = request.files['image']
+        keys = []
+        for value in request.form.getlist('keys'):
+            keys.extend(line.strip() for line in value.splitlines() if line.strip())
+        keys = list(dict.fromkeys(keys))
+
+        if not keys:
+            return jsonify({'error': 'No keys provided'}), 400
+        if len(keys) > app.config['MAX_EXTRACT_KEYS']:
+            return jsonify({'error': f"Too many keys (max {app.config['MAX_EXTRACT_KEYS']})"}), 400
+
+        # Ключ используют только LSB-форматы: JPEG и неизвестные файлы - ошибка запроса
+        fmt = resolve_format(image_file, image_file.filename)
+        if fmt is None:
+            return jsonify({'error': UNSUPPORTED_FORMAT_MESSAGE}), 400
+
+        found = extract_image_keys(image_file, keys, image_file.filename)
+        if found is None:
+            return jsonify({'error': 'No hidden text found for these keys'}), 400
+
+        key, scheme, payload = found
+        if isinstance(payload, bytes):
+            response = send_file(io.BytesIO(payload), mimetype='application/octet-stream',
+                                 as_attachment=True, download_name='hidden_payload.bin')
+            response.headers['X-Stegano-Key-Index'] = str(keys.index(key))
+            return response
+
+        return jsonify({
+            'success': True,
+            'message': 'Text extracted successfully',
+            'key': key,
+            'key_index': keys.index(key),
+            'scheme': scheme,
+            'text': payload
+        })
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/inspect', methods=['POST'])
+def inspect():
+    """
+    Формат контейнера по сигнатуре и есть ли в нём данные с заголовком:
+    одно декодирование вместо перебора имён и алгоритмов. Сами данные не отдаются.
+    """
     try:
-        return send_file(
-            os.path.join(app.config['UPLOAD_FOLDER'], filename),
-            as_attachment=True,
-            download_name=filename
-        )
+        if 'image' not in request.files:
+            return jsonify({'error': 'No image file'}), 400
+
+        image_file = request.files['image']
+        fmt = sniff_format(image_file)
+        if fmt is None:
+            return jsonify({'error': UNSUPPORTED_FORMAT_MESSAGE}), 400
+
+        found = extract_auto(image_file, app.config['STEGANO_KEY'])
+        result = {'success': True, 'format': fmt, 'hidden': found is not None}
+        if found is not None:
+            data, _ = encode_payload(found.payload, compression='none')
+            result.update({
+                'algorithm': found.algorithm,
+                'scheme': found.scheme,
+                'binary': isinstance(found.payload, bytes),
+                'bytes': len(data),
+            })
+        return jsonify(result)
+
     except Exception as e:
-        return jsonify({'error': f'File not found: {e}'}), 404
+        return jsonify({'error': str(e)}), 500
+
+def _download_name(filename: str) -> str:
+    """
+    Имя сохраняемого файла: name из ссылки (исходное имя со _stego) без
+    каталогов и с расширением файла хранилища; без name - имя в хранилище.
+    """
+    ext = os.path.splitext(filename)[1]
+    name = os.path.basename(request.args.get('name', '').replace('\\', '/'))
+    name = ''.join(ch for ch in name if ch.isprintable()).strip()
+    if not name:
+        return filename
+    if os.path.splitext(name)[1].lower() != ext:
+        name += ext
+    return name
+
+@app.route('/download/<filename>')
+def download_file(filename):
+    """
+    Скачивание результата из хранилища (ETag, If-None-Match, Range).
+    Файл называется по ?name= из download_url, а не по хешу.
+    """
+    path = artifact_store.get(filename)
+    if path is None:
+        return jsonify({'error': 'File not found'}), 404
+
+    # Содержимое файла не меняется, поэтому ETag - его хеш;
+    # send_file отвечает 304 и 206 сам и отдаёт файл через wsgi.file_wrapper
+    return send_file(
+        path,
+        as_attachment=True,
+        download_name=_download_name(filename),
+        conditional=True,
+        etag=ArtifactStore.etag(filename),
+        max_age=STORAGE_TTL
+    )
 
 @app.route('/upload_text_file', methods=['POST'])
 def upload_text_file():
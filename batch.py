@@ -0,0 +1,274 @@
+import io
+import json
+import os
+import shutil
+import time
+import uuid
+import zipfile
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from PIL import UnidentifiedImageError
+
+from jobs import JobQueueFull, hide_file_task
+from stegano_formats import (
+    OUTPUT_EXTENSIONS,
+    UNSUPPORTED_FORMAT_MESSAGE,
+    CapacityError,
+    check_capacity,
+    resolve_format,
+    stego_filename,
+)
+
+# Предел числа изображений в одном пакете
+BATCH_MAX_FILES = 1000
+# Пределы размера распакованного изображения и всех изображений пакета, байт.
+# Проверяются по заголовкам ZIP до распаковки и по фактически записанному
+BATCH_MAX_FILE_BYTES = 128 << 20
+BATCH_MAX_TOTAL_BYTES = 1 << 30
+# Пауза перед новой попыткой, если очередь задач занята другими запросами, секунд
+BATCH_QUEUE_POLL = 0.1
+# Сообщение об ошибке, текст которой раскрыл бы пути на сервере
+BATCH_ITEM_ERROR = 'Failed to process image'
+# Имя манифеста внутри ZIP и имя отчёта в ответе
+MANIFEST_NAME = 'manifest.json'
+REPORT_NAME = 'results.json'
+
+
+class BatchTooLarge(ValueError):
+    """Пакет превышает пределы числа или размера изображений"""
+
+
+class BatchItem:
+    """
+    Одно изображение пакета: исходное имя, формат, путь на диске, текст
+    и сжатое сообщение (EncodedPayload после проверки ёмкости) или ошибка.
+    """
+
+    def __init__(self, name: str, fmt: str = None, source_path: str = None,
+                 text: str = None, error: str = None):
+        self.name = name
+        self.fmt = fmt
+        self.source_path = source_path
+        self.text = text
+        self.payload = None
+        self.error = error
+
+
+class _StreamBuffer(io.RawIOBase):
+    """Несдвигаемый поток для zipfile: накапливает записанное до очередной выдачи"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def pop(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def parse_manifest(raw) -> dict:
+    """
+    Манифест: JSON-объект {имя файла: текст}
+    или список [{"file": имя, "text": текст}, ...].
+    """
+    if not raw:
+        return {}
+    manifest = json.loads(raw)
+    if isinstance(manifest, list):
+        manifest = {entry['file']: entry['text'] for entry in manifest}
+    if not isinstance(manifest, dict):
+        raise ValueError("Манифест должен быть объектом или списком")
+    return {os.path.basename(name): text for name, text in manifest.items()}
+
+def _error_message(error: Exception, path: str) -> str:
+    """
+    Текст ошибки элемента для results.json. Сообщения с путями временного
+    каталога (например, repr открытого файла у PIL) заменяются общими.
+    """
+    if isinstance(error, UnidentifiedImageError):
+        return 'Cannot identify image file'
+    message = str(error)
+    directory = os.path.dirname(path)
+    if directory in message or os.path.abspath(directory) in message:
+        return BATCH_ITEM_ERROR
+    return message
+
+def _copy_limited(src, dst, limit: int) -> int:
+    """Копирует поток не больше limit байт; больше - BatchTooLarge. Возвращает размер"""
+    copied = 0
+    while True:
+        chunk = src.read(min(1 << 20, limit - copied + 1))
+        if not chunk:
+            return copied
+        copied += len(chunk)
+        if copied > limit:
+            raise BatchTooLarge(f"Изображение в архиве больше {BATCH_MAX_FILE_BYTES} байт")
+        dst.write(chunk)
+
+def collect_batch_items(batch_dir: str, uploads: list, archive=None) -> tuple:
+    """
+    Сохраняет изображения пакета в batch_dir под собственными именами
+    (имена из архива не используются как пути). Источники - загруженные
+    файлы uploads и ZIP-архив archive. Возвращает (элементы, манифест из ZIP).
+    Размеры записей ZIP проверяются до распаковки (BATCH_MAX_FILE_BYTES,
+    BATCH_MAX_TOTAL_BYTES), распаковка тоже не идёт дальше предела.
+    """
+    items = []
+    zip_manifest = None
+    total_bytes = 0
+
+    def add(name: str, copy_to) -> None:
+        nonlocal total_bytes
+        if len(items) >= BATCH_MAX_FILES:
+            raise BatchTooLarge(f"Слишком много изображений в пакете (максимум {BATCH_MAX_FILES})")
+        source_path = os.path.join(batch_dir, f"{len(items)}_source")
+        copy_to(source_path)
+        total_bytes += os.path.getsize(source_path)
+        if total_bytes > BATCH_MAX_TOTAL_BYTES:
+            raise BatchTooLarge(f"Изображения пакета больше {BATCH_MAX_TOTAL_BYTES} байт")
+        # Формат по сигнатуре файла, затем по имени
+        with open(source_path, 'rb') as f:
+            fmt = resolve_format(f, name)
+        if fmt is None:
+            os.remove(source_path)
+            items.append(BatchItem(name, error=UNSUPPORTED_FORMAT_MESSAGE))
+            return
+        items.append(BatchItem(name, fmt, source_path))
+
+    for upload in uploads:
+        if upload.filename:
+            add(os.path.basename(upload.filename), upload.save)
+
+    if archive is not None:
+        with zipfile.ZipFile(archive) as zf:
+            entries = [info for info in zf.infolist() if not info.is_dir()]
+            # Заявленные размеры проверяются до распаковки, чтобы не писать на диск zip-бомбу
+            if any(info.file_size > BATCH_MAX_FILE_BYTES for info in entries):
+                raise BatchTooLarge(f"Изображение в архиве больше {BATCH_MAX_FILE_BYTES} байт")
+            if total_bytes + sum(info.file_size for info in entries) > BATCH_MAX_TOTAL_BYTES:
+                raise BatchTooLarge(f"Изображения пакета больше {BATCH_MAX_TOTAL_BYTES} байт")
+
+            for info in entries:
+                name = os.path.basename(info.filename)
+                if name == MANIFEST_NAME:
+                    with zf.open(info) as src:
+                        zip_manifest = src.read(BATCH_MAX_FILE_BYTES)
+                    continue
+
+                def extract(path, info=info):
+                    with zf.open(info) as src, open(path, 'wb') as dst:
+                        _copy_limited(src, dst, BATCH_MAX_FILE_BYTES)
+
+                add(name, extract)
+
+    return items, zip_manifest
+
+def assign_texts(items: list, text: str, manifest: dict, depth: int = 1, compression: str = None) -> None:
+    """
+    Текст из манифеста важнее общего; без текста элемент получает ошибку.
+    Ёмкость проверяется по заголовку файла, чтобы не отдавать процессам
+    изображения, в которые текст заведомо не поместится; сжатое при
+    проверке сообщение и уходит процессу.
+    """
+    for item in items:
+        if item.error:
+            continue
+        item.text = manifest.get(item.name, text)
+        if not item.text:
+            item.error = 'No text provided'
+            continue
+        try:
+            with open(item.source_path, 'rb') as f:
+                item.payload = check_capacity(item.fmt, f, item.text, depth, compression)
+        except (CapacityError, OSError) as e:
+            item.error = _error_message(e, item.source_path)
+
+def _unique_name(name: str, used: set) -> str:
+    """Имя в архиве ответа без повторов: к повторам добавляется номер"""
+    stem, ext = os.path.splitext(name)
+    candidate, counter = name, 1
+    while candidate in used:
+        candidate = f"{stem}_{counter}{ext}"
+        counter += 1
+    used.add(candidate)
+    return candidate
+
+def iter_batch_zip(job_manager, batch_dir: str, items: list, seed_key: str,
+                   profile: str, latency_budget: float, depth: int = 1):
+    """
+    Раздаёт изображения по процессам пула и отдаёт ZIP с результатами
+    кусками по мере готовности (в порядке завершения, а не загрузки).
+    Каждое изображение занимает место в очереди задач JobManager: новые
+    ставятся, пока есть места, остальные ждут завершения уже поставленных.
+    Ошибка одного изображения попадает в results.json и не прерывает пакет.
+    По завершении или обрыве соединения временный каталог удаляется.
+    """
+    buffer = _StreamBuffer()
+    report = []
+    used_names = set()
+    pending = deque()
+    futures = {}
+
+    for index, item in enumerate(items):
+        if item.error:
+            report.append({'file': item.name, 'status': 'error', 'error': item.error})
+        else:
+            pending.append((index, item))
+
+    try:
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as zf:
+            while pending or futures:
+                while pending:
+                    index, item = pending[0]
+                    output_path = os.path.join(batch_dir, f"{index}_stego{OUTPUT_EXTENSIONS[item.fmt]}")
+                    try:
+                        future = job_manager.submit_task(hide_file_task, item.fmt, item.source_path,
+                                                         output_path, item.payload, seed_key, profile,
+                                                         latency_budget, depth)
+                    except JobQueueFull:
+                        break
+                    pending.popleft()
+                    futures[future] = item
+
+                if not futures:
+                    # Очередь заняли другие запросы - ждём, пока освободится место
+                    time.sleep(BATCH_QUEUE_POLL)
+                    continue
+
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = futures.pop(future)
+                    try:
+                        output_path = job_manager.task_result(future)
+                    except Exception as e:
+                        report.append({'file': item.name, 'status': 'error',
+                                       'error': _error_message(e, item.source_path)})
+                        continue
+
+                    # Изображения уже сжаты, поэтому в архиве они хранятся без сжатия
+                    arcname = _unique_name(stego_filename(item.name, item.fmt), used_names)
+                    zf.write(output_path, arcname)
+                    os.remove(output_path)
+                    report.append({'file': item.name, 'status': 'ok', 'stego_file': arcname})
+                yield buffer.pop()
+
+            zf.writestr(REPORT_NAME, json.dumps(report, ensure_ascii=False, indent=2))
+        yield buffer.pop()
+
+    finally:
+        for future in futures:
+            future.cancel()
+        shutil.rmtree(batch_dir, ignore_errors=True)
+
+def new_batch_dir(root: str) -> str:
+    batch_dir = os.path.join(root, f"batch_{uuid.uuid4().hex}")
+    os.makedirs(batch_dir)
+    return batch_dir
@@ -0,0 +1,130 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Профили кодировщиков: имя -> параметры сохранения для каждого формата.
+# JPEG всегда сохраняется с quality=100 и 4:4:4 (иначе знаки DCT-коэффициентов
+# не переживут пересжатие), профиль меняет только оптимизацию Хаффмана
+# и progressive.
+ENCODER_PROFILES = {
+    'png': {
+        'fastest': {'compress_level': 1},
+        'balanced': {'compress_level': 6},
+        'smallest': {'compress_level': 9},
+    },
+    'webp': {
+        'fastest': {'lossless': True, 'method': 0, 'quality': 0},
+        'balanced': {'lossless': True, 'method': 4, 'quality': 80},
+        'smallest': {'lossless': True, 'method': 6, 'quality': 100},
+    },
+    'jpg': {
+        'fastest': {'optimize': False},
+        'balanced': {'optimize': True},
+        'smallest': {'optimize': True, 'progressive': True},
+    },
+}
+
+PROFILE_NAMES = ('fastest', 'balanced', 'smallest')
+DEFAULT_PROFILE = 'balanced'
+AUTO_PROFILE = 'auto'
+
+# Начальная оценка времени кодирования, секунд на мегапиксель,
+# пока не накоплена история замеров
+DEFAULT_SECONDS_PER_MEGAPIXEL = {
+    'png': {'fastest': 0.07, 'balanced': 0.2, 'smallest': 0.4},
+    'webp': {'fastest': 0.04, 'balanced': 0.4, 'smallest': 2.0},
+    'jpg': {'fastest': 0.01, 'balanced': 0.025, 'smallest': 0.05},
+}
+
+# Вес нового замера в экспоненциальном среднем
+TIMING_SMOOTHING = 0.2
+
+
+class EncoderTimings:
+    """
+    История времени кодирования: экспоненциальное среднее секунд
+    на мегапиксель для каждой пары (формат, профиль).
+    Потокобезопасна - замеры пишут параллельные запросы.
+    Замеры процесса-исполнителя собираются collect и переносятся
+    в историю родительского процесса через merge.
+    """
+
+    def __init__(self, smoothing: float = TIMING_SMOOTHING):
+        self.smoothing = smoothing
+        self._rates = {}
+        self._samples = None
+        self._lock = threading.Lock()
+
+    def record(self, fmt: str, profile: str, pixels: int, seconds: float) -> None:
+        rate = seconds / max(pixels / 1e6, 1e-3)
+        with self._lock:
+            previous = self._rates.get((fmt, profile))
+            if previous is None:
+                self._rates[(fmt, profile)] = rate
+            else:
+                self._rates[(fmt, profile)] = previous + self.smoothing * (rate - previous)
+            if self._samples is not None:
+                self._samples.append((fmt, profile, pixels, seconds))
+
+    @contextmanager
+    def collect(self):
+        """Список замеров (fmt, profile, pixels, seconds), сделанных внутри блока"""
+        samples = []
+        with self._lock:
+            self._samples = samples
+        try:
+            yield samples
+        finally:
+            with self._lock:
+                self._samples = None
+
+    def merge(self, samples: list) -> None:
+        """Добавляет в историю замеры, сделанные в другом процессе"""
+        for sample in samples:
+            self.record(*sample)
+
+    def estimate(self, fmt: str, profile: str, pixels: int) -> float:
+        """Ожидаемое время кодирования в секундах"""
+        with self._lock:
+            rate = self._rates.get((fmt, profile))
+        if rate is None:
+            rate = DEFAULT_SECONDS_PER_MEGAPIXEL[fmt][profile]
+        return rate * pixels / 1e6
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {f'{fmt}/{profile}': rate for (fmt, profile), rate in self._rates.items()}
+
+
+# Общая история процесса
+ENCODER_TIMINGS = EncoderTimings()
+
+
+def choose_profile(fmt: str, pixels: int, latency_budget: float = None,
+                   timings: EncoderTimings = ENCODER_TIMINGS) -> str:
+    """
+    Выбирает самый сильный профиль, который укладывается в бюджет (секунды).
+    Без бюджета - DEFAULT_PROFILE, если не укладывается ни один - 'fastest'.
+    """
+    if latency_budget is None:
+        return DEFAULT_PROFILE
+
+    for profile in reversed(PROFILE_NAMES):
+        if timings.estimate(fmt, profile, pixels) <= latency_budget:
+            return profile
+    return PROFILE_NAMES[0]
+
+def resolve_profile(fmt: str, profile: str, pixels: int, latency_budget: float = None) -> tuple:
+    """Возвращает (имя профиля, параметры сохранения); 'auto' выбирается по бюджету"""
+    if profile == AUTO_PROFILE:
+        profile = choose_profile(fmt, pixels, latency_budget)
+    if profile not in ENCODER_PROFILES[fmt]:
+        raise ValueError(f"Неизвестный профиль кодировщика: {profile}")
+    return profile, dict(ENCODER_PROFILES[fmt][profile])
+
+@contextmanager
+def timed_encode(fmt: str, profile: str, pixels: int, timings: EncoderTimings = ENCODER_TIMINGS):
+    """Замеряет кодирование и добавляет его в историю"""
+    start = time.perf_counter()
+    yield
+    timings.record(fmt, profile, pixels, time.perf_counter() - start)
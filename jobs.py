@@ -0,0 +1,226 @@
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from encoder_profiles import ENCODER_TIMINGS
+from stegano_formats import extract_image_text, hide_image_to_file
+
+# Число процессов-исполнителей и предел задач в очереди
+JOB_WORKERS = os.cpu_count() or 1
+JOB_QUEUE_LIMIT = 64
+# Сколько секунд хранится завершённая задача и её результат
+JOB_TTL = 3600
+
+JOB_STATUSES = ('queued', 'running', 'done', 'error')
+
+# Результат задачи вместе с замерами кодирования из процесса-исполнителя
+# (EncoderTimings.collect); JobManager переносит их в историю своего процесса
+TaskResult = namedtuple('TaskResult', ['value', 'timings'])
+
+
+class JobQueueFull(RuntimeError):
+    """Очередь задач заполнена"""
+
+
+# Очередь прогресса в процессе-исполнителе (задаётся инициализатором пула)
+_progress_queue = None
+
+
+def _init_worker(progress_queue) -> None:
+    global _progress_queue
+    _progress_queue = progress_queue
+
+def report_progress(job_id: str, progress: float) -> None:
+    """Сообщает прогресс задачи (0..1) из процесса-исполнителя"""
+    if _progress_queue is not None:
+        _progress_queue.put((job_id, progress))
+
+def hide_file_task(fmt: str, source_path: str, output_path: str, text: str,
+                   seed_key: str, profile: str, latency_budget: float, depth: int = 1,
+                   progress=None) -> TaskResult:
+    """
+    Встраивание в процессе-исполнителе: читает загрузку с диска, пишет
+    результат в output_path. Возвращает TaskResult(output_path, замеры).
+    """
+    try:
+        with open(source_path, 'rb') as f, ENCODER_TIMINGS.collect() as timings:
+            hide_image_to_file(fmt, f, output_path, text, seed_key, profile, latency_budget, depth=depth,
+                               progress=progress)
+    finally:
+        os.remove(source_path)
+    return TaskResult(output_path, timings)
+
+def run_hide_job(job_id: str, fmt: str, source_path: str, output_path: str, text: str,
+                 seed_key: str, profile: str, latency_budget: float, depth: int = 1) -> TaskResult:
+    """Задача встраивания для JobManager: прогресс по этапам hide_image_to_file"""
+    report_progress(job_id, 0.0)
+    return hide_file_task(fmt, source_path, output_path, text, seed_key, profile, latency_budget, depth,
+                          lambda fraction: report_progress(job_id, fraction))
+
+def run_extract_job(job_id: str, fmt: str, source_path: str, seed_key: str) -> str:
+    """Задача извлечения: возвращает найденный текст (один этап - только статус running)"""
+    report_progress(job_id, 0.0)
+    try:
+        with open(source_path, 'rb') as f:
+            return extract_image_text(fmt, f, seed_key)
+    finally:
+        os.remove(source_path)
+
+
+class JobManager:
+    """
+    Асинхронные задачи встраивания и извлечения в пуле процессов.
+
+    Запрос только кладёт задачу в ProcessPoolExecutor и сразу получает
+    её идентификатор; тяжёлая работа идёт в других процессах, без GIL
+    веб-сервера. Исполнители сообщают прогресс через общую очередь,
+    которую разбирает фоновый поток. Пул создаётся при первой задаче.
+    Замеры кодирования из результатов задач (TaskResult) добавляются
+    в timings, чтобы выбор профиля по бюджету учитывал и их.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, queue_limit: int = JOB_QUEUE_LIMIT, ttl: float = JOB_TTL,
+                 timings=ENCODER_TIMINGS):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.ttl = ttl
+        self.timings = timings
+        self._jobs = {}
+        # Незавершённые задачи submit_task (без записи в _jobs)
+        self._tasks = 0
+        self._lock = threading.Lock()
+        # Отдельная блокировка: пул создаётся вне _lock (submit держит его недолго)
+        self._executor_lock = threading.Lock()
+        self._executor = None
+        self._progress = None
+
+    def _ensure_executor(self) -> ProcessPoolExecutor:
+        executor = self._executor
+        if executor is not None:
+            return executor
+        with self._executor_lock:
+            # Одновременные первые запросы не должны создать по своему пулу
+            if self._executor is None:
+                context = multiprocessing.get_context()
+                self._progress = context.Queue()
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=context,
+                                                     initializer=_init_worker, initargs=(self._progress,))
+                threading.Thread(target=self._listen, args=(self._progress,), daemon=True).start()
+            return self._executor
+
+    def _listen(self, progress_queue) -> None:
+        while True:
+            job_id, progress = progress_queue.get()
+            with self._lock:
+                job = self._jobs.get(job_id)
+                # Сообщение могло прийти уже после завершения задачи
+                if job is not None and job['status'] in ('queued', 'running'):
+                    job['status'] = 'running'
+                    job['progress'] = max(job['progress'], progress)
+
+    def _evict_expired(self) -> None:
+        """Удаляет завершённые задачи старше ttl вместе с файлами результатов"""
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job['finished'] is not None and now - job['finished'] > self.ttl:
+                if job['kind'] == 'hide' and job['result'] and os.path.exists(job['result']):
+                    os.remove(job['result'])
+                del self._jobs[job_id]
+
+    def _reserve(self) -> None:
+        """Проверяет место в очереди (задачи и задачи submit_task); вызывается под блокировкой"""
+        self._evict_expired()
+        active = sum(job['status'] in ('queued', 'running') for job in self._jobs.values())
+        if active + self._tasks >= self.queue_limit:
+            raise JobQueueFull("Очередь задач заполнена")
+
+    def submit(self, kind: str, fn, *args, **meta) -> str:
+        """
+        Ставит fn(job_id, *args) в пул и возвращает идентификатор задачи.
+        meta сохраняется в задаче как есть (например, имя файла результата).
+        """
+        with self._lock:
+            self._reserve()
+
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {
+                'id': job_id,
+                'kind': kind,
+                'status': 'queued',
+                'progress': 0.0,
+                'result': None,
+                'error': None,
+                'created': time.time(),
+                'finished': None,
+                **meta,
+            }
+
+        future = self._ensure_executor().submit(fn, job_id, *args)
+        future.add_done_callback(lambda done: self._finish(job_id, done))
+        return job_id
+
+    def executor(self) -> ProcessPoolExecutor:
+        """Общий пул процессов (например, для встраивания через разделяемую память)"""
+        return self._ensure_executor()
+
+    def submit_task(self, fn, *args):
+        """
+        Выполняет fn(*args) в общем пуле без регистрации задачи, возвращает Future.
+        Занимает место в очереди до завершения; нет места - JobQueueFull.
+        """
+        with self._lock:
+            self._reserve()
+            self._tasks += 1
+        try:
+            future = self._ensure_executor().submit(fn, *args)
+        except Exception:
+            self._task_done(None)
+            raise
+        future.add_done_callback(self._task_done)
+        return future
+
+    def _task_done(self, _future) -> None:
+        with self._lock:
+            self._tasks -= 1
+
+    def _unwrap(self, result):
+        """Значение результата; замеры из TaskResult переносятся в timings"""
+        if isinstance(result, TaskResult):
+            self.timings.merge(result.timings)
+            return result.value
+        return result
+
+    def task_result(self, future):
+        """Результат задачи submit_task (ждёт её завершения), как Future.result"""
+        return self._unwrap(future.result())
+
+    def _finish(self, job_id: str, future) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            error = future.exception()
+            if error is None:
+                job['status'] = 'done'
+                job['result'] = self._unwrap(future.result())
+            else:
+                job['status'] = 'error'
+                job['error'] = str(error)
+            job['progress'] = 1.0
+            job['finished'] = time.time()
+
+    def get(self, job_id: str):
+        """Копия состояния задачи или None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def shutdown(self) -> None:
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
@@ -0,0 +1,798 @@
+import heapq
+import math
+import struct
+from collections import Counter
+
+import numpy as np
+
+
+class UnsupportedJpeg(ValueError):
+    """JPEG нельзя обработать в области коэффициентов (progressive, CMYK и т.п.)"""
+
+
+class HuffmanTableFull(UnsupportedJpeg):
+    """В таблице Хаффмана нет свободных кодов для новых символов"""
+
+
+def _zigzag_order() -> list:
+    """Порядок зигзага: индекс в зигзаге -> (строка, столбец)"""
+    cells = [(r, c) for r in range(8) for c in range(8)]
+    return sorted(cells, key=lambda rc: (rc[0] + rc[1], rc[0] if (rc[0] + rc[1]) % 2 else -rc[0]))
+
+ZIGZAG = _zigzag_order()
+ZIGZAG_INDEX = {rc: k for k, rc in enumerate(ZIGZAG)}
+
+# Маркеры без поля длины
+_STANDALONE_MARKERS = {0x01, 0xD8, 0xD9} | set(range(0xD0, 0xD8))
+
+_EOB = 0x00
+_ZRL = 0xF0
+
+# Сколько MCU после последнего целевого блока можно дочитать, чтобы точно
+# найти конец данных интервала; дальше хвост переносится со старым выравниванием
+TAIL_DECODE_MCUS = 64
+
+
+class HuffmanTable:
+    """
+    Таблица Хаффмана из сегмента DHT.
+
+    codes - символ -> (код, длина) для кодирования,
+    lookup - 16-битное окно -> (символ << 5) | длина для декодирования
+    (-1 для кодов, которых нет в таблице).
+    """
+
+    def __init__(self, counts: bytes, symbols: bytes):
+        self.counts = list(counts)
+        self.symbols = list(symbols)
+        self.extended = False
+        self.codes = {}
+        lookup = np.full(1 << 16, -1, dtype=np.int32)
+
+        code = 0
+        symbol_idx = 0
+        for length in range(1, 17):
+            for _ in range(counts[length - 1]):
+                symbol = symbols[symbol_idx]
+                symbol_idx += 1
+                self.codes[symbol] = (code, length)
+                shift = 16 - length
+                lookup[code << shift:(code + 1) << shift] = (symbol << 5) | length
+                code += 1
+            code <<= 1
+
+        self.lookup = lookup.tolist()
+
+    def extend(self, symbols: list) -> None:
+        """
+        Добавляет символы кодами длины 16, не меняя существующих кодов.
+
+        Канонические коды занимают пространство кодов подряд с нуля,
+        поэтому следующий свободный 16-битный код - сразу за последним.
+        Код из одних единиц зарезервирован. Нет места - HuffmanTableFull
+        (так у оптимизированных таблиц, где заняты все коды).
+        """
+        used = sum(count << (16 - length) for length, count in enumerate(self.counts, 1))
+        if used + len(symbols) > 0xFFFF or self.counts[15] + len(symbols) > 0xFF:
+            raise HuffmanTableFull("В таблице Хаффмана нет места для новых символов")
+
+        for code, symbol in enumerate(symbols, used):
+            self.codes[symbol] = (code, 16)
+            self.lookup[code] = (symbol << 5) | 16
+        self.counts[15] += len(symbols)
+        self.symbols.extend(symbols)
+        self.extended = True
+
+    def segment(self, table_class: int, table_id: int) -> bytes:
+        """Сегмент DHT с этой таблицей"""
+        body = bytes([(table_class << 4) | table_id]) + bytes(self.counts) + bytes(self.symbols)
+        return b'\xFF\xC4' + struct.pack('>H', len(body) + 2) + body
+
+    @classmethod
+    def optimal(cls, freqs: Counter) -> 'HuffmanTable':
+        """
+        Оптимальная таблица с кодами не длиннее 16 бит по частотам символов
+        (JPEG, приложение K.2). Фиктивный символ 256 с частотой 1 занимает
+        код из одних единиц и затем отбрасывается.
+        """
+        # При равных частотах первым сливается больший символ, поэтому
+        # фиктивный оказывается последним среди самых длинных кодов
+        heap = [(count, -symbol, [symbol]) for symbol, count in freqs.items()] + [(1, -256, [256])]
+        heapq.heapify(heap)
+        sizes = dict.fromkeys(list(freqs) + [256], 0)
+        while len(heap) > 1:
+            count1, key1, group1 = heapq.heappop(heap)
+            count2, key2, group2 = heapq.heappop(heap)
+            for symbol in group1 + group2:
+                sizes[symbol] += 1
+            heapq.heappush(heap, (count1 + count2, min(key1, key2), group1 + group2))
+
+        bits = [0] * (max(sizes.values()) + 1)
+        for size in sizes.values():
+            bits[size] += 1
+        # Укорачиваем коды длиннее 16 бит
+        for i in range(len(bits) - 1, 16, -1):
+            while bits[i] > 0:
+                j = i - 2
+                while bits[j] == 0:
+                    j -= 1
+                bits[i] -= 2
+                bits[i - 1] += 1
+                bits[j + 1] += 2
+                bits[j] -= 1
+        bits = (bits + [0] * 17)[:17]
+        bits[max(i for i in range(17) if bits[i])] -= 1
+
+        symbols = sorted(freqs, key=lambda symbol: (sizes[symbol], symbol))
+        return cls(bytes(bits[1:]), bytes(symbols))
+
+
+def parse_jpeg(data: bytes) -> dict:
+    """
+    Разбирает сегменты JPEG до скана с яркостной компонентой.
+
+    Возвращает словарь с таблицами квантования и Хаффмана, параметрами кадра,
+    интервалом рестарта и границами энтропийно-кодированных данных скана.
+    Поддерживается только последовательный JPEG с кодами Хаффмана и 8-битной
+    точностью (SOF0/SOF1).
+    """
+    if data[:2] != b'\xFF\xD8':
+        raise UnsupportedJpeg("Нет маркера SOI")
+
+    quant = {}
+    huffman = {}
+    frame = None
+    restart_interval = 0
+    adobe_transform = None
+    pos = 2
+
+    while pos < len(data):
+        if data[pos] != 0xFF:
+            raise UnsupportedJpeg("Ожидался маркер")
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # Байты-заполнители перед маркером
+            pos += 1
+            continue
+        if marker in _STANDALONE_MARKERS:
+            if marker == 0xD9:
+                break
+            pos += 2
+            continue
+
+        length = struct.unpack('>H', data[pos + 2:pos + 4])[0]
+        segment = data[pos + 4:pos + 2 + length]
+        segment_end = pos + 2 + length
+
+        if marker == 0xDB:
+            offset = 0
+            while offset < len(segment):
+                precision, table_id = segment[offset] >> 4, segment[offset] & 0x0F
+                size = 128 if precision else 64
+                fmt = '>64H' if precision else '64B'
+                quant[table_id] = list(struct.unpack(fmt, segment[offset + 1:offset + 1 + size]))
+                offset += 1 + size
+
+        elif marker == 0xC4:
+            offset = 0
+            while offset < len(segment):
+                table_class, table_id = segment[offset] >> 4, segment[offset] & 0x0F
+                counts = segment[offset + 1:offset + 17]
+                total = sum(counts)
+                symbols = segment[offset + 17:offset + 17 + total]
+                huffman[(table_class, table_id)] = HuffmanTable(counts, symbols)
+                offset += 17 + total
+
+        elif marker in (0xC0, 0xC1):
+            precision, height, width, count = struct.unpack('>BHHB', segment[:6])
+            if precision != 8:
+                raise UnsupportedJpeg("Поддерживается только 8-битная точность")
+            components = []
+            for i in range(count):
+                comp_id, sampling, table_id = segment[6 + i * 3:9 + i * 3]
+                components.append({'id': comp_id, 'h': sampling >> 4, 'v': sampling & 0x0F, 'tq': table_id})
+            frame = {'width': width, 'height': height, 'components': components}
+
+        elif 0xC2 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            raise UnsupportedJpeg("Поддерживается только baseline JPEG")
+
+        elif marker == 0xDD:
+            restart_interval = struct.unpack('>H', segment[:2])[0]
+
+        elif marker == 0xEE and segment[:5] == b'Adobe':
+            adobe_transform = segment[11]
+
+        elif marker == 0xDA:
+            if frame is None:
+                raise UnsupportedJpeg("SOS до SOF")
+            count = segment[0]
+            scan_components = []
+            for i in range(count):
+                comp_id, tables = segment[1 + i * 2:3 + i * 2]
+                index = next(k for k, c in enumerate(frame['components']) if c['id'] == comp_id)
+                scan_components.append({'index': index, 'td': tables >> 4, 'ta': tables & 0x0F})
+            scan_start = segment_end
+            scan_end, restarts = _find_scan_end(data, scan_start)
+
+            if any(c['index'] == 0 for c in scan_components):
+                ss, se, approx = segment[1 + count * 2:4 + count * 2]
+                if ss != 0 or se != 63 or approx != 0:
+                    raise UnsupportedJpeg("Неполный спектр в скане")
+                return {
+                    'sos_start': pos,
+                    'quant': quant,
+                    'huffman': dict(huffman),
+                    'frame': frame,
+                    'restart_interval': restart_interval,
+                    'adobe_transform': adobe_transform,
+                    'scan_components': scan_components,
+                    'scan_start': scan_start,
+                    'scan_end': scan_end,
+                    'restarts': restarts,
+                }
+            pos = scan_end
+            continue
+
+        pos = segment_end
+
+    raise UnsupportedJpeg("Скан с яркостной компонентой не найден")
+
+def _find_scan_end(data: bytes, scan_start: int) -> tuple:
+    """
+    Находит конец энтропийно-кодированных данных и позиции маркеров RSTn.
+    Байт 0xFF внутри данных всегда экранирован нулём, поэтому ищем 0xFF,
+    за которым идёт не 0x00.
+    """
+    arr = np.frombuffer(data, dtype=np.uint8, offset=scan_start)
+    ff = np.flatnonzero(arr[:-1] == 0xFF)
+    following = arr[ff + 1]
+    is_restart = (following >= 0xD0) & (following <= 0xD7)
+    is_marker = (following != 0x00) & ~is_restart
+
+    markers = ff[is_marker]
+    if not markers.size:
+        raise UnsupportedJpeg("Не найден конец скана")
+    scan_end = int(markers[0])
+    restarts = ff[is_restart]
+    restarts = restarts[restarts < scan_end]
+    return scan_start + scan_end, (restarts + scan_start).tolist()
+
+def _unstuff(raw: bytes) -> np.ndarray:
+    """Убирает нулевые байты после 0xFF (byte stuffing)"""
+    arr = np.frombuffer(raw, dtype=np.uint8)
+    stuffed = np.flatnonzero((arr[:-1] == 0xFF) & (arr[1:] == 0x00)) + 1
+    return np.delete(arr, stuffed)
+
+def _stuff(arr: np.ndarray) -> bytes:
+    """Добавляет нулевой байт после каждого 0xFF"""
+    ff = np.flatnonzero(arr == 0xFF)
+    return np.insert(arr, ff + 1, 0).tobytes()
+
+def _mcu_layout(info: dict) -> tuple:
+    """
+    Раскладка MCU скана: (число MCU по горизонтали, по вертикали,
+    список блоков одного MCU в виде (номер в скане, компонента, dy, dx)).
+    """
+    frame = info['frame']
+    components = frame['components']
+    scan = info['scan_components']
+
+    if len(scan) == 1:
+        # Неинтерливный скан: MCU - один блок компоненты
+        comp = components[scan[0]['index']]
+        h_max = max(c['h'] for c in components)
+        v_max = max(c['v'] for c in components)
+        comp_width = math.ceil(frame['width'] * comp['h'] / h_max)
+        comp_height = math.ceil(frame['height'] * comp['v'] / v_max)
+        return math.ceil(comp_width / 8), math.ceil(comp_height / 8), [(0, scan[0]['index'], 0, 0)], (1, 1)
+
+    h_max = max(c['h'] for c in components)
+    v_max = max(c['v'] for c in components)
+    mcus_x = math.ceil(frame['width'] / (8 * h_max))
+    mcus_y = math.ceil(frame['height'] / (8 * v_max))
+
+    blocks = []
+    for scan_idx, sc in enumerate(scan):
+        comp = components[sc['index']]
+        for dy in range(comp['v']):
+            for dx in range(comp['h']):
+                blocks.append((scan_idx, sc['index'], dy, dx))
+    luma = components[0]
+    return mcus_x, mcus_y, blocks, (luma['v'], luma['h'])
+
+def _check_luma_layout(info: dict) -> None:
+    """Блоки яркости должны совпадать с сеткой 8x8 пикселей изображения"""
+    components = info['frame']['components']
+    if len(components) not in (1, 3):
+        raise UnsupportedJpeg("Поддерживаются только Grayscale и YCbCr")
+    if info['adobe_transform'] == 0 and len(components) == 3:
+        raise UnsupportedJpeg("RGB JPEG без преобразования в YCbCr")
+    if len(components) == 3 and [c['id'] for c in components] == [ord('R'), ord('G'), ord('B')]:
+        raise UnsupportedJpeg("RGB JPEG без преобразования в YCbCr")
+    luma = components[0]
+    if luma['h'] != max(c['h'] for c in components) or luma['v'] != max(c['v'] for c in components):
+        raise UnsupportedJpeg("Яркость прорежена сильнее цветности")
+
+
+class _BitReader:
+    """Чтение битов из разэкранированных данных одного интервала рестарта"""
+
+    def __init__(self, data: np.ndarray):
+        # Запас нулей, чтобы окно из трёх байт не выходило за границу
+        self.buf = data.tobytes() + b'\x00' * 4
+        self.size = len(data) * 8
+        self.pos = 0
+
+    def decode(self, lookup: list) -> int:
+        buf, pos = self.buf, self.pos
+        i = pos >> 3
+        window = ((buf[i] << 16) | (buf[i + 1] << 8) | buf[i + 2]) >> (8 - (pos & 7)) & 0xFFFF
+        entry = lookup[window]
+        if entry < 0:
+            raise UnsupportedJpeg("Повреждённые данные Хаффмана")
+        self.pos = pos + (entry & 31)
+        return entry >> 5
+
+    def receive(self, length: int) -> int:
+        buf, pos = self.buf, self.pos
+        i = pos >> 3
+        window = (buf[i] << 24) | (buf[i + 1] << 16) | (buf[i + 2] << 8) | buf[i + 3]
+        self.pos = pos + length
+        return (window >> (32 - (pos & 7) - length)) & ((1 << length) - 1)
+
+    def peek(self, pos: int, length: int) -> int:
+        """length битов, начиная с позиции pos (позиция чтения не меняется)"""
+        first, last = pos >> 3, (pos + length + 7) >> 3
+        window = int.from_bytes(self.buf[first:last], 'big')
+        return (window >> ((last << 3) - pos - length)) & ((1 << length) - 1)
+
+
+class _BitWriter:
+    """Запись битов в энтропийные данные с экранированием 0xFF"""
+
+    def __init__(self):
+        self.out = bytearray()
+        self.acc = 0
+        self.nbits = 0
+
+    def write(self, value: int, length: int) -> None:
+        acc = (self.acc << length) | value
+        nbits = self.nbits + length
+        while nbits >= 8:
+            nbits -= 8
+            byte = (acc >> nbits) & 0xFF
+            self.out.append(byte)
+            if byte == 0xFF:
+                self.out.append(0)
+        self.acc = acc & ((1 << nbits) - 1)
+        self.nbits = nbits
+
+    def flush(self) -> bytes:
+        """Дополняет последний байт единицами и возвращает данные"""
+        if self.nbits:
+            self.write((1 << (8 - self.nbits)) - 1, 8 - self.nbits)
+        return bytes(self.out)
+
+
+def _decode_block(reader: _BitReader, dc_table: HuffmanTable, ac_table: HuffmanTable, keep: bool):
+    """
+    Декодирует один блок. DC не восстанавливается (он закодирован разностно и
+    не меняется), возвращается позиция конца DC-части и AC-коэффициенты
+    в порядке зигзага, если keep=True.
+    """
+    category = reader.decode(dc_table.lookup)
+    reader.pos += category
+    dc_end = reader.pos
+
+    coefs = [0] * 64 if keep else None
+    ac_lookup = ac_table.lookup
+    k = 1
+    while k < 64:
+        symbol = reader.decode(ac_lookup)
+        run, size = symbol >> 4, symbol & 0x0F
+        if size == 0:
+            if run == 15:
+                k += 16
+                continue
+            break
+        k += run
+        if keep:
+            value = reader.receive(size)
+            if value < (1 << (size - 1)):
+                value -= (1 << size) - 1
+            coefs[k] = value
+        else:
+            reader.pos += size
+        k += 1
+
+    return dc_end, coefs
+
+def _ac_symbols(coefs: list) -> list:
+    """Символы Хаффмана AC-части блока по порядку (с повторами)"""
+    symbols = []
+    run = 0
+    for k in range(1, 64):
+        value = coefs[k]
+        if value == 0:
+            run += 1
+            continue
+        while run > 15:
+            symbols.append(_ZRL)
+            run -= 16
+        symbols.append((run << 4) | abs(value).bit_length())
+        run = 0
+    if run:
+        symbols.append(_EOB)
+    return symbols
+
+def _write_ac(writer: _BitWriter, coefs: list, codes: dict) -> None:
+    """Записывает AC-часть блока кодами codes"""
+    run = 0
+    for k in range(1, 64):
+        value = coefs[k]
+        if value == 0:
+            run += 1
+            continue
+        while run > 15:
+            writer.write(*codes[_ZRL])
+            run -= 16
+        size = abs(value).bit_length()
+        writer.write(*codes[(run << 4) | size])
+        writer.write(value if value > 0 else value + (1 << size) - 1, size)
+        run = 0
+    if run:
+        writer.write(*codes[_EOB])
+
+def _encode_ac(coefs: list, ac_table: HuffmanTable) -> np.ndarray:
+    """
+    Кодирует AC-коэффициенты блока исходной таблицей Хаффмана.
+    Бросает KeyError, если нужного символа в таблице нет.
+    """
+    codes = ac_table.codes
+    acc = 0
+    nbits = 0
+
+    last = max((k for k in range(1, 64) if coefs[k]), default=0)
+    run = 0
+    for k in range(1, last + 1):
+        value = coefs[k]
+        if value == 0:
+            run += 1
+            continue
+        while run > 15:
+            code, length = codes[_ZRL]
+            acc = (acc << length) | code
+            nbits += length
+            run -= 16
+        size = abs(value).bit_length()
+        code, length = codes[(run << 4) | size]
+        if value < 0:
+            value += (1 << size) - 1
+        acc = (((acc << length) | code) << size) | value
+        nbits += length + size
+        run = 0
+
+    if last < 63:
+        code, length = codes[_EOB]
+        acc = (acc << length) | code
+        nbits += length
+
+    return _int_to_bits(acc, nbits)
+
+def _int_to_bits(value: int, nbits: int) -> np.ndarray:
+    """Число -> массив из nbits битов (старший первым)"""
+    if nbits == 0:
+        return np.zeros(0, dtype=np.uint8)
+    nbytes = (nbits + 7) // 8
+    bits = np.unpackbits(np.frombuffer(value.to_bytes(nbytes, 'big'), dtype=np.uint8))
+    return bits[nbytes * 8 - nbits:]
+
+def _candidate_values(sign: int, base: int) -> list:
+    """Значения коэффициента для знака sign: base, затем минимальные значения старших категорий"""
+    values = [base]
+    for category in range(base.bit_length() + 1, 11):
+        values.append(1 << (category - 1))
+    return [sign * v for v in values]
+
+def _reencode_block(coefs: list, zz: int, sign: int, base: int, ac_table: HuffmanTable):
+    """
+    Ставит коэффициент zz со знаком sign и модулем не меньше base.
+    Возвращает биты AC-части или None, если блок менять не нужно.
+    Если ни одно значение не кодируется таблицей (оптимизированные таблицы
+    содержат только встречавшиеся символы), недостающие символы
+    добавляются в таблицу (HuffmanTable.extend).
+    """
+    current = coefs[zz]
+    if current * sign > 0 and abs(current) >= base:
+        return None
+
+    for value in _candidate_values(sign, base):
+        coefs[zz] = value
+        try:
+            return _encode_ac(coefs, ac_table)
+        except KeyError:
+            continue
+
+    coefs[zz] = sign * base
+    ac_table.extend(sorted(set(_ac_symbols(coefs)) - ac_table.codes.keys()))
+    return _encode_ac(coefs, ac_table)
+
+def embed_block_signs(data: bytes, bits: np.ndarray, coef_pos: tuple, magnitude: float) -> bytes:
+    """
+    Встраивает биты в знак коэффициента coef_pos первых len(bits) блоков
+    яркости (в порядке строк пикселей), меняя только квантованные коэффициенты.
+
+    Декодируются лишь MCU до последнего целевого блока; в несущих блоках
+    перекодируется AC-часть исходными таблицами Хаффмана, остальные блоки
+    и весь остаток скана копируются побитно. Таблицы квантования,
+    прореживание цветности и прочие сегменты файла не меняются.
+    Если в таблицах нет свободных кодов (оптимизированные таблицы),
+    скан перекодируется целиком с новыми оптимальными таблицами.
+    """
+    try:
+        try:
+            return _embed_block_signs(data, bits, coef_pos, magnitude)
+        except HuffmanTableFull:
+            return _embed_block_signs_rebuilt(data, bits, coef_pos, magnitude)
+    except (IndexError, KeyError, StopIteration, struct.error) as e:
+        raise UnsupportedJpeg(f"Повреждённый или нестандартный JPEG: {e}")
+
+def _sign_targets(info: dict, bits: np.ndarray, coef_pos: tuple, magnitude: float) -> tuple:
+    """
+    (индекс coef_pos в зигзаге, минимальный модуль квантованного коэффициента,
+    {(строка, столбец) блока яркости: знак, который нужно записать}).
+    """
+    frame = info['frame']
+    blocks_w = frame['width'] // 8
+    blocks_h = frame['height'] // 8
+    if len(bits) > blocks_w * blocks_h:
+        raise ValueError(f"Текст слишком длинный. Ёмкость: {blocks_w * blocks_h} бит, нужно {len(bits)}")
+
+    luma = frame['components'][0]
+    zz = ZIGZAG_INDEX[coef_pos]
+    base = max(1, math.ceil(magnitude / info['quant'][luma['tq']][zz]))
+
+    targets = {}
+    for i, bit in enumerate(bits.tolist()):
+        targets[(i // blocks_w, i % blocks_w)] = 1 if bit else -1
+    return zz, base, targets
+
+def _restart_intervals(info: dict, total_mcus: int) -> tuple:
+    """(MCU в интервале рестарта, начала и концы данных интервалов)"""
+    interval = info['restart_interval'] or total_mcus
+    starts = [info['scan_start']] + [p + 2 for p in info['restarts']]
+    ends = info['restarts'] + [info['scan_end']]
+    if len(starts) != math.ceil(total_mcus / interval):
+        raise UnsupportedJpeg("Число интервалов рестарта не совпадает с размером кадра")
+    return interval, starts, ends
+
+def _embed_block_signs(data: bytes, bits: np.ndarray, coef_pos: tuple, magnitude: float) -> bytes:
+    info = parse_jpeg(data)
+    _check_luma_layout(info)
+    zz, base, targets = _sign_targets(info, bits, coef_pos, magnitude)
+    blocks_w = info['frame']['width'] // 8
+
+    mcus_x, mcus_y, mcu_blocks, (luma_v, luma_h) = _mcu_layout(info)
+    scan = info['scan_components']
+    dc_tables = [info['huffman'][(0, sc['td'])] for sc in scan]
+    ac_tables = [info['huffman'][(1, sc['ta'])] for sc in scan]
+
+    # При прореживании одна строка MCU содержит несколько строк блоков,
+    # поэтому последний нужный MCU ищем по всем целевым блокам
+    target_idx = np.arange(len(bits))
+    last_mcu = int(np.max((target_idx // blocks_w // luma_v) * mcus_x + (target_idx % blocks_w) // luma_h))
+
+    total_mcus = mcus_x * mcus_y
+    interval, starts, ends = _restart_intervals(info, total_mcus)
+
+    pieces = [data[:info['scan_start']]]
+    for number, (start, end) in enumerate(zip(starts, ends)):
+        if number:
+            pieces.append(data[start - 2:start])
+
+        first_mcu = number * interval
+        if first_mcu > last_mcu:
+            pieces.append(data[start:])
+            break
+
+        unstuffed = _unstuff(data[start:end])
+        stream = np.unpackbits(unstuffed)
+        reader = _BitReader(unstuffed)
+        out = []
+        copied = 0
+
+        interval_end = min(first_mcu + interval, total_mcus)
+        for mcu in range(first_mcu, min(interval_end, last_mcu + 1)):
+            mcu_y, mcu_x = divmod(mcu, mcus_x)
+            for scan_idx, comp_idx, dy, dx in mcu_blocks:
+                by = mcu_y * luma_v + dy if len(scan) > 1 else mcu_y
+                bx = mcu_x * luma_h + dx if len(scan) > 1 else mcu_x
+                sign = targets.get((by, bx)) if comp_idx == 0 else None
+
+                dc_end, coefs = _decode_block(reader, dc_tables[scan_idx], ac_tables[scan_idx], sign is not None)
+                if sign is None:
+                    continue
+
+                ac_bits = _reencode_block(coefs, zz, sign, base, ac_tables[scan_idx])
+                if ac_bits is None:
+                    continue
+                out.append(stream[copied:dc_end])
+                out.append(ac_bits)
+                copied = reader.pos
+
+        # Хвост интервала копируем со сдвигом. Если интервал декодирован
+        # целиком, конец данных известен точно. Иначе последний байт содержит
+        # 0-7 единиц выравнивания: при сдвиге, который может превратить их
+        # в лишний байт, дочитываем интервал до конца, но не больше
+        # TAIL_DECODE_MCUS, чтобы время не зависело от остатка скана.
+        # В остальных случаях хвост переносится вместе со старым выравниванием -
+        # данные не теряются, худший случай - один лишний байт 0xFF перед
+        # маркером, который декодеры пропускают.
+        data_end = reader.pos
+        if last_mcu + 1 < interval_end:
+            shift = (sum(len(part) for part in out) - copied) % 8
+            zeros = np.flatnonzero(stream[copied:] == 0)
+            trailing_ones = len(stream) - copied - (int(zeros[-1]) + 1 if zeros.size else 0)
+            ambiguous = shift and shift <= min(7, trailing_ones)
+            if ambiguous and interval_end - last_mcu - 1 <= TAIL_DECODE_MCUS:
+                for _ in range(last_mcu + 1, interval_end):
+                    for scan_idx, _comp, _dy, _dx in mcu_blocks:
+                        _decode_block(reader, dc_tables[scan_idx], ac_tables[scan_idx], False)
+                data_end = reader.pos
+            else:
+                data_end = len(stream)
+
+        if reader.pos > reader.size:
+            raise UnsupportedJpeg("Данные скана обрываются")
+        out.append(stream[copied:data_end])
+
+        new_stream = np.concatenate(out)
+        padding = (-len(new_stream)) % 8
+        new_stream = np.concatenate([new_stream, np.ones(padding, dtype=np.uint8)])
+        new_bytes = np.packbits(new_stream)
+        pieces.append(_stuff(new_bytes))
+
+        if number == len(starts) - 1:
+            pieces.append(data[end:])
+
+    # Дополненные таблицы переопределяются сегментом DHT прямо перед SOS;
+    # старые коды в них не менялись, остальные сканы декодируются как раньше
+    extended = [table.segment(1, table_id) for (table_class, table_id), table in sorted(info['huffman'].items())
+                if table_class == 1 and table.extended]
+    if extended:
+        sos = info['sos_start']
+        pieces[0] = data[:sos] + b''.join(extended) + data[sos:info['scan_start']]
+
+    return b''.join(pieces)
+
+def _scan_blocks(data: bytes, info: dict, targets: dict, zz: int, base: int):
+    """
+    Все блоки скана с уже записанными знаками целевых блоков:
+    (номер интервала, номер в скане, DC-биты, их число, AC-коэффициенты).
+    """
+    mcus_x, mcus_y, mcu_blocks, (luma_v, luma_h) = _mcu_layout(info)
+    scan = info['scan_components']
+    dc_tables = [info['huffman'][(0, sc['td'])] for sc in scan]
+    ac_tables = [info['huffman'][(1, sc['ta'])] for sc in scan]
+    total_mcus = mcus_x * mcus_y
+    interval, starts, ends = _restart_intervals(info, total_mcus)
+
+    for number, (start, end) in enumerate(zip(starts, ends)):
+        reader = _BitReader(_unstuff(data[start:end]))
+        for mcu in range(number * interval, min((number + 1) * interval, total_mcus)):
+            mcu_y, mcu_x = divmod(mcu, mcus_x)
+            for scan_idx, comp_idx, dy, dx in mcu_blocks:
+                by = mcu_y * luma_v + dy if len(scan) > 1 else mcu_y
+                bx = mcu_x * luma_h + dx if len(scan) > 1 else mcu_x
+                dc_start = reader.pos
+                dc_end, coefs = _decode_block(reader, dc_tables[scan_idx], ac_tables[scan_idx], True)
+
+                sign = targets.get((by, bx)) if comp_idx == 0 else None
+                if sign is not None and not (coefs[zz] * sign > 0 and abs(coefs[zz]) >= base):
+                    coefs[zz] = sign * base
+                yield number, scan_idx, reader.peek(dc_start, dc_end - dc_start), dc_end - dc_start, coefs
+        if reader.pos > reader.size:
+            raise UnsupportedJpeg("Данные скана обрываются")
+
+def _embed_block_signs_rebuilt(data: bytes, bits: np.ndarray, coef_pos: tuple, magnitude: float) -> bytes:
+    """
+    Встраивание с перестройкой AC-таблиц: первый проход считает частоты
+    символов уже изменённых блоков, второй перекодирует весь скан
+    оптимальными таблицами. DC-части копируются как есть.
+    """
+    info = parse_jpeg(data)
+    _check_luma_layout(info)
+    # Новые таблицы пишутся перед этим сканом; если после него есть другие
+    # сканы, они могли бы ссылаться на те же таблицы
+    if data[info['scan_end']:info['scan_end'] + 2] != b'\xFF\xD9':
+        raise UnsupportedJpeg("Таблицы Хаффмана используются несколькими сканами")
+    zz, base, targets = _sign_targets(info, bits, coef_pos, magnitude)
+
+    table_ids = [sc['ta'] for sc in info['scan_components']]
+    freqs = {table_id: Counter() for table_id in table_ids}
+    for _number, scan_idx, _dc, _dc_len, coefs in _scan_blocks(data, info, targets, zz, base):
+        freqs[table_ids[scan_idx]].update(_ac_symbols(coefs))
+    tables = {table_id: HuffmanTable.optimal(counts) for table_id, counts in freqs.items()}
+    codes = [tables[table_id].codes for table_id in table_ids]
+
+    sos = info['sos_start']
+    pieces = [data[:sos]] + [tables[table_id].segment(1, table_id) for table_id in sorted(tables)]
+    pieces.append(data[sos:info['scan_start']])
+    writer = _BitWriter()
+    current = 0
+    for number, scan_idx, dc, dc_len, coefs in _scan_blocks(data, info, targets, zz, base):
+        if number != current:
+            pieces.append(writer.flush())
+            restart = info['restarts'][current]
+            pieces.append(data[restart:restart + 2])
+            writer = _BitWriter()
+            current = number
+        writer.write(dc, dc_len)
+        _write_ac(writer, coefs, codes[scan_idx])
+    pieces.append(writer.flush())
+    pieces.append(data[info['scan_end']:])
+
+    return b''.join(pieces)
+
+def luma_coefficient_rows(data: bytes, coef_pos: tuple):
+    """
+    Построчно (по строкам блоков 8x8) выдаёт деквантованный коэффициент
+    coef_pos блоков яркости в том же порядке, в каком их заполняет
+    embed_block_signs. MCU декодируются только по мере чтения строк,
+    поэтому вызывающий может остановиться, разобрав лишь начало скана.
+
+    Заголовки разбираются сразу: для неподдерживаемого файла UnsupportedJpeg
+    бросается при вызове, а не при первой итерации.
+    """
+    try:
+        info = parse_jpeg(data)
+        _check_luma_layout(info)
+    except (IndexError, KeyError, StopIteration, struct.error) as e:
+        raise UnsupportedJpeg(f"Повреждённый или нестандартный JPEG: {e}")
+
+    return _luma_coefficient_rows(data, info, ZIGZAG_INDEX[coef_pos])
+
+def _luma_coefficient_rows(data: bytes, info: dict, zz: int):
+    frame = info['frame']
+    blocks_w = frame['width'] // 8
+    blocks_h = frame['height'] // 8
+    step = info['quant'][frame['components'][0]['tq']][zz]
+
+    mcus_x, mcus_y, mcu_blocks, (luma_v, luma_h) = _mcu_layout(info)
+    scan = info['scan_components']
+    total_mcus = mcus_x * mcus_y
+    interval = info['restart_interval'] or total_mcus
+    starts = [info['scan_start']] + [p + 2 for p in info['restarts']]
+    ends = info['restarts'] + [info['scan_end']]
+
+    reader = None
+    try:
+        dc_tables = [info['huffman'][(0, sc['td'])] for sc in scan]
+        ac_tables = [info['huffman'][(1, sc['ta'])] for sc in scan]
+
+        for mcu_y in range(mcus_y):
+            if mcu_y * luma_v >= blocks_h:
+                return
+
+            rows = np.zeros((luma_v, blocks_w), dtype=np.float32)
+            for mcu_x in range(mcus_x):
+                mcu = mcu_y * mcus_x + mcu_x
+                if mcu % interval == 0:
+                    number = mcu // interval
+                    reader = _BitReader(_unstuff(data[starts[number]:ends[number]]))
+
+                for scan_idx, comp_idx, dy, dx in mcu_blocks:
+                    bx = mcu_x * luma_h + dx
+                    keep = comp_idx == 0 and bx < blocks_w
+                    _, coefs = _decode_block(reader, dc_tables[scan_idx], ac_tables[scan_idx], keep)
+                    if keep:
+                        rows[dy, bx] = coefs[zz]
+
+            if reader.pos > reader.size:
+                raise UnsupportedJpeg("Данные скана обрываются")
+
+            for dy in range(luma_v):
+                if mcu_y * luma_v + dy < blocks_h:
+                    yield rows[dy] * step
+    except (IndexError, KeyError, struct.error) as e:
+        raise UnsupportedJpeg(f"Повреждённый JPEG: {e}")
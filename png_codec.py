@@ -0,0 +1,445 @@
+import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+
+class UnsupportedPng(ValueError):
+    """PNG нельзя обработать построчно (палитра, 16 бит, interlace и т.п.)"""
+
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+_CHUNK_HEADER = struct.Struct('>I4s')
+_IHDR = struct.Struct('>IIBBBBB')
+
+# Цветовые типы, которые читаются как RGB без преобразования: RGB и RGBA
+_CHANNELS = {2: 3, 6: 4}
+_MODES = {2: 'RGB', 6: 'RGBA'}
+
+# Сколько распакованных байт строк обрабатывается за раз
+STREAM_WINDOW_BYTES = 1 << 20
+# Размер порции при чтении и записи IDAT
+IDAT_CHUNK_SIZE = 1 << 16
+# Размер блока для параллельного сжатия и окно словаря deflate
+DEFLATE_BLOCK_SIZE = 1 << 17
+DEFLATE_WINDOW = 1 << 15
+DEFAULT_COMPRESS_LEVEL = 6
+
+# Второй байт заголовка zlib (FLEVEL) в зависимости от уровня сжатия
+_ZLIB_HEADERS = {0: b'\x78\x01', 1: b'\x78\x01', 2: b'\x78\x5e', 3: b'\x78\x5e', 4: b'\x78\x5e',
+                 5: b'\x78\x5e', 6: b'\x78\x9c', 7: b'\x78\xda', 8: b'\x78\xda', 9: b'\x78\xda'}
+
+
+def _read_exact(src, size: int) -> bytes:
+    data = src.read(size)
+    if len(data) != size:
+        raise ValueError("Неожиданный конец PNG")
+    return data
+
+def _write_chunk(dst, chunk_type: bytes, data: bytes) -> None:
+    dst.write(_CHUNK_HEADER.pack(len(data), chunk_type))
+    dst.write(data)
+    dst.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(chunk_type))))
+
+def _copy_chunk(src, dst, length: int, chunk_type: bytes) -> None:
+    """Копирует чанк (данные и CRC) без загрузки целиком в память"""
+    dst.write(_CHUNK_HEADER.pack(length, chunk_type))
+    remaining = length + 4
+    while remaining:
+        piece = _read_exact(src, min(remaining, IDAT_CHUNK_SIZE))
+        dst.write(piece)
+        remaining -= len(piece)
+
+def _deflate_block(data: bytes, dictionary: bytes, level: int, last: bool) -> bytes:
+    """Сжимает блок сырым deflate со словарём из хвоста предыдущего блока"""
+    if dictionary and level:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=dictionary)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    # Z_SYNC_FLUSH выравнивает блок по байту, и следующий можно дописать встык
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+class ParallelDeflate:
+    """
+    zlib-поток, который сжимается блоками в нескольких потоках (как pigz).
+
+    Каждый блок DEFLATE_BLOCK_SIZE сжимается отдельным сырым deflate
+    со словарём из последних 32 КБ предыдущего блока и завершается
+    Z_SYNC_FLUSH; блоки склеиваются в один поток с общим заголовком
+    и Adler-32. zlib отпускает GIL, поэтому потоки работают параллельно.
+    Интерфейс как у zlib.compressobj: compress() и flush().
+    При одном потоке это обычный zlib.compressobj без накладных расходов.
+    """
+
+    def __init__(self, level: int = DEFAULT_COMPRESS_LEVEL, threads: int = None):
+        self.level = DEFAULT_COMPRESS_LEVEL if level < 0 else level
+        self.threads = threads or os.cpu_count() or 1
+        self._serial = zlib.compressobj(self.level) if self.threads == 1 else None
+        self._executor = ThreadPoolExecutor(self.threads)
+        self._futures = deque()
+        self._buffer = bytearray()
+        self._dictionary = b''
+        self._checksum = zlib.adler32(b'')
+        self._header = _ZLIB_HEADERS[self.level]
+
+    def _submit(self, data: bytes, last: bool) -> None:
+        self._checksum = zlib.adler32(data, self._checksum)
+        self._futures.append(self._executor.submit(_deflate_block, data, self._dictionary, self.level, last))
+        self._dictionary = data[-DEFLATE_WINDOW:]
+
+    def _collect(self, wait: bool) -> bytes:
+        """Забирает готовые блоки по порядку; при wait ждёт все"""
+        output = bytearray(self._header)
+        self._header = b''
+        # Не держим в памяти больше двух блоков на поток
+        while self._futures and (wait or self._futures[0].done() or len(self._futures) > 2 * self.threads):
+            output.extend(self._futures.popleft().result())
+        return bytes(output)
+
+    def compress(self, data: bytes) -> bytes:
+        if self._serial:
+            return self._serial.compress(data)
+        self._buffer.extend(data)
+        while len(self._buffer) >= DEFLATE_BLOCK_SIZE:
+            self._submit(bytes(self._buffer[:DEFLATE_BLOCK_SIZE]), last=False)
+            del self._buffer[:DEFLATE_BLOCK_SIZE]
+        return self._collect(wait=False)
+
+    def flush(self) -> bytes:
+        if self._serial:
+            self._executor.shutdown()
+            return self._serial.flush()
+        self._submit(bytes(self._buffer), last=True)
+        self._buffer.clear()
+        try:
+            return self._collect(wait=True) + struct.pack('>I', self._checksum)
+        finally:
+            self._executor.shutdown()
+
+
+class _IdatWriter:
+    """Нарезает сжатый поток на чанки IDAT по IDAT_CHUNK_SIZE"""
+
+    def __init__(self, dst):
+        self.dst = dst
+        self.buffer = bytearray()
+
+    def write(self, data: bytes) -> None:
+        self.buffer.extend(data)
+        while len(self.buffer) >= IDAT_CHUNK_SIZE:
+            _write_chunk(self.dst, b'IDAT', bytes(self.buffer[:IDAT_CHUNK_SIZE]))
+            del self.buffer[:IDAT_CHUNK_SIZE]
+
+    def close(self) -> None:
+        if self.buffer:
+            _write_chunk(self.dst, b'IDAT', bytes(self.buffer))
+        self.buffer.clear()
+
+
+def read_png_header(src) -> dict:
+    """
+    Читает сигнатуру и IHDR. Возвращает параметры изображения,
+    если его можно обработать построчно, иначе UnsupportedPng.
+    """
+    if src.read(len(PNG_SIGNATURE)) != PNG_SIGNATURE:
+        raise UnsupportedPng("Не PNG")
+
+    length, chunk_type = _CHUNK_HEADER.unpack(_read_exact(src, _CHUNK_HEADER.size))
+    if chunk_type != b'IHDR' or length != _IHDR.size:
+        raise UnsupportedPng("Нет IHDR")
+
+    ihdr = _read_exact(src, length)
+    src.read(4)  # CRC
+    width, height, bit_depth, color_type, _, _, interlace = _IHDR.unpack(ihdr)
+
+    if bit_depth != 8 or color_type not in _CHANNELS:
+        raise UnsupportedPng("Поддерживаются только 8-битные RGB и RGBA")
+    if interlace:
+        raise UnsupportedPng("Interlaced PNG")
+
+    channels = _CHANNELS[color_type]
+    return {
+        'ihdr': ihdr,
+        'width': width,
+        'height': height,
+        'channels': channels,
+        'mode': _MODES[color_type],
+        'stride': width * channels,
+    }
+
+def _idat_pieces(src, length: int, state: dict):
+    """
+    Выдаёт сжатые данные подряд идущих IDAT порциями по IDAT_CHUNK_SIZE.
+    Заголовок первого чанка после IDAT сохраняется в state['next'].
+    """
+    while True:
+        while length:
+            piece = _read_exact(src, min(length, IDAT_CHUNK_SIZE))
+            length -= len(piece)
+            yield piece
+        src.read(4)  # CRC
+
+        length, chunk_type = _CHUNK_HEADER.unpack(_read_exact(src, _CHUNK_HEADER.size))
+        if chunk_type != b'IDAT':
+            state['next'] = (length, chunk_type)
+            return
+
+def _inflate(pieces, limit: int):
+    """Распаковывает поток, не выдавая за раз больше limit байт"""
+    decompressor = zlib.decompressobj()
+    for piece in pieces:
+        data = decompressor.decompress(piece, limit)
+        while data:
+            yield data
+            data = decompressor.decompress(decompressor.unconsumed_tail, limit)
+    tail = decompressor.flush()
+    if tail:
+        yield tail
+
+def unfilter_rows(filtered: bytes, prev_raw: np.ndarray, header: dict) -> np.ndarray:
+    """
+    Снимает PNG-фильтры со строк через декодер Pillow.
+
+    Перед строками добавляется уже раскодированная предыдущая строка
+    с фильтром None, поэтому Up/Avg/Paeth первой строки окна ссылаются
+    на правильные значения. Пиксели возвращаются массивом (строки, stride).
+    """
+    rows = len(filtered) // (header['stride'] + 1)
+    stream = zlib.compress(b'\x00' + prev_raw.tobytes() + filtered, 0)
+    img = Image.frombytes(header['mode'], (header['width'], rows + 1), stream, 'zip', header['mode'])
+    return np.asarray(img).reshape(rows + 1, header['stride'])[1:]
+
+def _predict(filter_type: int, raw: np.ndarray, prev: np.ndarray, bpp: int):
+    """
+    Предсказание PNG-фильтра для строк raw по строкам над ними prev.
+    Вычисления в uint8 с переполнением, как в спецификации (по модулю 256).
+    """
+    if filter_type == 0:
+        return 0
+    if filter_type == 2:
+        return prev
+
+    left = np.zeros_like(raw)
+    left[:, bpp:] = raw[:, :-bpp]
+    if filter_type == 1:
+        return left
+    if filter_type == 3:
+        # floor((left + prev) / 2) без выхода за uint8
+        return (left >> 1) + (prev >> 1) + (left & prev & 1)
+
+    # Paeth: расстояния считаются со знаком
+    up_left = np.zeros_like(prev)
+    up_left[:, bpp:] = prev[:, :-bpp]
+    a, b, c = (values.astype(np.int16) for values in (left, prev, up_left))
+    dist_left = np.abs(b - c)
+    dist_up = np.abs(a - c)
+    dist_up_left = np.abs(a + b - 2 * c)
+    return np.where((dist_left <= dist_up) & (dist_left <= dist_up_left), left,
+                    np.where(dist_up <= dist_up_left, prev, up_left))
+
+def filter_rows(filter_types: np.ndarray, raw: np.ndarray, prev: np.ndarray, bpp: int) -> np.ndarray:
+    """Векторно применяет к строкам raw заданные PNG-фильтры (prev - строки над ними)"""
+    filtered = np.empty_like(raw)
+    for filter_type in np.unique(filter_types):
+        if filter_type > 4:
+            raise ValueError("Повреждённые данные PNG")
+        rows = filter_types == filter_type
+        row_raw = raw if rows.all() else raw[rows]
+        row_prev = prev if rows.all() else prev[rows]
+        filtered[rows] = row_raw - _predict(filter_type, row_raw, row_prev, bpp)
+    return filtered
+
+def _embed_window(filtered: np.ndarray, raw: np.ndarray, carry: dict, first_row: int,
+                  offsets: np.ndarray, bits: np.ndarray, keep, header: dict) -> None:
+    """
+    Записывает биты окна в raw и перефильтровывает затронутые строки в filtered.
+    keep - маска сохраняемых бит байта (одна на все слоты или своя для каждого).
+
+    Перефильтровываются строки с битами и строки сразу под ними: остальные
+    строки и строки над ними не менялись, их байты остаются как были.
+    """
+    stride = header['stride']
+    rows = len(raw)
+    changed = np.zeros(rows, dtype=bool)
+
+    # Исходная последняя строка нужна, чтобы снять фильтры следующего окна
+    carry['source'] = raw[-1].copy()
+
+    if offsets.size:
+        local = offsets - first_row * stride
+        row_idx, col_idx = np.divmod(local, stride)
+        raw[row_idx, col_idx] = (raw[row_idx, col_idx] & keep) | bits
+        changed[row_idx] = True
+
+    affected = changed.copy()
+    affected[1:] |= changed[:-1]
+    affected[0] |= carry['changed']
+
+    carry_raw = carry['raw']
+    carry['raw'] = raw[-1].copy()
+    carry['changed'] = bool(changed[-1])
+
+    targets = np.flatnonzero(affected)
+    if not targets.size:
+        return
+
+    prev = np.empty((targets.size, stride), dtype=np.uint8)
+    above = targets > 0
+    prev[above] = raw[targets[above] - 1]
+    prev[~above] = carry_raw
+    filtered[targets, 1:] = filter_rows(filtered[targets, 0], raw[targets], prev, header['channels'])
+
+def embed_png_stream(src, dst, slots: np.ndarray, bits: np.ndarray, header: dict,
+                     compress_level: int = DEFAULT_COMPRESS_LEVEL, threads: int = None,
+                     keep: np.ndarray = None, progress=None) -> None:
+    """
+    Построчно встраивает биты в PNG из src и пишет результат в dst.
+
+    src должен стоять сразу после IHDR (см. read_png_header), slots - индексы
+    слотов RGB-изображения (pixel_idx * 3 + channel), bits - значения младших
+    бит слотов, keep - маски сохраняемых бит по слотам (по умолчанию 0xFE,
+    один бит на слот). IDAT распаковывается
+    потоком, фильтры снимаются окнами по STREAM_WINDOW_BYTES, младшие биты
+    меняются только в нужных строках, и строки сразу сжимаются обратно.
+    В памяти одновременно находится одно окно строк, а не всё изображение.
+    Сжатие идёт параллельно в threads потоках (ParallelDeflate).
+    Чанки, кроме IDAT, копируются как есть. progress(доля) вызывается
+    после каждого окна с долей обработанных строк.
+    """
+    stride = header['stride']
+    row_bytes = stride + 1
+    window_rows = max(1, STREAM_WINDOW_BYTES // row_bytes)
+
+    # Слот -> байт раскодированной строки; сортируем, чтобы идти по строкам
+    pixel_idx, channel = np.divmod(slots.astype(np.int64), 3)
+    offsets = pixel_idx * header['channels'] + channel
+    order = np.argsort(offsets, kind='stable')
+    offsets = offsets[order]
+    bits = bits[order]
+    keep = np.uint8(0xFE) if keep is None else keep[order]
+
+    dst.write(PNG_SIGNATURE)
+    _write_chunk(dst, b'IHDR', header['ihdr'])
+
+    while True:
+        length, chunk_type = _CHUNK_HEADER.unpack(_read_exact(src, _CHUNK_HEADER.size))
+        if chunk_type == b'IDAT':
+            break
+        _copy_chunk(src, dst, length, chunk_type)
+        if chunk_type == b'IEND':
+            raise ValueError("В PNG нет IDAT")
+
+    state = {}
+    compressor = ParallelDeflate(compress_level, threads)
+    idat = _IdatWriter(dst)
+    # source - исходная последняя строка окна, raw - она же после встраивания
+    carry = {'source': np.zeros(stride, dtype=np.uint8), 'raw': np.zeros(stride, dtype=np.uint8),
+             'changed': False}
+    pending = bytearray()
+    row = 0
+
+    def process(rows: int) -> None:
+        nonlocal row
+        window = bytes(pending[:rows * row_bytes])
+        del pending[:rows * row_bytes]
+
+        filtered = np.frombuffer(window, dtype=np.uint8).reshape(rows, row_bytes).copy()
+        raw = unfilter_rows(window, carry['source'], header).copy()
+        lo, hi = np.searchsorted(offsets, [row * stride, (row + rows) * stride])
+        _embed_window(filtered, raw, carry, row, offsets[lo:hi], bits[lo:hi],
+                      keep if keep.ndim == 0 else keep[lo:hi], header)
+        row += rows
+
+        idat.write(compressor.compress(filtered.tobytes()))
+        if progress is not None:
+            progress(row / header['height'])
+
+    for data in _inflate(_idat_pieces(src, length, state), STREAM_WINDOW_BYTES):
+        pending.extend(data)
+        while len(pending) >= window_rows * row_bytes and row < header['height']:
+            process(min(window_rows, header['height'] - row))
+
+    if pending and row < header['height']:
+        process(min(len(pending) // row_bytes, header['height'] - row))
+    if row != header['height']:
+        raise ValueError("Повреждённые данные PNG")
+
+    idat.write(compressor.flush())
+    idat.close()
+
+    # Остальные чанки после IDAT
+    length, chunk_type = state['next']
+    while True:
+        _copy_chunk(src, dst, length, chunk_type)
+        if chunk_type == b'IEND':
+            break
+        length, chunk_type = _CHUNK_HEADER.unpack(_read_exact(src, _CHUNK_HEADER.size))
+
+def _filter_window(raw: np.ndarray, prev_row: np.ndarray, bpp: int) -> bytes:
+    """
+    Фильтрует окно строк с адаптивным выбором фильтра, как в libpng:
+    для каждой строки - минимальная сумма модулей байтов как знаковых чисел.
+    """
+    prev = np.concatenate([prev_row, raw[:-1]])
+    candidates = np.empty((5,) + raw.shape, dtype=np.uint8)
+    for filter_type in range(5):
+        np.subtract(raw, _predict(filter_type, raw, prev, bpp), out=candidates[filter_type])
+
+    # |int8| через uint8: min(x, 256 - x)
+    scores = np.minimum(candidates, 0 - candidates).sum(axis=2, dtype=np.uint32)
+    filter_types = np.argmin(scores, axis=0)
+
+    filtered = np.empty((len(raw), raw.shape[1] + 1), dtype=np.uint8)
+    filtered[:, 0] = filter_types
+    filtered[:, 1:] = candidates[filter_types, np.arange(len(raw))]
+    return filtered.tobytes()
+
+def write_png(dst, pixels: np.ndarray, compress_level: int = DEFAULT_COMPRESS_LEVEL,
+              threads: int = None, info: dict = None) -> None:
+    """
+    Записывает массив RGB/RGBA (высота, ширина, каналы) в PNG.
+
+    Окна строк фильтруются независимо друг от друга (строка над окном
+    известна заранее), поэтому и фильтрация, и сжатие (ParallelDeflate)
+    идут в threads потоках. Из info переносятся icc_profile и dpi.
+    """
+    height, width, channels = pixels.shape
+    color_type = {3: 2, 4: 6}[channels]
+    stride = width * channels
+    rows = pixels.reshape(height, stride)
+    info = info or {}
+
+    dst.write(PNG_SIGNATURE)
+    _write_chunk(dst, b'IHDR', _IHDR.pack(width, height, 8, color_type, 0, 0, 0))
+    if info.get('icc_profile'):
+        _write_chunk(dst, b'iCCP', b'ICC Profile\x00\x00' + zlib.compress(info['icc_profile']))
+    if info.get('dpi'):
+        # pHYs хранит пиксели на метр
+        dpi_x, dpi_y = (int(round(value / 0.0254)) for value in info['dpi'])
+        _write_chunk(dst, b'pHYs', struct.pack('>IIB', dpi_x, dpi_y, 1))
+
+    compressor = ParallelDeflate(compress_level, threads)
+    idat = _IdatWriter(dst)
+    window_rows = max(1, STREAM_WINDOW_BYTES // (stride + 1))
+    zero_row = np.zeros((1, stride), dtype=np.uint8)
+
+    with ThreadPoolExecutor(compressor.threads) as executor:
+        windows = deque()
+        for start in range(0, height, window_rows):
+            prev_row = rows[start - 1:start] if start else zero_row
+            windows.append(executor.submit(_filter_window, rows[start:start + window_rows], prev_row, channels))
+            # Держим в работе не больше двух окон на поток
+            while len(windows) > 2 * compressor.threads:
+                idat.write(compressor.compress(windows.popleft().result()))
+        while windows:
+            idat.write(compressor.compress(windows.popleft().result()))
+
+    idat.write(compressor.flush())
+    idat.close()
+    _write_chunk(dst, b'IEND', b'')
@@ -0,0 +1,107 @@
+import hashlib
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+from stegano_payload import PAYLOAD_COMPRESSION, encode_payload
+
+# Сколько ключей запросов помнит кэш
+RESULT_CACHE_ENTRIES = 10000
+# Размер куска при хешировании загрузки
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def result_key(image_file, text, seed_key: str, fmt: str, scheme: str, profile: str,
+               depth: int = 1, compression: str = PAYLOAD_COMPRESSION) -> str:
+    """
+    Ключ результата: SHA-256 от байт изображения, текста (или байт данных
+    с флагами заголовка), ключа, алгоритма (формат, схема позиций, сжатие,
+    глубина LSB) и профиля кодировщика. Поток перематывается в начало.
+    """
+    # Хешируются несжатые данные и настройка сжатия - сжимать ради ключа незачем
+    data, flags = encode_payload(text, compression='none')
+    digest = hashlib.sha256()
+    for part in (fmt.encode(), scheme.encode(), profile.encode(), seed_key.encode('utf-8'),
+                 compression.encode(), bytes([flags, depth]), data):
+        # Длина перед каждым полем, чтобы границы полей не смешивались
+        digest.update(len(part).to_bytes(8, 'big'))
+        digest.update(part)
+
+    image_file.seek(0)
+    for chunk in iter(lambda: image_file.read(HASH_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    image_file.seek(0)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Соответствие ключ запроса -> имя готового файла в хранилище (storage.ArtifactStore).
+
+    Повтор запроса с теми же данными получает уже записанный файл.
+    Одинаковые запросы, пришедшие одновременно, считаются один раз:
+    первый строит результат, остальные ждут его (single-flight).
+    Число записей ограничено max_entries, вытесняются давно не запрошенные;
+    сами файлы и их квоту ведёт хранилище.
+    """
+
+    def __init__(self, store, max_entries: int = RESULT_CACHE_ENTRIES):
+        self.store = store
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        """Имя готового файла для ключа или None (без подсчёта и без ожидания)"""
+        with self._lock:
+            artifact = self._entries.get(key)
+            if artifact is not None and artifact in self.store:
+                self._entries.move_to_end(key)
+                return artifact
+            return None
+
+    def get_or_create(self, key: str, ext: str, produce) -> tuple:
+        """
+        Возвращает (имя файла в хранилище, найден ли он в кэше).
+        При промахе вызывает produce(path) - он должен записать результат в path.
+        """
+        while True:
+            with self._lock:
+                artifact = self._entries.get(key)
+                # Файл мог быть вытеснен хранилищем по квоте или сроку
+                if artifact is not None and artifact in self.store:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return artifact, True
+                event = self._inflight.get(key)
+                if event is None:
+                    event = self._inflight[key] = threading.Event()
+                    self.misses += 1
+                    break
+            # Такой же запрос уже считается - ждём его; если он упал, пробуем сами
+            event.wait()
+
+        tmp_path = os.path.join(self.store.root, f".{uuid.uuid4().hex}{ext}")
+        try:
+            produce(tmp_path)
+            artifact = self.store.put(tmp_path, ext)
+            with self._lock:
+                self._entries[key] = artifact
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            with self._lock:
+                del self._inflight[key]
+            event.set()
+        return artifact, False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
@@ -0,0 +1,74 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+from PIL import Image
+
+# Сколько строк изображения копируется в разделяемую память за раз
+COPY_CHUNK_ROWS = 256
+
+
+class SharedImage:
+    """
+    Массив пикселей в разделяемой памяти (multiprocessing.shared_memory).
+
+    Создатель кладёт декодированное изображение в сегмент один раз, процессы-
+    исполнители подключаются к нему по handle и меняют пиксели на месте -
+    при передаче задачи сериализуется только имя сегмента, форма и тип,
+    а не сами пиксели. Создатель отвечает за unlink (через with).
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, shape: tuple, dtype, owner: bool):
+        self._shm = shm
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.owner = owner
+        self.array = np.ndarray(self.shape, self.dtype, buffer=shm.buf)
+
+    @classmethod
+    def create(cls, shape: tuple, dtype=np.uint8) -> 'SharedImage':
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        return cls(shm, shape, dtype, owner=True)
+
+    @classmethod
+    def from_image(cls, img: Image.Image) -> 'SharedImage':
+        """
+        Копирует декодированное изображение в новый сегмент полосами
+        по COPY_CHUNK_ROWS строк, без промежуточного массива во весь размер.
+        """
+        shared = cls.create((img.height, img.width, len(img.getbands())))
+        for top in range(0, img.height, COPY_CHUNK_ROWS):
+            bottom = min(top + COPY_CHUNK_ROWS, img.height)
+            shared.array[top:bottom] = np.asarray(img.crop((0, top, img.width, bottom)))
+        return shared
+
+    @classmethod
+    def attach(cls, handle: tuple) -> 'SharedImage':
+        """Подключается к сегменту, созданному в другом процессе"""
+        name, shape, dtype = handle
+        return cls(shared_memory.SharedMemory(name=name), shape, dtype, owner=False)
+
+    @property
+    def handle(self) -> tuple:
+        """Всё, что нужно передать в другой процесс для attach"""
+        return self._shm.name, self.shape, self.dtype.str
+
+    def close(self) -> None:
+        # Сначала отпускаем представление, иначе сегмент не закрыть
+        self.array = None
+        self._shm.close()
+
+    def __enter__(self) -> 'SharedImage':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+        if self.owner:
+            self._shm.unlink()
+
+
+def split_range(total: int, parts: int, align: int = 1) -> list:
+    """Делит [0, total) на не больше parts кусков, границы кратны align"""
+    step = -(-total // max(parts, 1))
+    step = -(-step // align) * align
+    return [(start, min(start + step, total)) for start in range(0, total, max(step, 1))]
@@ -13,6 +13,9 @@ document.addEventListener('DOMContentLoaded', function() {
     const downloadStegoBtn = document.getElementById('downloadStegoBtn');
 
     let currentImageFile = null;
+    // Загруженный TXT-файл и его текст: пока текст не правили, на сервер уходит сам файл
+    let currentPayloadFile = null;
+    let currentPayloadText = null;
 
     // === ФУНКЦИЯ СБРОСА В ДЕФОЛТНОЕ СОСТОЯНИЕ ===
     function resetToDefault() {
@@ -22,6 +25,8 @@ document.addEventListener('DOMContentLoaded', function() {
         uploadPlaceholder.style.display = 'flex';
         downloadStegoBtn.style.display = 'none';
         currentImageFile = null;
+        currentPayloadFile = null;
+        currentPayloadText = null;
     }
 
     // === ОБРАБОТКА ВЫБОРА ИЗОБРАЖЕНИЯ ===
@@ -71,37 +76,17 @@ document.addEventListener('DOMContentLoaded', function() {
             const file = e.target.files[0];
             if (!file) return;
 
-            const formData = new FormData();
-            formData.append('text_file', file);
-
-            uploadTextBtn.textContent = 'Загрузка...';
-            uploadTextBtn.disabled = true;
-
-            fetch('/upload_text_file', {
-                method: 'POST',
-                body: formData
-            })
-            .then(response => {
-                if (!response.ok) {
-                    throw new Error('Server error');
-                }
-                return response.json();
-            })
-            .then(data => {
-                if (data.error) {
-                    alert('Ошибка: ' + data.error);
-                } else {
-                    textInput.value = data.text;
-                }
-            })
-            .catch(err => {
-                console.error('Ошибка:', err);
+            // Текст показывается из файла локально, без запроса к серверу
+            const reader = new FileReader();
+            reader.onload = function(e) {
+                textInput.value = e.target.result;
+                currentPayloadFile = file;
+                currentPayloadText = textInput.value;
+            };
+            reader.onerror = function() {
                 alert('Не удалось загрузить файл');
-            })
-            .finally(() => {
-                uploadTextBtn.textContent = 'Загрузить TXT';
-                uploadTextBtn.disabled = false;
-            });
+            };
+            reader.readAsText(file);
         };
         input.click();
     });
@@ -132,27 +117,35 @@ document.addEventListener('DOMContentLoaded', function() {
         writeBtn.textContent = 'Обработка...';
         writeBtn.disabled = true;
 
-        // Создаем FormData
+        // Создаем FormData: неизменённый TXT-файл отправляется как есть
         const formData = new FormData();
         formData.append('image', currentImageFile);
-        formData.append('text', textInput.value);
+        let endpoint = '/hide_text';
+        if (currentPayloadFile && textInput.value === currentPayloadText) {
+            formData.append('payload', currentPayloadFile);
+            endpoint = '/hide_file';
+        } else {
+            formData.append('text', textInput.value);
+        }
 
-        // Отправляем запрос
-        fetch('/hide_text', {
+        // Отправляем запрос: изображение приходит сразу в ответе, без второго запроса
+        fetch(endpoint + '?binary=1', {
             method: 'POST',
             body: formData
         })
         .then(response => {
             if (!response.ok) {
-                throw new Error('Network error');
+                return response.json()
+                    .catch(() => ({ error: 'Network error' }))
+                    .then(data => { throw new Error(data.error || 'Network error'); });
             }
-            return response.json();
+            // Имя файла из Content-Disposition
+            const disposition = response.headers.get('Content-Disposition') || '';
+            const match = disposition.match(/filename="?([^";]+)"?/);
+            const stegoFilename = match ? match[1] : 'stego_' + currentImageFile.name;
+            return response.blob().then(blob => ({ blob, stegoFilename }));
         })
-        .then(data => {
-            if (data.error) {
-                throw new Error(data.error);
-            }
-            
+        .then(({ blob, stegoFilename }) => {
             // Успех!
             // alert('Текст успешно скрыт в изображении!');
             
@@ -161,14 +154,15 @@ document.addEventListener('DOMContentLoaded', function() {
             
             // Настраиваем скачивание с сбросом состояния после скачивания
             downloadStegoBtn.onclick = function() {
-                // Создаем временную ссылку для скачивания
-                const downloadUrl = data.download_url;
+                // Создаем временную ссылку на полученное изображение
+                const downloadUrl = URL.createObjectURL(blob);
                 const a = document.createElement('a');
                 a.href = downloadUrl;
-                a.download = data.stego_filename;
+                a.download = stegoFilename;
                 document.body.appendChild(a);
                 a.click();
                 document.body.removeChild(a);
+                URL.revokeObjectURL(downloadUrl);
                 
                 // Сбрасываем состояние после скачивания
                 setTimeout(resetToDefault, 100);
@@ -218,9 +212,27 @@ document.addEventListener('DOMContentLoaded', function() {
             if (!response.ok) {
                 throw new Error('Network error');
             }
+            // Двоичные данные приходят файлом - сохраняем его
+            const contentType = response.headers.get('Content-Type') || '';
+            if (!contentType.includes('application/json')) {
+                return response.blob().then(blob => {
+                    const url = URL.createObjectURL(blob);
+                    const a = document.createElement('a');
+                    a.href = url;
+                    a.download = 'hidden_payload.bin';
+                    document.body.appendChild(a);
+                    a.click();
+                    document.body.removeChild(a);
+                    URL.revokeObjectURL(url);
+                    return null;
+                });
+            }
             return response.json();
         })
         .then(data => {
+            if (data === null) {
+                return;
+            }
             if (data.error) {
                 throw new Error(data.error);
             }
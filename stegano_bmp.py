@@ -1,134 +1,139 @@
 from PIL import Image
 import io
-import hashlib
-import random
+import shutil
+import struct
+from collections import namedtuple
 
-END_MARKER = b'\x00\xFF\x00\xFF\x00'
+import numpy as np
 
-def generate_seed_from_key(key: str = "default_seed") -> int:
-    hash_object = hashlib.sha256(key.encode())
-    return int.from_bytes(hash_object.digest()[:8], 'big')
+from stegano_lsb import (
+    DEFAULT_POSITION_SCHEME,
+    embed_text,
+    hide_text_lsb,
+    extract_text_lsb,
+)
 
-def generate_pseudo_random_positions(total_pixels: int, total_bits: int, seed_key: str = "stegano_key") -> list:
-    """Генерирует псевдослучайные позиции без создания полного списка"""
-    seed = generate_seed_from_key(seed_key)
-    rng = random.Random(seed)
-    
-    positions = []
-    used_positions = set()
-    
-    while len(positions) < total_bits:
-        pixel_idx = rng.randint(0, total_pixels - 1)
-        channel = rng.randint(0, 2)
-        
-        position = (pixel_idx, channel)
-        if position not in used_positions:
-            used_positions.add(position)
-            positions.append(position)
-    
-    return positions
+# BITMAPFILEHEADER и начало BITMAPINFOHEADER (и всех более новых версий)
+BMP_FILE_HEADER = struct.Struct('<2sIHHI')
+BMP_INFO_HEADER = struct.Struct('<IiiHHI')
+BMP_HEADER_SIZE = BMP_FILE_HEADER.size + BMP_INFO_HEADER.size
+
+BmpLayout = namedtuple('BmpLayout', ['width', 'height', 'offset', 'stride', 'top_down'])
+
+
+def parse_bmp_layout(header: bytes, file_size: int):
+    """
+    Разбирает заголовок BMP и возвращает расположение пиксельного массива.
+
+    Быстрый путь поддерживает только несжатый 24-битный BMP (BI_RGB):
+    в нём байты файла и есть пиксели. Для остальных вариантов
+    (палитра, 32 бита, bitfields, RLE, OS/2) возвращает None.
+    """
+    if len(header) < BMP_HEADER_SIZE:
+        return None
+
+    signature, _, _, _, offset = BMP_FILE_HEADER.unpack_from(header)
+    dib_size, width, height, planes, bit_count, compression = \
+        BMP_INFO_HEADER.unpack_from(header, BMP_FILE_HEADER.size)
+
+    if signature != b'BM' or dib_size < 40 or planes != 1:
+        return None
+    if bit_count != 24 or compression != 0 or width <= 0 or height == 0:
+        return None
+
+    # Строки выровнены на 4 байта; height < 0 - строки идут сверху вниз
+    stride = (width * 3 + 3) & ~3
+    layout = BmpLayout(width, abs(height), offset, stride, height < 0)
+    if offset + stride * layout.height > file_size:
+        return None
+
+    return layout
 
-def hide_text_bmp(image_file, text: str, seed_key: str = "stegano_key") -> io.BytesIO:
+def bmp_slot_offsets(layout: BmpLayout, indices: np.ndarray) -> np.ndarray:
+    """
+    Переводит слоты RGB-изображения (pixel_idx * 3 + channel, строки сверху
+    вниз) в смещения байтов файла: BGR, строки снизу вверх с выравниванием.
+    """
+    pixel_idx, channel = np.divmod(indices.astype(np.int64), 3)
+    y, x = np.divmod(pixel_idx, layout.width)
+    if not layout.top_down:
+        y = layout.height - 1 - y
+    return layout.offset + y * layout.stride + x * 3 + (2 - channel)
+
+def _embed_bmp_buffer(buffer: np.ndarray, text: str, seed_key: str, scheme: str,
+                      depth: int = 1) -> bool:
+    """Меняет младшие биты прямо в байтах BMP. False - формат не подходит"""
+    layout = parse_bmp_layout(buffer[:BMP_HEADER_SIZE].tobytes(), buffer.size)
+    if layout is None:
+        return False
+
+    embed_text(buffer, layout.width * layout.height, text, seed_key, scheme,
+               slot_map=lambda indices: bmp_slot_offsets(layout, indices), depth=depth)
+    return True
+
+def _hide_text_bmp_pil(image_file, text: str, seed_key: str, scheme: str,
+                       depth: int = 1) -> io.BytesIO:
+    """Запасной путь через PIL для BMP, которые нельзя править на месте"""
     image_file.seek(0)
     img = Image.open(image_file)
-    
+
     if img.mode != 'RGB':
         img = img.convert('RGB')
-    
-    text_bytes = text.encode('utf-8')
-    text_bytes += END_MARKER
-    
-    bits = []
-    for byte in text_bytes:
-        for i in range(7, -1, -1):
-            bits.append((byte >> i) & 1)
-    
-    total_pixels = img.width * img.height
-    
-    if len(bits) > total_pixels * 3:
-        raise ValueError("Текст слишком длинный")
-    
-    positions = generate_pseudo_random_positions(total_pixels, len(bits), seed_key)
-    
-    encoded_img = img.copy()
-    pixels = encoded_img.load()
-    
-    pixel_array = []
-    for y in range(img.height):
-        for x in range(img.width):
-            pixel_array.append((x, y))
-    
-    for bit_idx, (pixel_idx, channel) in enumerate(positions):
-        x, y = pixel_array[pixel_idx]
-        r, g, b = encoded_img.getpixel((x, y))
-        bit_val = bits[bit_idx]
-        
-        if channel == 0:
-            r = (r & 0xFE) | bit_val
-        elif channel == 1:
-            g = (g & 0xFE) | bit_val
-        else:
-            b = (b & 0xFE) | bit_val
-            
-        pixels[x, y] = (r, g, b)
-    
+
+    encoded_img = hide_text_lsb(img, text, seed_key, scheme, depth=depth)
+
     output = io.BytesIO()
     encoded_img.save(output, format='BMP')
     output.seek(0)
     return output
 
-def extract_text_bmp(image_file, seed_key: str = "stegano_key") -> str:
+def hide_text_bmp(image_file, text: str, seed_key: str = "stegano_key",
+                  scheme: str = DEFAULT_POSITION_SCHEME, depth: int = 1) -> io.BytesIO:
+    """
+    Несжатый 24-битный BMP правится как есть, без декодирования
+    и повторного кодирования; остальные BMP идут через PIL.
+    depth - сколько младших бит канала занимают данные (1-4).
+    """
+    image_file.seek(0)
+    data = bytearray(image_file.read())
+
+    if _embed_bmp_buffer(np.frombuffer(data, dtype=np.uint8), text, seed_key, scheme, depth):
+        return io.BytesIO(data)
+
+    return _hide_text_bmp_pil(image_file, text, seed_key, scheme, depth)
+
+def hide_text_bmp_file(path: str, text: str, seed_key: str = "stegano_key",
+                       scheme: str = DEFAULT_POSITION_SCHEME, source_path: str = None,
+                       depth: int = 1) -> None:
+    """
+    Встраивает текст в BMP-файл на диске на месте.
+
+    Файл отображается в память (np.memmap), меняются только байты
+    с битами сообщения - на диск записываются лишь затронутые страницы,
+    а не всё изображение. Если задан source_path, он сначала копируется
+    в path (shutil.copyfile использует copy_file_range/sendfile ядра).
+    """
+    if source_path is not None:
+        shutil.copyfile(source_path, path)
+
+    mapped = np.memmap(path, dtype=np.uint8, mode='r+')
+    try:
+        embedded = _embed_bmp_buffer(mapped, text, seed_key, scheme, depth)
+        mapped.flush()
+    finally:
+        del mapped
+
+    if not embedded:
+        with open(path, 'rb') as f:
+            output = _hide_text_bmp_pil(io.BytesIO(f.read()), text, seed_key, scheme, depth)
+        with open(path, 'wb') as f:
+            f.write(output.getvalue())
+
+def extract_text_bmp(image_file, seed_key: str = "stegano_key", scheme: str = None) -> str:
     image_file.seek(0)
     img = Image.open(image_file)
     
     if img.mode != 'RGB':
         img = img.convert('RGB')
     
-    total_pixels = img.width * img.height
-    total_bits = total_pixels * 3
-    
-    pixel_array = []
-    for y in range(img.height):
-        for x in range(img.width):
-            pixel_array.append((x, y))
-    
-    max_bits_to_extract = min(total_bits, 50000)
-    positions = generate_pseudo_random_positions(total_pixels, max_bits_to_extract, seed_key)
-    
-    bits = []
-    bytes_list = []
-    
-    for bit_idx, (pixel_idx, channel) in enumerate(positions):
-        x, y = pixel_array[pixel_idx]
-        r, g, b = img.getpixel((x, y))
-        
-        if channel == 0:
-            bits.append(r & 1)
-        elif channel == 1:
-            bits.append(g & 1)
-        else:
-            bits.append(b & 1)
-        
-        if len(bits) >= 8:
-            byte_val = 0
-            for i in range(8):
-                byte_val = (byte_val << 1) | bits[i]
-            bits = bits[8:]
-            bytes_list.append(byte_val)
-            
-            if len(bytes_list) >= len(END_MARKER):
-                last_bytes = bytes(bytes_list[-len(END_MARKER):])
-                if last_bytes == END_MARKER:
-                    text_bytes = bytes(bytes_list[:-len(END_MARKER)])
-                    try:
-                        return text_bytes.decode('utf-8')
-                    except:
-                        try:
-                            return text_bytes.decode('cp1251')
-                        except:
-                            return text_bytes.decode('latin-1')
-    
-    try:
-        return bytes(bytes_list).decode('utf-8')
-    except:
-        return bytes(bytes_list).decode('latin-1')
\ No newline at end of file
+    return extract_text_lsb(img, seed_key, scheme)
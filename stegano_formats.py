@@ -0,0 +1,297 @@
+import io
+import os
+import shutil
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+from PIL import Image
+
+from encoder_profiles import DEFAULT_PROFILE, ENCODER_PROFILES, resolve_profile
+from stegano_png import hide_text_png, hide_text_png_file, extract_text_png
+from stegano_jpg import hide_text_jpg, extract_text_jpg, bands_to_payload, jpeg_band_bits, pixel_band_bits
+from stegano_bmp import hide_text_bmp, hide_text_bmp_file, extract_text_bmp
+from stegano_webp import hide_text_webp, extract_text_webp
+from stegano_lsb import POSITION_SCHEMES, extract_with_keys, read_payload_lsb
+from stegano_payload import HEADER_BITS, EncodedPayload, encode_payload
+
+# Расширение файла -> формат
+FORMAT_EXTENSIONS = {
+    '.png': 'png',
+    '.jpg': 'jpg',
+    '.jpeg': 'jpg',
+    '.jpe': 'jpg',
+    '.bmp': 'bmp',
+    '.webp': 'webp',
+}
+
+# Расширение файла результата для каждого формата
+OUTPUT_EXTENSIONS = {'png': '.png', 'jpg': '.jpg', 'bmp': '.bmp', 'webp': '.webp'}
+# MIME-тип результата
+OUTPUT_MIMETYPES = {'png': 'image/png', 'jpg': 'image/jpeg', 'bmp': 'image/bmp', 'webp': 'image/webp'}
+
+# Алгоритм встраивания для каждого формата
+CAPACITY_ALGORITHMS = {'png': 'lsb', 'bmp': 'lsb', 'webp': 'lsb', 'jpg': 'dct'}
+
+UNSUPPORTED_FORMAT_MESSAGE = 'Unsupported image format. Use PNG, JPG, BMP, or WebP'
+
+# Сигнатуры в начале файла (WebP проверяется отдельно: RIFF....WEBP)
+MAGIC_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'BM', 'bmp'),
+)
+
+# Результат автоматического извлечения: контейнер, алгоритм, схема позиций (для LSB), данные
+Extraction = namedtuple('Extraction', ['fmt', 'algorithm', 'scheme', 'payload'])
+
+
+def detect_format(filename: str):
+    """Формат по расширению имени файла или None, если он не поддерживается"""
+    return FORMAT_EXTENSIONS.get(os.path.splitext(filename.lower())[1])
+
+def sniff_format(image_file):
+    """Формат по сигнатуре в начале файла или None; поток перематывается в начало"""
+    image_file.seek(0)
+    head = image_file.read(16)
+    image_file.seek(0)
+
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    for signature, fmt in MAGIC_SIGNATURES:
+        if head.startswith(signature):
+            return fmt
+    return None
+
+def resolve_format(image_file, filename: str):
+    """Формат по содержимому, а если сигнатура не узнана - по имени файла"""
+    return sniff_format(image_file) or detect_format(filename or '')
+
+def stego_filename(filename: str, fmt: str) -> str:
+    """Имя файла результата: <исходное имя>_stego<расширение формата>"""
+    return f"{os.path.splitext(filename)[0]}_stego{OUTPUT_EXTENSIONS[fmt]}"
+
+class CapacityError(ValueError):
+    """Сообщение не помещается в изображение"""
+
+
+def image_capacity(fmt: str, image_file, depth: int = 1) -> dict:
+    """
+    Ёмкость изображения по одному заголовку файла (ленивый Image.open,
+    пиксели не декодируются). bits и bytes - как в
+    SteganoAnalyzer.calculate_capacity, payload_bytes - сколько байт
+    данных помещается с учётом заголовка сообщения. depth - бит данных
+    на канал для LSB-форматов; у JPEG не используется.
+    """
+    if fmt not in CAPACITY_ALGORITHMS:
+        raise ValueError(UNSUPPORTED_FORMAT_MESSAGE)
+
+    image_file.seek(0)
+    with Image.open(image_file) as img:
+        width, height = img.size
+    image_file.seek(0)
+
+    # JPEG - один бит на блок 8x8, остальные форматы - по depth бит на канал RGB;
+    # заголовок сообщения всегда занимает по одному биту в HEADER_BITS слотах
+    if fmt == 'jpg':
+        slots, depth = (width // 8) * (height // 8), 1
+    else:
+        slots = width * height * 3
+    bits = slots * depth
+    return {
+        'algorithm': CAPACITY_ALGORITHMS[fmt],
+        'width': width,
+        'height': height,
+        'bits': bits,
+        'bytes': bits // 8,
+        'payload_bytes': max(slots - HEADER_BITS, 0) * depth // 8,
+    }
+
+def payload_capacity(fmt: str, image_file, depth: int = 1) -> int:
+    """Сколько байт данных помещается в изображение, не считая заголовка"""
+    return image_capacity(fmt, image_file, depth)['payload_bytes']
+
+def encoder_profile(fmt: str, image_file, profile: str, latency_budget: float = None) -> str:
+    """
+    Профиль, с которым изображение будет закодировано: 'auto' выбирается
+    по бюджету времени и числу пикселей из заголовка, как при кодировании.
+    У BMP кодировщика нет, профиль на результат не влияет - DEFAULT_PROFILE.
+    """
+    if fmt not in ENCODER_PROFILES:
+        return DEFAULT_PROFILE
+    info = image_capacity(fmt, image_file)
+    return resolve_profile(fmt, profile, info['width'] * info['height'], latency_budget)[0]
+
+def check_capacity(fmt: str, image_file, text, depth: int = 1, compression: str = None) -> EncodedPayload:
+    """
+    Сжимает сообщение (compression, по умолчанию PAYLOAD_COMPRESSION) и
+    отклоняет его, если оно не поместится, до декодирования пикселей.
+    Возвращает EncodedPayload: встраивается он, а не исходный текст,
+    чтобы сообщение сжималось один раз.
+    """
+    capacity = payload_capacity(fmt, image_file, depth)
+    payload = encode_payload(text, compression)
+    if len(payload.data) > capacity:
+        raise CapacityError(f"Текст слишком длинный (после сжатия {len(payload.data)} байт). "
+                            f"Максимум: {capacity} байт")
+    return payload
+
+def hide_image_to_file(fmt: str, image_file, output_path: str, text: str, seed_key: str,
+                       profile: str = DEFAULT_PROFILE, latency_budget: float = None,
+                       executor=None, depth: int = 1, progress=None, compression: str = None) -> None:
+    """
+    Встраивает текст в изображение формата fmt и записывает результат в output_path.
+
+    PNG пишется в файл потоком, BMP копируется как есть и правится на месте,
+    JPEG и WebP кодируются в память. При ошибке недописанный файл удаляется.
+    executor - пул процессов для параллельного встраивания длинных сообщений.
+    Слишком длинное сообщение отклоняется до декодирования (CapacityError).
+    depth - бит данных на канал для PNG, BMP и WebP; JPEG его не использует.
+    progress(доля 0..1) вызывается по этапам: проверка ёмкости, затем
+    декодирование, встраивание и кодирование (у PNG - по строкам).
+    compression - метод сжатия сообщения (stegano_payload.COMPRESSION_METHODS);
+    text может быть и готовым EncodedPayload.
+    """
+    def report(fraction: float) -> None:
+        if progress is not None:
+            progress(fraction)
+
+    text = check_capacity(fmt, image_file, text, depth, compression)
+    report(0.1)
+    # Доля этапа формата 0..1 -> общая доля после проверки ёмкости
+    stage = (lambda fraction: report(0.1 + 0.85 * fraction)) if progress is not None else None
+    try:
+        if fmt == 'png':
+            with open(output_path, 'wb') as f:
+                hide_text_png_file(image_file, f, text, seed_key, profile=profile,
+                                   latency_budget=latency_budget, executor=executor, depth=depth,
+                                   progress=stage)
+
+        elif fmt == 'bmp':
+            image_file.seek(0)
+            with open(output_path, 'wb') as f:
+                shutil.copyfileobj(image_file, f)
+            report(0.3)
+            hide_text_bmp_file(output_path, text, seed_key, depth=depth)
+            report(0.95)
+
+        elif fmt == 'jpg':
+            output_stream = hide_text_jpg(image_file, text, profile, latency_budget, executor)
+            report(0.9)
+            with open(output_path, 'wb') as f:
+                f.write(output_stream.getvalue())
+
+        elif fmt == 'webp':
+            output_stream = hide_text_webp(image_file, text, seed_key, profile=profile,
+                                           latency_budget=latency_budget, executor=executor, depth=depth,
+                                           progress=stage)
+            report(0.95)
+            with open(output_path, 'wb') as f:
+                f.write(output_stream.getvalue())
+
+        else:
+            raise ValueError(UNSUPPORTED_FORMAT_MESSAGE)
+
+    except Exception:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+
+def hide_image_to_stream(fmt: str, image_file, text: str, seed_key: str,
+                         profile: str = DEFAULT_PROFILE, latency_budget: float = None,
+                         executor=None, depth: int = 1, compression: str = None) -> io.BytesIO:
+    """Встраивает текст в изображение формата fmt и возвращает результат в памяти"""
+    text = check_capacity(fmt, image_file, text, depth, compression)
+    if fmt == 'png':
+        return hide_text_png(image_file, text, seed_key, profile=profile,
+                             latency_budget=latency_budget, executor=executor, depth=depth)
+    if fmt == 'bmp':
+        return hide_text_bmp(image_file, text, seed_key, depth=depth)
+    if fmt == 'jpg':
+        return hide_text_jpg(image_file, text, profile, latency_budget, executor)
+    if fmt == 'webp':
+        return hide_text_webp(image_file, text, seed_key, profile=profile,
+                              latency_budget=latency_budget, executor=executor, depth=depth)
+    raise ValueError(UNSUPPORTED_FORMAT_MESSAGE)
+
+def _lsb_candidate(flat: np.ndarray, total_pixels: int, seed_key: str, scheme: str):
+    payload = read_payload_lsb(flat, total_pixels, seed_key, scheme)
+    return None if payload is None else ('lsb', scheme, payload)
+
+def _dct_candidate(img: Image.Image):
+    payload = bands_to_payload(pixel_band_bits(img), require_header=True)
+    return None if payload is None else ('dct', None, payload)
+
+def extract_auto(image_file, seed_key: str):
+    """
+    Ищет скрытые данные, не зная ни формата, ни алгоритма.
+
+    Контейнер определяется по сигнатуре. В JPEG данные есть только у DCT:
+    заголовок читается из коэффициентов без полного декодирования. Остальные
+    форматы декодируются один раз, и по общему массиву пикселей параллельно
+    пробуются LSB с ключом (все схемы позиций) и DCT - последний переживает
+    перекодирование JPEG без потерь. Засчитываются только данные с заголовком
+    и верным CRC. Возвращает Extraction по первому найденному кандидату,
+    не дожидаясь остальных, или None.
+    """
+    fmt = sniff_format(image_file)
+    if fmt is None:
+        raise ValueError(UNSUPPORTED_FORMAT_MESSAGE)
+
+    if fmt == 'jpg':
+        payload = bands_to_payload(jpeg_band_bits(image_file), require_header=True)
+        return None if payload is None else Extraction(fmt, 'dct', None, payload)
+
+    image_file.seek(0)
+    img = Image.open(image_file)
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    img.load()
+    flat = np.asarray(img, dtype=np.uint8).reshape(-1)
+    total_pixels = img.width * img.height
+
+    # Без with: выход из него ждал бы всех кандидатов, а ответ нужен по первому
+    # найденному. Оставшиеся кандидаты отменяются или дорабатывают в фоне
+    pool = ThreadPoolExecutor(len(POSITION_SCHEMES) + 1)
+    try:
+        # Сначала LSB - родной алгоритм PNG, BMP и WebP
+        futures = [pool.submit(_lsb_candidate, flat, total_pixels, seed_key, scheme)
+                   for scheme in POSITION_SCHEMES]
+        futures.append(pool.submit(_dct_candidate, img))
+        for future in as_completed(futures):
+            found = future.result()
+            if found is not None:
+                return Extraction(fmt, *found)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    return None
+
+def extract_image_keys(image_file, keys: list, filename: str = None):
+    """
+    Подбирает ключ из keys для LSB-изображения (PNG, BMP, WebP): одно
+    декодирование и дешёвая проверка заголовка на каждый ключ.
+    Возвращает (ключ, схема, данные) или None. DCT в JPEG ключа не использует.
+    """
+    fmt = resolve_format(image_file, filename)
+    if fmt is None:
+        raise ValueError(UNSUPPORTED_FORMAT_MESSAGE)
+    if fmt == 'jpg':
+        raise ValueError("JPEG (DCT) doesn't use a key, use /extract_text")
+
+    image_file.seek(0)
+    img = Image.open(image_file)
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    return extract_with_keys(img, keys)
+
+def extract_image_text(fmt: str, image_file, seed_key: str) -> str:
+    """Извлекает текст из изображения формата fmt"""
+    if fmt == 'png':
+        return extract_text_png(image_file, seed_key)
+    if fmt == 'jpg':
+        return extract_text_jpg(image_file)
+    if fmt == 'bmp':
+        return extract_text_bmp(image_file, seed_key)
+    if fmt == 'webp':
+        return extract_text_webp(image_file, seed_key)
+    raise ValueError(UNSUPPORTED_FORMAT_MESSAGE)
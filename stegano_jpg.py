@@ -1,9 +1,176 @@
 import numpy as np
 from PIL import Image
 import io
-from scipy.fftpack import dct, idct
+import itertools
+import logging
+import os
+from encoder_profiles import DEFAULT_PROFILE, resolve_profile, timed_encode
+from jpeg_codec import UnsupportedJpeg, embed_block_signs, luma_coefficient_rows
+from shared_image import SharedImage, split_range
+from stegano_payload import HEADER_BITS, decode_payload, decode_text, encode_payload, pack_payload, parse_header, verify_payload
 
-def rgb_to_ycbcr(rgb):
+logger = logging.getLogger(__name__)
+
+# Коэффициент DCT, в который встраивается бит (средняя частота)
+COEF_POS = (4, 4)
+QUANT_STEP = 30.0  # Большой шаг для устойчивости
+
+# С какого числа бит (блоков) пиксельный путь раздаётся процессам
+PARALLEL_MIN_BLOCKS = 1 << 15
+
+# Матрицы BT.601 для умножения справа: [R G B] @ RGB_TO_YCBCR + YCBCR_OFFSET.
+# Коэффициенты те же, что в формулах rgb_to_ycbcr / ycbcr_to_rgb.
+RGB_TO_YCBCR = np.array([
+    [0.299, -0.1687, 0.5],
+    [0.587, -0.3313, -0.4187],
+    [0.114, 0.5, -0.0813],
+], dtype=np.float32)
+YCBCR_OFFSET = np.array([0, 128, 128], dtype=np.float32)
+
+YCBCR_TO_RGB = np.array([
+    [1.0, 1.0, 1.0],
+    [0.0, -0.34414, 1.772],
+    [1.402, -0.71414, 0.0],
+], dtype=np.float32)
+RGB_OFFSET = -128 * (YCBCR_TO_RGB[1] + YCBCR_TO_RGB[2])
+
+# Сколько строк пикселей конвертируется за один проход
+CONVERSION_CHUNK_ROWS = 256
+
+# Какую долю строк блоков читать из энтропийных данных при извлечении.
+# Разбор Хаффмана на Python примерно в 16 раз дороже декодера Pillow,
+# поэтому длинные сообщения дочитываются через полное декодирование.
+COEFFICIENT_ROWS_FRACTION = 1 / 16
+
+def dct_basis(u: int, v: int) -> np.ndarray:
+    """
+    Базисная функция 8x8 ортонормированного DCT-II для коэффициента (u, v).
+
+    Коэффициент (u, v) блока равен скалярному произведению блока на этот
+    базис, а изменение коэффициента на delta эквивалентно прибавлению
+    delta * базис к блоку - прямое и обратное DCT для этого не нужны.
+    """
+    n = np.arange(8)
+    
+    def basis_1d(k):
+        scale = np.sqrt(1 / 8) if k == 0 else np.sqrt(2 / 8)
+        return scale * np.cos((2 * n + 1) * k * np.pi / 16)
+    
+    return np.outer(basis_1d(u), basis_1d(v)).astype(np.float32)
+
+COEF_BASIS = dct_basis(*COEF_POS)
+
+def block_view(plane: np.ndarray) -> np.ndarray:
+    """
+    Представление плоскости в виде массива блоков (bh, bw, 8, 8) без копирования.
+    Неполные блоки по краям отбрасываются, как и раньше.
+    """
+    blocks_h = plane.shape[0] // 8
+    blocks_w = plane.shape[1] // 8
+    return plane[:blocks_h * 8, :blocks_w * 8].reshape(blocks_h, 8, blocks_w, 8).transpose(0, 2, 1, 3)
+
+def block_coefficients(blocks: np.ndarray) -> np.ndarray:
+    """Коэффициент COEF_POS сразу для всех блоков одним einsum"""
+    return np.einsum('ijkl,kl->ij', blocks, COEF_BASIS)
+
+def embed_block_bits(plane: np.ndarray, bits: np.ndarray, quant_step: float = QUANT_STEP) -> None:
+    """
+    Встраивает биты в первые len(bits) блоков плоскости (построчно) на месте.
+
+    Для бита 1 коэффициент становится +2*quant_step, для 0 - -2*quant_step:
+    ко всем целевым блокам разом прибавляется базис, умноженный на разницу
+    между нужным и текущим значением коэффициента.
+    """
+    blocks = block_view(plane)
+    blocks_w = blocks.shape[1]
+    rows = -(-len(bits) // blocks_w)
+    target = blocks[:rows]
+    
+    delta = np.zeros(rows * blocks_w, dtype=np.float32)
+    wanted = np.where(bits == 1, quant_step * 2, -quant_step * 2)
+    delta[:len(bits)] = wanted - block_coefficients(target).reshape(-1)[:len(bits)]
+    
+    target += delta.reshape(rows, blocks_w)[:, :, None, None] * COEF_BASIS
+
+def bands_to_text(bands) -> str:
+    """
+    Собирает байты из последовательности массивов битов (по строке блоков)
+    и останавливается на первом нулевом байте - следующие полосы
+    изображения не запрашиваются.
+    """
+    leftover = np.zeros(0, dtype=np.uint8)
+    chunks = []
+    
+    for band_bits in bands:
+        bits = np.concatenate([leftover, band_bits])
+        full = len(bits) - len(bits) % 8
+        data = np.packbits(bits[:full])
+        leftover = bits[full:]
+        
+        terminator = np.flatnonzero(data == 0)
+        if terminator.size:
+            chunks.append(data[:terminator[0]])
+            return decode_text(np.concatenate(chunks).tobytes())
+        chunks.append(data)
+    
+    data = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.uint8)
+    return decode_text(data.tobytes(), fallback='latin-1')
+
+def bands_to_payload(bands, require_header: bool = False):
+    """
+    Читает сообщение с заголовком (stegano_payload): сначала HEADER_BITS бит,
+    затем ровно столько полос, сколько занимают данные. Без заголовка
+    (или при несовпадении CRC) - старый формат с нулевым байтом в конце,
+    а с require_header=True - None.
+    """
+    bands = iter(bands)
+    collected = []
+    count = 0
+    for band_bits in bands:
+        collected.append(band_bits)
+        count += len(band_bits)
+        if count >= HEADER_BITS:
+            break
+
+    header = None
+    if count >= HEADER_BITS:
+        bits = np.concatenate(collected)
+        header = parse_header(np.packbits(bits[:HEADER_BITS]).tobytes())
+
+    if header is not None:
+        needed = HEADER_BITS + header.length * 8
+        for band_bits in bands:
+            if count >= needed:
+                break
+            collected.append(band_bits)
+            count += len(band_bits)
+        bits = np.concatenate(collected)
+        data = np.packbits(bits[HEADER_BITS:needed]).tobytes()
+        if count >= needed and verify_payload(header, data):
+            return decode_payload(data, header.flags)
+
+    if require_header:
+        return None
+    return bands_to_text(itertools.chain(collected, bands))
+
+def pixel_band_bits(img: Image.Image, start_band: int = 0, exact: bool = False):
+    """
+    Биты из декодированного изображения по полосам высотой 8 пикселей:
+    яркость считается только для текущей полосы, а не для всего изображения.
+    
+    Для знака коэффициента точность float не нужна, поэтому по умолчанию
+    яркость считает Pillow (convert('L') - та же формула BT.601 в целых
+    числах). exact=True - float32 по формуле rgb_to_ycbcr.
+    """
+    for band in range(start_band, img.height // 8):
+        band_img = img.crop((0, band * 8, img.width, band * 8 + 8))
+        if exact:
+            y_channel = rgb_to_luma(np.asarray(band_img))
+        else:
+            y_channel = np.asarray(band_img.convert('L'), dtype=np.float32)
+        yield (block_coefficients(block_view(y_channel)) > 0).astype(np.uint8).reshape(-1)
+
+def rgb_to_ycbcr(rgb, out=None, chunk_rows: int = CONVERSION_CHUNK_ROWS):
     """
     Конвертирует RGB в YCbCr по стандарту ITU-R BT.601 (используется в JPEG).
     
@@ -29,21 +196,21 @@ def rgb_to_ycbcr(rgb):
     - -0.4187 = -0.587 * 0.713
     - -0.0813 = -0.114 * 0.713
     """
-    r, g, b = rgb[:, :, 0], rgb[:, :, 1], rgb[:, :, 2]
-    
-    # Y  =  0.299*R + 0.587*G + 0.114*B
-    y = 0.299 * r + 0.587 * g + 0.114 * b
-    
-    # Cb = -0.1687*R - 0.3313*G + 0.5*B + 128
-    cb = -0.1687 * r - 0.3313 * g + 0.5 * b + 128
-    
-    # Cr =  0.5*R - 0.4187*G - 0.0813*B + 128
-    cr = 0.5 * r - 0.4187 * g - 0.0813 * b + 128
-    
-    return np.stack([y, cb, cr], axis=2)
+    # Все три уравнения - одно умножение на матрицу RGB_TO_YCBCR.
+    # Считаем полосами по chunk_rows строк прямо в выходной float32-буфер,
+    # поэтому временные массивы не больше одной полосы.
+    if out is None:
+        out = np.empty(rgb.shape, dtype=np.float32)
+    
+    for start in range(0, rgb.shape[0], chunk_rows):
+        stop = start + chunk_rows
+        np.matmul(rgb[start:stop], RGB_TO_YCBCR, out=out[start:stop])
+        out[start:stop] += YCBCR_OFFSET
+    
+    return out
 
 
-def ycbcr_to_rgb(ycbcr):
+def ycbcr_to_rgb(ycbcr, out=None, chunk_rows: int = CONVERSION_CHUNK_ROWS):
     """
     Конвертирует YCbCr обратно в RGB по стандарту ITU-R BT.601.
     
@@ -71,49 +238,94 @@ def ycbcr_to_rgb(ycbcr):
     0.71414 = (0.299 * 1.402) / 0.587 (компенсация красного в зеленом)
     Физический смысл: зеленый = яркость - вклад синего - вклад красного
     """
-    # Извлекаем каналы и убираем смещение 128 для цветоразностных компонент
-    y = ycbcr[:, :, 0]           # Яркость (0-255)
-    cb = ycbcr[:, :, 1] - 128    # Cb' (синяя цветоразность, центрированная вокруг 0)
-    cr = ycbcr[:, :, 2] - 128    # Cr' (красная цветоразность, центрированная вокруг 0)
-    
-    # R = Y + 1.402 * Cr'
-    r = y + 1.402 * cr
-    
-    # G = Y - 0.34414 * Cb' - 0.71414 * Cr'
-    g = y - 0.34414 * cb - 0.71414 * cr
-    
-    # B = Y + 1.772 * Cb'
-    b = y + 1.772 * cb
-    
-    return np.stack([r, g, b], axis=2)
+    # Смещение 128 у Cb и Cr заранее внесено в RGB_OFFSET, так что
+    # преобразование - одно умножение на матрицу и сложение, по полосам.
+    # out может совпадать с ycbcr - тогда конвертация идёт на месте.
+    if out is None:
+        out = np.empty(ycbcr.shape, dtype=np.float32)
+    
+    for start in range(0, ycbcr.shape[0], chunk_rows):
+        stop = start + chunk_rows
+        np.matmul(ycbcr[start:stop], YCBCR_TO_RGB, out=out[start:stop])
+        out[start:stop] += RGB_OFFSET
+    
+    return out
+
+def rgb_to_luma(rgb, out=None) -> np.ndarray:
+    """Только яркость Y - первый столбец RGB_TO_YCBCR, без Cb и Cr"""
+    return np.matmul(rgb, RGB_TO_YCBCR[:, 0], out=out, dtype=np.float32)
+
+def embed_block_rows(rgb_array: np.ndarray, bits: np.ndarray, first_bit: int = 0) -> None:
+    """
+    Встраивает биты first_bit.. в RGB-массив на месте (бит на блок 8x8
+    построчно); first_bit должен быть кратен числу блоков в строке.
+    В YCbCr переводятся только строки блоков, в которые попадают биты.
+    """
+    blocks_w = rgb_array.shape[1] // 8
+    first_row = first_bit // blocks_w
+    
+    full_rows, last_blocks = divmod(len(bits), blocks_w)
+    top = first_row * 8
+    band_height = (full_rows + (1 if last_blocks else 0)) * 8
+    ycbcr = rgb_to_ycbcr(rgb_array[top:top + band_height])
+    
+    # Встраиваем все биты сразу прямо в плоскость Y (представление без копии)
+    embed_block_bits(ycbcr[:, :, 0], bits)
+    
+    # Конвертируем обратно в RGB в тот же буфер
+    band_rgb = ycbcr_to_rgb(ycbcr, out=ycbcr)
+    np.clip(band_rgb, 0, 255, out=band_rgb)
+    
+    # Возвращаем только несущие блоки (с отбрасыванием дробной части, как
+    # astype): остальные пиксели не проходят через округления float
+    rows = rgb_array[top:top + band_height]
+    rows[:full_rows * 8, :blocks_w * 8] = band_rgb[:full_rows * 8, :blocks_w * 8]
+    if last_blocks:
+        rows[full_rows * 8:, :last_blocks * 8] = band_rgb[full_rows * 8:, :last_blocks * 8]
+
+def _embed_block_rows_task(handle: tuple, first_bit: int, bits: np.ndarray) -> None:
+    """Исполнитель: встраивает свой диапазон строк блоков в разделяемое изображение"""
+    shared = SharedImage.attach(handle)
+    try:
+        embed_block_rows(shared.array, bits, first_bit)
+    finally:
+        shared.close()
 
-def hide_text_jpg(image_file, text: str) -> io.BytesIO:
+def hide_text_jpg(image_file, text: str, profile: str = DEFAULT_PROFILE,
+                  latency_budget: float = None, executor=None) -> io.BytesIO:
     """
     DCT алгоритм для скрытия текста в JPG.
     Модифицирует только Y канал, сохраняя цветность.
+
+    Baseline JPEG меняется прямо в области квантованных коэффициентов:
+    перекодируются только несущие блоки, таблицы квантования и прореживание
+    цветности остаются исходными, поэтому размер файла почти не растёт.
+    Остальные JPEG (progressive, CMYK) декодируются и пересжимаются,
+    при этом через YCbCr проходят только строки блоков с битами;
+    profile задаёт параметры этого пересжатия (encoder_profiles).
+    С executor длинные сообщения встраиваются по строкам блоков в пуле
+    процессов через разделяемую память (shared_image).
+    Текст (или bytes с флагом FLAG_BINARY) пишется с заголовком stegano_payload.
     """
+    # Кодируем текст
+    payload = pack_payload(*encode_payload(text))
+    
+    bits = np.unpackbits(np.frombuffer(payload, dtype=np.uint8))
+    
+    image_file.seek(0)
+    try:
+        return io.BytesIO(embed_block_signs(image_file.read(), bits, COEF_POS, QUANT_STEP * 2))
+    except UnsupportedJpeg as e:
+        # Пиксельный путь пересжимает весь файл, размер может вырасти в разы
+        logger.warning("JPEG пересжимается через пиксели: %s", e)
+    
     image_file.seek(0)
     img = Image.open(image_file)
     
     if img.mode != 'RGB':
         img = img.convert('RGB')
     
-    # Преобразуем в numpy array
-    img_array = np.array(img, dtype=np.float32)
-    height, width, _ = img_array.shape
-    
-    # Конвертируем в YCbCr
-    ycbcr = rgb_to_ycbcr(img_array)
-    y_channel = ycbcr[:, :, 0].copy()
-    
-    # Кодируем текст
-    text_bytes = text.encode('utf-8')
-    text_bytes += b'\x00'
-    
-    bits = []
-    for byte in text_bytes:
-        for i in range(7, -1, -1):
-            bits.append((byte >> i) & 1)
+    width, height = img.size
     
     # Размеры в блоках
     blocks_h = height // 8
@@ -121,115 +333,70 @@ def hide_text_jpg(image_file, text: str) -> io.BytesIO:
     
     max_bits = blocks_h * blocks_w
     if len(bits) > max_bits:
-        raise ValueError(f"Текст слишком длинный. Максимум: {max_bits//8} байт")
-    
-    bit_index = 0
-    quant_step = 30.0  # Большой шаг для устойчивости
-    
-    for y_block in range(blocks_h):
-        for x_block in range(blocks_w):
-            if bit_index >= len(bits):
-                break
-            
-            y_start = y_block * 8
-            x_start = x_block * 8
-            block = y_channel[y_start:y_start+8, x_start:x_start+8].copy()
-            
-            # DCT
-            dct_block = dct(dct(block.T, norm='ortho').T, norm='ortho')
-            
-            # Используем коэффициент (4,4) - средняя частота
-            coef_pos = (4, 4)
-            
-            if bits[bit_index] == 1:
-                # Устанавливаем положительное значение
-                dct_block[coef_pos] = quant_step * 2
-            else:
-                # Устанавливаем отрицательное значение
-                dct_block[coef_pos] = -quant_step * 2
-            
-            bit_index += 1
-            
-            # Обратное DCT
-            idct_block = idct(idct(dct_block.T, norm='ortho').T, norm='ortho')
-            y_channel[y_start:y_start+8, x_start:x_start+8] = idct_block
-        
-        if bit_index >= len(bits):
-            break
-    
-    # Восстанавливаем Y канал
-    ycbcr[:, :, 0] = y_channel
-    
-    # Конвертируем обратно в RGB
-    rgb_array = ycbcr_to_rgb(ycbcr)
-    rgb_array = np.clip(rgb_array, 0, 255).astype(np.uint8)
-    
-    encoded_img = Image.fromarray(rgb_array, 'RGB')
+        raise ValueError(f"Текст слишком длинный. Максимум: {max(max_bits - HEADER_BITS, 0) // 8} байт")
+    
+    if executor is not None and len(bits) >= PARALLEL_MIN_BLOCKS:
+        # Строки блоков раздаются процессам, пиксели остаются в разделяемой памяти
+        with SharedImage.from_image(img) as shared:
+            futures = [
+                executor.submit(_embed_block_rows_task, shared.handle, first, bits[first:last])
+                for first, last in split_range(len(bits), os.cpu_count() or 1, align=blocks_w)
+            ]
+            for future in futures:
+                future.result()
+            encoded_img = Image.fromarray(shared.array, 'RGB')
+    else:
+        rgb_array = np.array(img, dtype=np.uint8)
+        embed_block_rows(rgb_array, bits)
+        encoded_img = Image.fromarray(rgb_array, 'RGB')
     
     # Сохраняем
+    profile, options = resolve_profile('jpg', profile, width * height, latency_budget)
     output = io.BytesIO()
-    encoded_img.save(output, format='JPEG', quality=100, subsampling='4:4:4')
+    with timed_encode('jpg', profile, width * height):
+        encoded_img.save(output, format='JPEG', quality=100, subsampling='4:4:4', **options)
     output.seek(0)
     
     return output
 
-def extract_text_jpg(image_file) -> str:
+def jpeg_band_bits(image_file):
     """
-    Извлекает текст из JPG с DCT алгоритмом.
+    Биты сообщения по строкам блоков.
+
+    Первые строки читаются из энтропийно-кодированных данных baseline JPEG
+    без декодирования пикселей. Если сообщение длиннее (или JPEG не baseline),
+    изображение декодируется Pillow, и чтение продолжается с той же строки.
     """
     image_file.seek(0)
-    img = Image.open(image_file)
+    data = image_file.read()
+    img = Image.open(io.BytesIO(data))
+    limit = max(2, int(img.height // 8 * COEFFICIENT_ROWS_FRACTION))
+    
+    rows_read = 0
+    try:
+        for row in luma_coefficient_rows(data, COEF_POS):
+            yield (row > 0).astype(np.uint8)
+            rows_read += 1
+            if rows_read >= limit:
+                break
+        else:
+            return
+    except UnsupportedJpeg:
+        pass
     
     if img.mode != 'RGB':
         img = img.convert('RGB')
     
-    img_array = np.array(img, dtype=np.float32)
-    height, width, _ = img_array.shape
-    
-    # Конвертируем в YCbCr и берем Y канал
-    ycbcr = rgb_to_ycbcr(img_array)
-    y_channel = ycbcr[:, :, 0]
-    
-    blocks_h = height // 8
-    blocks_w = width // 8
-    
-    bits = []
-    bytes_list = []
-    
-    for y_block in range(blocks_h):
-        for x_block in range(blocks_w):
-            y_start = y_block * 8
-            x_start = x_block * 8
-            block = y_channel[y_start:y_start+8, x_start:x_start+8]
-            
-            # DCT
-            dct_block = dct(dct(block.T, norm='ortho').T, norm='ortho')
-            
-            coef_pos = (4, 4)
-            value = dct_block[coef_pos]
-            
-            # Определяем бит
-            bit = 1 if value > 0 else 0
-            bits.append(bit)
-            
-            if len(bits) >= 8:
-                byte_val = 0
-                for i in range(8):
-                    byte_val = (byte_val << 1) | bits[i]
-                bits = bits[8:]
-                
-                if byte_val == 0:
-                    try:
-                        return bytes(bytes_list).decode('utf-8')
-                    except UnicodeDecodeError:
-                        try:
-                            return bytes(bytes_list).decode('cp1251')
-                        except:
-                            return bytes(bytes_list).decode('latin-1')
-                
-                bytes_list.append(byte_val)
-    
-    try:
-        return bytes(bytes_list).decode('utf-8')
-    except UnicodeDecodeError:
-        return bytes(bytes_list).decode('latin-1')
\ No newline at end of file
+    yield from pixel_band_bits(img, rows_read)
+
+def extract_text_jpg(image_file) -> str:
+    """
+    Извлекает текст из JPG с DCT алгоритмом.
+
+    Биты читаются по строкам блоков, разбор прекращается, как только прочитаны
+    данные из заголовка (или нулевой байт старого формата): для короткого
+    сообщения декодируется только верхняя полоса baseline JPEG, а при полном
+    декодировании в YCbCr переводятся лишь нужные полосы.
+    Данные с флагом FLAG_BINARY возвращаются как bytes.
+    """
+    return bands_to_payload(jpeg_band_bits(image_file))
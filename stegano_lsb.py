@@ -0,0 +1,564 @@
+import functools
+import hashlib
+import os
+import random
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from shared_image import SharedImage, split_range
+from stegano_payload import (
+    HEADER_BITS,
+    HEADER_SIZE,
+    PAYLOAD_MAGIC,
+    PAYLOAD_VERSION,
+    decode_payload,
+    decode_text,
+    depth_flags,
+    encode_payload,
+    header_depth,
+    pack_payload,
+    parse_header,
+    verify_payload,
+)
+
+# Маркер конца текста в старом формате (до заголовка с длиной)
+END_MARKER = b'\x00\xFF\x00\xFF\x00'
+
+# Сколько бит читаем при поиске END_MARKER в старом формате
+MAX_BITS_TO_EXTRACT = 50000
+
+# Схемы генерации позиций:
+# 'feistel' - ключевая псевдослучайная перестановка (по умолчанию)
+# 'legacy'  - прежний генератор с отклонением повторов (для старых изображений)
+POSITION_SCHEMES = ('feistel', 'legacy')
+DEFAULT_POSITION_SCHEME = 'feistel'
+
+FEISTEL_ROUNDS = 6
+
+# С какого числа бит встраивание раздаётся процессам через разделяемую память
+PARALLEL_MIN_BITS = 1 << 20
+
+# Сколько байт массивов позиций держит кэш
+POSITION_CACHE_BYTES = 64 << 20
+
+
+@functools.lru_cache(maxsize=256)
+def generate_seed_from_key(key: str = "default_seed") -> int:
+    """Генерирует числовой seed из строкового ключа через SHA-256"""
+    hash_object = hashlib.sha256(key.encode())
+    return int.from_bytes(hash_object.digest()[:8], 'big')
+
+def generate_pseudo_random_positions(total_pixels: int, total_bits: int, seed_key: str = "stegano_key") -> list:
+    """
+    Генерирует псевдослучайные позиции для встраивания битов.
+
+    Использует эффективный алгоритм без создания полного списка всех позиций:
+    1. Из ключа через SHA-256 получаем seed
+    2. Для каждого бита генерируем случайный индекс пикселя и канал
+    3. Отклоняем повторы через множество used_positions
+
+    Сложность: O(n) по памяти, где n = total_bits
+    """
+    seed = generate_seed_from_key(seed_key)
+    rng = random.Random(seed)
+
+    positions = []
+    used_positions = set()
+    total_channels = 3
+
+    # Генерируем ровно total_bits уникальных позиций
+    while len(positions) < total_bits:
+        pixel_idx = rng.randint(0, total_pixels - 1)
+        channel = rng.randint(0, total_channels - 1)
+
+        position = (pixel_idx, channel)
+        if position not in used_positions:
+            used_positions.add(position)
+            positions.append(position)
+
+    return positions
+
+def _mix64(values: np.ndarray) -> np.ndarray:
+    """Перемешивающая функция splitmix64 для массива uint64"""
+    values = values ^ (values >> 30)
+    values *= np.uint64(0xBF58476D1CE4E5B9)
+    values ^= values >> 27
+    values *= np.uint64(0x94D049BB133111EB)
+    values ^= values >> 31
+    return values
+
+@functools.lru_cache(maxsize=256)
+def _feistel_round_keys(seed_key: str) -> np.ndarray:
+    """Раундовые ключи сети Фейстеля из того же seed, что и у legacy-генератора"""
+    rng = random.Random(generate_seed_from_key(seed_key))
+    round_keys = np.array([rng.getrandbits(64) for _ in range(FEISTEL_ROUNDS)], dtype=np.uint64)
+    round_keys.flags.writeable = False
+    return round_keys
+
+def _feistel_permute(values: np.ndarray, half_bits: int, round_keys: np.ndarray) -> np.ndarray:
+    """Один проход сбалансированной сети Фейстеля по домену 2^(2*half_bits)"""
+    mask = np.uint64((1 << half_bits) - 1)
+    left = values >> half_bits
+    right = values & mask
+    for round_key in round_keys:
+        left, right = right, left ^ (_mix64(right ^ round_key) & mask)
+    return (left << half_bits) | right
+
+def _index_dtype(total_slots: int):
+    """Самый компактный тип индекса для данного числа слотов"""
+    return np.uint32 if total_slots <= np.iinfo(np.uint32).max else np.int64
+
+def feistel_positions(total_slots: int, start: int, count: int, seed_key: str = "stegano_key") -> np.ndarray:
+    """
+    Возвращает позиции start..start+count-1 ключевой перестановки слотов.
+
+    Слот - это индекс байта в плоском RGB-массиве (pixel_idx * 3 + channel).
+    Перестановка строится сетью Фейстеля над ближайшей чётной степенью двойки
+    и сужается до [0, total_slots) методом cycle-walking: значения вне диапазона
+    прогоняются через сеть повторно. Домен меньше 4 * total_slots, поэтому
+    в среднем на позицию приходится не больше четырёх проходов - стоимость
+    не зависит от заполненности изображения, повторов не бывает по построению.
+    """
+    domain_bits = max(2, (total_slots - 1).bit_length())
+    domain_bits += domain_bits % 2
+    half_bits = domain_bits // 2
+    round_keys = _feistel_round_keys(seed_key)
+
+    positions = _feistel_permute(np.arange(start, start + count, dtype=np.uint64), half_bits, round_keys)
+
+    # Cycle-walking: дожимаем значения, вышедшие за пределы изображения
+    pending = np.flatnonzero(positions >= total_slots)
+    while pending.size:
+        positions[pending] = _feistel_permute(positions[pending], half_bits, round_keys)
+        pending = pending[positions[pending] >= total_slots]
+
+    return positions.astype(_index_dtype(total_slots))
+
+def iter_positions(total_slots: int, seed_key: str = "stegano_key", chunk_size: int = 65536, start: int = 0):
+    """Лениво выдаёт позиции перестановки порциями по chunk_size"""
+    while start < total_slots:
+        count = min(chunk_size, total_slots - start)
+        yield feistel_positions(total_slots, start, count, seed_key)
+        start += count
+
+class PositionCache:
+    """
+    LRU-кэш последовательностей позиций: (ключ, число пикселей, схема) -> массив.
+
+    Хранится префикс последовательности, поэтому запрос на 2 тыс. бит
+    обслуживается из записи на 10 тыс. бит, а более длинный запрос
+    достраивает запись. Размер ограничен суммой байт массивов (max_bytes).
+    Массивы только для чтения; hits и misses считают обращения.
+    Потокобезопасен.
+    """
+
+    def __init__(self, max_bytes: int = POSITION_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, key: tuple, end: int):
+        """Закэшированный префикс (возможно, короче end) или None"""
+        with self._lock:
+            positions = self._entries.get(key)
+            if positions is not None and len(positions) >= end:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return positions
+
+    def store(self, key: tuple, positions: np.ndarray) -> None:
+        if positions.nbytes > self.max_bytes:
+            return
+        positions.flags.writeable = False
+
+        with self._lock:
+            current = self._entries.get(key)
+            # Параллельный запрос мог уже сохранить префикс длиннее
+            if current is not None and len(current) >= len(positions):
+                return
+            if current is not None:
+                self._bytes -= current.nbytes
+            self._entries[key] = positions
+            self._entries.move_to_end(key)
+            self._bytes += positions.nbytes
+
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'entries': len(self._entries), 'bytes': self._bytes}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+# Общий кэш процесса
+POSITION_CACHE = PositionCache()
+
+
+def generate_positions(total_pixels: int, total_bits: int, seed_key: str = "stegano_key",
+                       scheme: str = DEFAULT_POSITION_SCHEME, start: int = 0,
+                       cache: PositionCache = POSITION_CACHE) -> np.ndarray:
+    """
+    Генерирует индексы слотов для битов start..start+total_bits-1.
+
+    scheme='feistel' - O(1) на позицию, память только под результат.
+    scheme='legacy'  - воспроизводит порядок generate_pseudo_random_positions.
+
+    Последовательности от начала кэшируются (cache=None - без кэша);
+    результат - массив только для чтения.
+    """
+    total_slots = total_pixels * 3
+    end = start + total_bits
+    if end > total_slots:
+        raise ValueError("Запрошено больше позиций, чем есть в изображении")
+    if scheme not in POSITION_SCHEMES:
+        raise ValueError(f"Неизвестная схема позиций: {scheme}")
+
+    if cache is None:
+        return _compute_positions(total_pixels, seed_key, scheme, start, end)
+
+    key = (seed_key, total_pixels, scheme)
+    cached = cache.lookup(key, end)
+    have = 0 if cached is None else len(cached)
+    if have >= end:
+        return cached[start:end]
+
+    # Диапазон не от начала (например, кусок для процесса-исполнителя) не кэшируем
+    if start > have and scheme == 'feistel':
+        return _compute_positions(total_pixels, seed_key, scheme, start, end)
+
+    # Достраиваем префикс: Фейстель продолжает с конца, legacy считает заново
+    if scheme == 'feistel' and have:
+        positions = np.concatenate([cached, _compute_positions(total_pixels, seed_key, scheme, have, end)])
+    else:
+        positions = _compute_positions(total_pixels, seed_key, scheme, 0, end)
+    cache.store(key, positions)
+    return positions[start:end]
+
+def _compute_positions(total_pixels: int, seed_key: str, scheme: str, start: int, end: int) -> np.ndarray:
+    total_slots = total_pixels * 3
+    if scheme == 'feistel':
+        return feistel_positions(total_slots, start, end - start, seed_key)
+    positions = generate_pseudo_random_positions(total_pixels, end, seed_key)
+    return positions_to_indices(positions[start:]).astype(_index_dtype(total_slots))
+
+def positions_to_indices(positions: list) -> np.ndarray:
+    """
+    Переводит пары (pixel_idx, channel) в индексы плоского массива RGB.
+
+    Пиксели идут построчно, как в исходном pixel_array, поэтому
+    индекс байта = pixel_idx * 3 + channel.
+    """
+    pairs = np.array(positions, dtype=np.int64).reshape(-1, 2)
+    return pairs[:, 0] * 3 + pairs[:, 1]
+
+def bytes_to_bits(data: bytes) -> np.ndarray:
+    """Преобразует байты в массив битов (от старшего к младшему)"""
+    return np.unpackbits(np.frombuffer(data, dtype=np.uint8))
+
+def bits_to_values(bits: np.ndarray, depth: int = 1) -> np.ndarray:
+    """Группирует биты по depth (старший первым) в значения младших бит слотов"""
+    if depth == 1:
+        return bits
+    padding = -len(bits) % depth
+    if padding:
+        bits = np.concatenate([bits, np.zeros(padding, dtype=np.uint8)])
+    weights = np.left_shift(1, np.arange(depth - 1, -1, -1, dtype=np.uint8))
+    return (bits.reshape(-1, depth) * weights).sum(axis=1, dtype=np.uint8)
+
+def values_to_bits(values: np.ndarray, depth: int = 1) -> np.ndarray:
+    """Обратное к bits_to_values"""
+    if depth == 1:
+        return values
+    return np.unpackbits(values.reshape(-1, 1), axis=1)[:, 8 - depth:].reshape(-1)
+
+def data_slots(length: int, depth: int = 1) -> int:
+    """Сколько слотов занимают length байт данных при глубине depth"""
+    return -(-length * 8 // depth)
+
+def embed_bits(flat: np.ndarray, indices: np.ndarray, bits: np.ndarray, depth: int = 1) -> None:
+    """
+    Записывает значения в младшие разряды flat[indices] одной операцией;
+    depth > 1 - значения из bits_to_values, по depth бит на слот.
+    """
+    flat[indices] = (flat[indices] & ((0xFF << depth) & 0xFF)) | bits
+
+def read_bits(flat: np.ndarray, indices: np.ndarray, depth: int = 1) -> np.ndarray:
+    """Читает младшие depth бит flat[indices]"""
+    return flat[indices] & ((1 << depth) - 1)
+
+def find_marker(data: np.ndarray, marker: bytes = END_MARKER) -> int:
+    """
+    Векторно ищет первое вхождение маркера в массиве байтов.
+    Возвращает индекс начала маркера или -1.
+    """
+    if data.size < len(marker):
+        return -1
+
+    windows = np.lib.stride_tricks.sliding_window_view(data, len(marker))
+    hits = np.flatnonzero((windows == np.frombuffer(marker, dtype=np.uint8)).all(axis=1))
+    return int(hits[0]) if hits.size else -1
+
+def build_payload(text, total_pixels: int, depth: int = 1) -> bytes:
+    """
+    Текст в UTF-8 (или байты с флагом FLAG_BINARY) с заголовком
+    (длина, флаги, глубина LSB, CRC32); проверяет, что он помещается.
+    """
+    data, flags = encode_payload(text)
+    payload = pack_payload(data, flags | depth_flags(depth))
+
+    if HEADER_BITS + data_slots(len(data), depth) > total_pixels * 3:
+        raise ValueError("Текст слишком длинный")
+
+    return payload
+
+def payload_slots(total_pixels: int, text, seed_key: str = "stegano_key",
+                  scheme: str = DEFAULT_POSITION_SCHEME, depth: int = 1) -> tuple:
+    """
+    Возвращает (индексы слотов, значения, маски сохраняемых бит) для текста
+    с заголовком: заголовок занимает один бит слота, данные - depth бит.
+    """
+    return payload_slots_for(total_pixels, build_payload(text, total_pixels, depth), seed_key, scheme, depth)
+
+def payload_slots_for(total_pixels: int, payload: bytes, seed_key: str, scheme: str,
+                      depth: int = 1) -> tuple:
+    """payload_slots для уже собранного build_payload сообщения"""
+    data_values = bits_to_values(bytes_to_bits(payload[HEADER_SIZE:]), depth)
+    values = np.concatenate([bytes_to_bits(payload[:HEADER_SIZE]), data_values])
+
+    keep = np.full(len(values), (0xFF << depth) & 0xFF, dtype=np.uint8)
+    keep[:HEADER_BITS] = 0xFE
+    return generate_positions(total_pixels, len(values), seed_key, scheme), values, keep
+
+def embed_text(flat: np.ndarray, total_pixels: int, text, seed_key: str = "stegano_key",
+               scheme: str = DEFAULT_POSITION_SCHEME, slot_map=None, depth: int = 1) -> None:
+    """
+    Записывает текст с заголовком в младшие биты flat на месте.
+
+    Позиции считаются в слотах RGB-изображения (pixel_idx * 3 + channel);
+    slot_map переводит их в индексы flat, если байты лежат в другом
+    порядке (например, BGR снизу вверх в BMP). depth - бит данных на слот.
+    """
+    embed_payload(flat, total_pixels, build_payload(text, total_pixels, depth), seed_key, scheme,
+                  slot_map, depth)
+
+def embed_payload(flat: np.ndarray, total_pixels: int, payload: bytes, seed_key: str,
+                  scheme: str, slot_map=None, depth: int = 1) -> None:
+    """embed_text для уже собранного build_payload сообщения"""
+    indices, values, keep = payload_slots_for(total_pixels, payload, seed_key, scheme, depth)
+    if slot_map is not None:
+        indices = slot_map(indices)
+
+    flat[indices] = (flat[indices] & keep) | values
+
+def _embed_range_task(handle: tuple, total_pixels: int, start: int, payload_part: bytes,
+                      seed_key: str, scheme: str, depth: int = 1) -> None:
+    """Исполнитель: записывает данные в слоты start.. изображения из разделяемой памяти"""
+    shared = SharedImage.attach(handle)
+    try:
+        values = bits_to_values(bytes_to_bits(payload_part), depth)
+        indices = generate_positions(total_pixels, len(values), seed_key, scheme, start)
+        embed_bits(shared.array.reshape(-1), indices, values, depth)
+    finally:
+        shared.close()
+
+def embed_text_shared(shared: SharedImage, text, seed_key: str = "stegano_key",
+                      scheme: str = DEFAULT_POSITION_SCHEME, executor=None, parts: int = None,
+                      depth: int = 1) -> None:
+    """
+    Встраивает текст в RGB-изображение из разделяемой памяти.
+
+    Заголовок записывается в текущем процессе. Данные делятся по байтам
+    на parts кусков (границы кратны depth, чтобы кусок начинался с целого
+    слота), каждый процесс сам строит свои позиции (перестановка Фейстеля
+    считается с любого места) и пишет биты прямо в общий сегмент - позиции
+    не пересекаются. Пиксели между процессами не копируются. Схема 'legacy'
+    последовательна и всегда выполняется в текущем процессе.
+    """
+    height, width = shared.shape[:2]
+    embed_payload_shared(shared, build_payload(text, height * width, depth), seed_key, scheme,
+                         executor, parts, depth)
+
+def embed_payload_shared(shared: SharedImage, payload: bytes, seed_key: str, scheme: str,
+                         executor=None, parts: int = None, depth: int = 1) -> None:
+    """embed_text_shared для уже собранного build_payload сообщения"""
+    height, width = shared.shape[:2]
+    total_pixels = height * width
+    header, data = payload[:HEADER_SIZE], payload[HEADER_SIZE:]
+
+    embed_bits(shared.array.reshape(-1), generate_positions(total_pixels, HEADER_BITS, seed_key, scheme),
+               bytes_to_bits(header))
+
+    if executor is None or scheme != 'feistel':
+        _embed_range_task(shared.handle, total_pixels, HEADER_BITS, data, seed_key, scheme, depth)
+        return
+
+    futures = [
+        executor.submit(_embed_range_task, shared.handle, total_pixels, HEADER_BITS + first * 8 // depth,
+                        data[first:last], seed_key, scheme, depth)
+        for first, last in split_range(len(data), parts or os.cpu_count() or 1, align=depth)
+    ]
+    for future in futures:
+        future.result()
+
+def hide_text_lsb(img: Image.Image, text: str, seed_key: str = "stegano_key",
+                  scheme: str = DEFAULT_POSITION_SCHEME, executor=None, depth: int = 1) -> Image.Image:
+    """
+    Общий LSB-движок для PNG, BMP и WebP.
+
+    Работает с плоским uint8-представлением RGB-изображения:
+    все биты записываются одной операцией с fancy-индексацией,
+    без попиксельных getpixel/putpixel. С executor (пул процессов)
+    длинные сообщения встраиваются параллельно через embed_text_shared.
+    Вместо текста можно передать bytes - они записываются с флагом FLAG_BINARY.
+    depth (1-4) - сколько младших бит канала занимают данные: в depth раз
+    меньше позиций и больше ёмкость ценой большего искажения.
+    """
+    total_pixels = img.width * img.height
+    # Параллельность выбирается по размеру встраиваемого (сжатого) сообщения, а не по длине текста
+    payload = build_payload(text, total_pixels, depth)
+    if executor is not None and len(payload) * 8 >= PARALLEL_MIN_BITS:
+        with SharedImage.from_image(img) as shared:
+            embed_payload_shared(shared, payload, seed_key, scheme, executor, depth=depth)
+            encoded_img = Image.fromarray(shared.array)
+        encoded_img.info = img.info.copy()
+        return encoded_img
+
+    # np.array создаёт копию, исходное изображение не меняется
+    pixel_data = np.array(img, dtype=np.uint8)
+    embed_payload(pixel_data.reshape(-1), total_pixels, payload, seed_key, scheme, depth=depth)
+
+    encoded_img = Image.fromarray(pixel_data)
+    encoded_img.info = img.info.copy()
+    return encoded_img
+
+def _read_framed_payload(flat: np.ndarray, total_pixels: int, seed_key: str, scheme: str):
+    """
+    Читает данные по заголовку: сначала HEADER_BITS позиций заголовка,
+    затем ровно столько позиций, сколько занимают данные при глубине из заголовка.
+    Возвращает (байты данных, флаги) или None, если заголовка нет или CRC не сошёлся.
+    """
+    total_bits = total_pixels * 3
+    if total_bits < HEADER_BITS:
+        return None
+
+    header_bits = read_bits(flat, generate_positions(total_pixels, HEADER_BITS, seed_key, scheme))
+    header = parse_header(np.packbits(header_bits).tobytes())
+    if header is None:
+        return None
+    depth = header_depth(header.flags)
+    slots = data_slots(header.length, depth)
+    if HEADER_BITS + slots > total_bits:
+        return None
+
+    positions = generate_positions(total_pixels, slots, seed_key, scheme, start=HEADER_BITS)
+    bits = values_to_bits(read_bits(flat, positions, depth), depth)
+    data = np.packbits(bits[:header.length * 8]).tobytes()
+    return (data, header.flags) if verify_payload(header, data) else None
+
+def _read_marker_payload(flat: np.ndarray, total_pixels: int, seed_key: str, scheme: str) -> tuple:
+    """Читает биты старого формата и ищет маркер конца. Возвращает (данные, индекс маркера)"""
+    max_bits_to_extract = min(total_pixels * 3, MAX_BITS_TO_EXTRACT)
+    bits = read_bits(flat, generate_positions(total_pixels, max_bits_to_extract, seed_key, scheme))
+
+    # Учитываем только полные байты
+    bits = bits[:len(bits) - len(bits) % 8]
+    data = np.packbits(bits)
+    return data, find_marker(data)
+
+def read_payload_lsb(flat: np.ndarray, total_pixels: int, seed_key: str = "stegano_key",
+                     scheme: str = DEFAULT_POSITION_SCHEME):
+    """
+    Только данные с заголовком, проверенные по CRC (текст или bytes), иначе None.
+    Старый формат с маркером не ищется - его нельзя отличить от шума.
+    """
+    framed = _read_framed_payload(flat, total_pixels, seed_key, scheme)
+    return None if framed is None else decode_payload(*framed)
+
+def lsb_plane(img: Image.Image) -> np.ndarray:
+    """Плоскость младших бит RGB-изображения (0/1): одно декодирование на много ключей"""
+    return np.asarray(img, dtype=np.uint8).reshape(-1) & 1
+
+def probe_headers(plane: np.ndarray, total_pixels: int, keys: list,
+                  scheme: str = DEFAULT_POSITION_SCHEME, executor=None) -> np.ndarray:
+    """
+    Проверяет заголовки сразу для многих ключей. Позиции HEADER_BITS бит
+    каждого ключа строятся в executor (пул потоков), биты всех ключей
+    читаются одной выборкой из матрицы ключи x HEADER_BITS.
+    Возвращает индексы ключей, у которых совпали magic и версия.
+    """
+    if not keys or total_pixels * 3 < HEADER_BITS:
+        return np.zeros(0, dtype=np.intp)
+
+    def header_positions(key):
+        return generate_positions(total_pixels, HEADER_BITS, key, scheme)
+
+    rows = list(executor.map(header_positions, keys)) if executor else [header_positions(k) for k in keys]
+    headers = np.packbits(plane[np.stack(rows)], axis=1)
+    expected = np.frombuffer(PAYLOAD_MAGIC + bytes([PAYLOAD_VERSION]), dtype=np.uint8)
+    return np.flatnonzero((headers[:, :len(expected)] == expected).all(axis=1))
+
+def extract_with_keys(img: Image.Image, keys: list, scheme: str = None, threads: int = None):
+    """
+    Ищет среди keys ключ, которым записаны данные.
+
+    Изображение декодируется и переводится в плоскость младших бит один раз; для каждого
+    ключа читается только заголовок (probe_headers), данные - лишь у ключей
+    с совпавшим заголовком, с проверкой CRC. Без явной схемы пробуются все
+    POSITION_SCHEMES. Возвращает (ключ, схема, текст или bytes) или None.
+    """
+    total_pixels = img.width * img.height
+    flat = np.asarray(img, dtype=np.uint8).reshape(-1)
+    plane = flat & 1
+    schemes = (scheme,) if scheme else POSITION_SCHEMES
+
+    with ThreadPoolExecutor(threads or os.cpu_count() or 1) as pool:
+        for candidate in schemes:
+            for index in probe_headers(plane, total_pixels, keys, candidate, pool):
+                # Данные могут занимать несколько младших бит - читаем их из пикселей
+                payload = read_payload_lsb(flat, total_pixels, keys[index], candidate)
+                if payload is not None:
+                    return keys[index], candidate, payload
+    return None
+
+def extract_text_lsb(img: Image.Image, seed_key: str = "stegano_key", scheme: str = None) -> str:
+    """
+    Извлекает текст, записанный hide_text_lsb.
+
+    Сначала декодируется заголовок, затем читаются только позиции,
+    нужные данным, - стоимость зависит от длины сообщения, а не от
+    размера изображения. Если заголовка нет, ищется END_MARKER
+    старого формата. Без явной схемы пробуются все POSITION_SCHEMES.
+    Данные с флагом FLAG_BINARY возвращаются как bytes.
+    """
+    total_pixels = img.width * img.height
+    flat = np.asarray(img, dtype=np.uint8).reshape(-1)
+    schemes = (scheme,) if scheme else POSITION_SCHEMES
+
+    for candidate in schemes:
+        framed = _read_framed_payload(flat, total_pixels, seed_key, candidate)
+        if framed is not None:
+            return decode_payload(*framed)
+
+    for candidate in schemes:
+        data, marker_idx = _read_marker_payload(flat, total_pixels, seed_key, candidate)
+        if marker_idx >= 0:
+            return decode_text(data[:marker_idx].tobytes())
+
+    # Если не нашли ни заголовка, ни маркера
+    return decode_text(data.tobytes(), fallback='latin-1')
@@ -0,0 +1,163 @@
+import bz2
+import lzma
+import struct
+import zlib
+from collections import namedtuple
+
+# Заголовок полезной нагрузки:
+# magic (2 байта) | версия (1) | флаги (1) | длина данных (4) | CRC32 данных (4)
+PAYLOAD_MAGIC = b'SG'
+PAYLOAD_VERSION = 1
+HEADER_FORMAT = '>2sBBII'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+HEADER_BITS = HEADER_SIZE * 8
+
+# Флаги заголовка
+FLAG_BINARY = 0x01  # данные - произвольные байты, а не текст UTF-8
+FLAG_ZLIB = 0x02    # данные сжаты deflate без обёртки zlib
+FLAG_BZ2 = 0x04     # данные сжаты bz2
+FLAG_LZMA = 0x08    # данные сжаты LZMA2 без обёртки xz
+
+# Глубина LSB - сколько младших бит канала занимают данные (заголовок
+# всегда пишется в один бит). Хранится в битах 4-5 флагов как depth - 1,
+# поэтому у старых сообщений она равна 1.
+LSB_DEPTHS = (1, 2, 3, 4)
+DEPTH_SHIFT = 4
+DEPTH_MASK = 0x30
+
+# Сжатие перед встраиванием: 'auto' - метод по размеру, 'none' - без сжатия
+COMPRESSION_METHODS = ('auto', 'none', 'zlib', 'bz2', 'lzma')
+PAYLOAD_COMPRESSION = 'auto'
+
+# Границы выбора метода в режиме 'auto' (байт исходных данных):
+# короче первой сжатие не окупается, дальше deflate, bz2 и LZMA по очереди
+COMPRESSION_MIN_SIZE = 64
+BZ2_MIN_SIZE = 16 << 10
+LZMA_MIN_SIZE = 256 << 10
+
+# Предел распакованного размера - защита от «бомб» в чужих изображениях
+MAX_DECOMPRESSED_SIZE = 64 << 20
+
+# Без заголовков и контрольных сумм контейнеров - целостность проверяет CRC32 заголовка
+_LZMA_FILTERS = [{'id': lzma.FILTER_LZMA2, 'preset': 6}]
+_COMPRESSION_FLAGS = {'zlib': FLAG_ZLIB, 'bz2': FLAG_BZ2, 'lzma': FLAG_LZMA}
+
+PayloadHeader = namedtuple('PayloadHeader', ['version', 'flags', 'length', 'checksum'])
+# Результат encode_payload: данные после сжатия и флаги. Передаётся дальше
+# вместо текста, чтобы проверка ёмкости и встраивание не сжимали его дважды
+EncodedPayload = namedtuple('EncodedPayload', ['data', 'flags'])
+
+
+def pack_payload(data: bytes, flags: int = 0) -> bytes:
+    """Добавляет к данным заголовок с длиной, флагами и контрольной суммой"""
+    header = struct.pack(HEADER_FORMAT, PAYLOAD_MAGIC, PAYLOAD_VERSION, flags,
+                         len(data), zlib.crc32(data))
+    return header + data
+
+def depth_flags(depth: int) -> int:
+    """Флаги заголовка для глубины LSB"""
+    if depth not in LSB_DEPTHS:
+        raise ValueError(f"Глубина LSB должна быть от 1 до {LSB_DEPTHS[-1]}")
+    return (depth - 1) << DEPTH_SHIFT
+
+def header_depth(flags: int) -> int:
+    """Глубина LSB из флагов заголовка"""
+    return ((flags & DEPTH_MASK) >> DEPTH_SHIFT) + 1
+
+def choose_compression(size: int) -> str:
+    """Метод сжатия для данных размером size в режиме 'auto'"""
+    if size < COMPRESSION_MIN_SIZE:
+        return 'none'
+    if size < BZ2_MIN_SIZE:
+        return 'zlib'
+    if size < LZMA_MIN_SIZE:
+        return 'bz2'
+    return 'lzma'
+
+def compress(data: bytes, method: str) -> bytes:
+    if method == 'zlib':
+        compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+        return compressor.compress(data) + compressor.flush()
+    if method == 'bz2':
+        return bz2.compress(data, 9)
+    if method == 'lzma':
+        return lzma.compress(data, format=lzma.FORMAT_RAW, filters=_LZMA_FILTERS)
+    raise ValueError(f"Неизвестный метод сжатия: {method}")
+
+def decompress(data: bytes, flags: int, limit: int = MAX_DECOMPRESSED_SIZE) -> bytes:
+    """Распаковывает данные по флагам заголовка; больше limit байт - ValueError"""
+    if flags & FLAG_ZLIB:
+        decompressor = zlib.decompressobj(-15)
+        result = decompressor.decompress(data, limit + 1)
+    elif flags & FLAG_BZ2:
+        result = bz2.BZ2Decompressor().decompress(data, limit + 1)
+    elif flags & FLAG_LZMA:
+        decompressor = lzma.LZMADecompressor(format=lzma.FORMAT_RAW, filters=_LZMA_FILTERS)
+        result = decompressor.decompress(data, limit + 1)
+    else:
+        return data
+
+    if len(result) > limit:
+        raise ValueError("Распакованные данные слишком велики")
+    return result
+
+def encode_payload(payload, compression: str = None) -> EncodedPayload:
+    """
+    Строка -> UTF-8, байты -> как есть с FLAG_BINARY; затем сжатие
+    (compression, по умолчанию PAYLOAD_COMPRESSION). Сжатые данные
+    остаются, только если они короче исходных. Данные больше
+    MAX_DECOMPRESSED_SIZE не сжимаются: decompress их не распакует.
+    Уже подготовленный EncodedPayload возвращается как есть.
+    """
+    if isinstance(payload, EncodedPayload):
+        return payload
+    if isinstance(payload, str):
+        data, flags = payload.encode('utf-8'), 0
+    else:
+        data, flags = bytes(payload), FLAG_BINARY
+
+    method = compression or PAYLOAD_COMPRESSION
+    if method not in COMPRESSION_METHODS:
+        raise ValueError(f"Неизвестный метод сжатия: {method}")
+    if method == 'auto':
+        method = choose_compression(len(data))
+    if method != 'none' and len(data) <= MAX_DECOMPRESSED_SIZE:
+        packed = compress(data, method)
+        if len(packed) < len(data):
+            data, flags = packed, flags | _COMPRESSION_FLAGS[method]
+    return EncodedPayload(data, flags)
+
+def decode_payload(data: bytes, flags: int):
+    """Обратное к encode_payload: распаковка, затем bytes для FLAG_BINARY или текст"""
+    data = decompress(data, flags)
+    if flags & FLAG_BINARY:
+        return data
+    return decode_text(data)
+
+def parse_header(raw: bytes):
+    """
+    Разбирает заголовок из первых HEADER_SIZE байт.
+    Возвращает PayloadHeader или None, если заголовка нет.
+    """
+    if len(raw) < HEADER_SIZE:
+        return None
+
+    magic, version, flags, length, checksum = struct.unpack(HEADER_FORMAT, raw[:HEADER_SIZE])
+    if magic != PAYLOAD_MAGIC or version != PAYLOAD_VERSION:
+        return None
+
+    return PayloadHeader(version, flags, length, checksum)
+
+def verify_payload(header: PayloadHeader, data: bytes) -> bool:
+    """Проверяет длину и CRC32 прочитанных данных"""
+    return len(data) == header.length and zlib.crc32(data) == header.checksum
+
+def decode_text(text_bytes: bytes, fallback: str = 'cp1251') -> str:
+    """Декодирует байты в строку: UTF-8, затем запасная кодировка, затем latin-1"""
+    try:
+        return text_bytes.decode('utf-8')
+    except UnicodeDecodeError:
+        try:
+            return text_bytes.decode(fallback)
+        except UnicodeDecodeError:
+            return text_bytes.decode('latin-1')
@@ -1,109 +1,115 @@
 from PIL import Image
 import io
-import hashlib
-import random
+import numpy as np
+import os
+from encoder_profiles import DEFAULT_PROFILE, resolve_profile, timed_encode
+from png_codec import UnsupportedPng, embed_png_stream, read_png_header, write_png
+from shared_image import SharedImage
+from stegano_lsb import (
+    DEFAULT_POSITION_SCHEME,
+    PARALLEL_MIN_BITS,
+    build_payload,
+    embed_payload,
+    embed_payload_shared,
+    payload_slots,
+    extract_text_lsb,
+)
 
-# Уникальный маркер конца текста
-END_MARKER = b'\x00\xFF\x00\xFF\x00'
-
-def generate_seed_from_key(key: str = "default_seed") -> int:
-    """Генерирует числовой seed из строкового ключа через SHA-256"""
-    hash_object = hashlib.sha256(key.encode())
-    return int.from_bytes(hash_object.digest()[:8], 'big')
-
-def generate_pseudo_random_positions(total_pixels: int, total_bits: int, seed_key: str = "stegano_key") -> list:
+def hide_text_png(image_file, text: str, seed_key: str = "stegano_key",
+                  scheme: str = DEFAULT_POSITION_SCHEME, profile: str = DEFAULT_PROFILE,
+                  latency_budget: float = None, compress_level: int = None,
+                  threads: int = None, executor=None, depth: int = 1) -> io.BytesIO:
     """
-    Генерирует псевдослучайные позиции для встраивания битов.
-    
-    Использует эффективный алгоритм без создания полного списка всех позиций:
-    1. Из ключа через SHA-256 получаем seed
-    2. Для каждого бита генерируем случайный индекс пикселя и канал
-    3. Отклоняем повторы через множество used_positions
-    
-    Сложность: O(n) по памяти, где n = total_bits
+    Скрывает текст в PNG-изображении с помощью LSB-стеганографии 
+    с псевдослучайным распределением битов.
     """
-    seed = generate_seed_from_key(seed_key)
-    rng = random.Random(seed)
-    
-    positions = []
-    used_positions = set()
-    total_channels = 3
-    
-    # Генерируем ровно total_bits уникальных позиций
-    while len(positions) < total_bits:
-        pixel_idx = rng.randint(0, total_pixels - 1)
-        channel = rng.randint(0, total_channels - 1)
-        
-        position = (pixel_idx, channel)
-        if position not in used_positions:
-            used_positions.add(position)
-            positions.append(position)
-    
-    return positions
+    output = io.BytesIO()
+    hide_text_png_file(image_file, output, text, seed_key, scheme, profile, latency_budget,
+                       compress_level, threads, executor, depth)
+    output.seek(0)
+    return output
 
-def hide_text_png(image_file, text: str, seed_key: str = "stegano_key") -> io.BytesIO:
+def hide_text_png_file(image_file, output_file, text: str, seed_key: str = "stegano_key",
+                       scheme: str = DEFAULT_POSITION_SCHEME, profile: str = DEFAULT_PROFILE,
+                       latency_budget: float = None, compress_level: int = None,
+                       threads: int = None, executor=None, depth: int = 1, progress=None) -> None:
     """
-    Скрывает текст в PNG-изображении с помощью LSB-стеганографии 
-    с псевдослучайным распределением битов.
+    Скрывает текст в PNG и пишет результат в открытый файл output_file.
+    
+    8-битные RGB/RGBA без interlace обрабатываются построчно (png_codec):
+    изображение не декодируется целиком, память не зависит от его размеров.
+    Остальные PNG идут через PIL. IDAT сжимается параллельно в threads
+    потоках (по умолчанию - по числу ядер); уровень сжатия берётся
+    из профиля (encoder_profiles), явный compress_level важнее профиля.
+    executor (пул процессов) используется для длинных сообщений на пути PIL.
+    depth - сколько младших бит канала занимают данные (1-4).
+    progress(доля 0..1) сообщает ход работы: доля строк на потоковом
+    пути, этапы декодирования, встраивания и кодирования на пути PIL.
     """
     image_file.seek(0)
+    try:
+        header = read_png_header(image_file)
+    except UnsupportedPng:
+        _hide_text_png_pil(image_file, output_file, text, seed_key, scheme, profile, latency_budget,
+                           compress_level, threads, executor, depth, progress)
+        return
+    
+    pixels = header['width'] * header['height']
+    slots, values, keep = payload_slots(pixels, text, seed_key, scheme, depth)
+    profile, options = resolve_profile('png', profile, pixels, latency_budget)
+    if compress_level is not None:
+        options['compress_level'] = compress_level
+    
+    with timed_encode('png', profile, pixels):
+        embed_png_stream(image_file, output_file, slots, values, header, options['compress_level'], threads, keep,
+                         progress)
+
+def _hide_text_png_pil(image_file, output_file, text: str, seed_key: str, scheme: str,
+                       profile: str, latency_budget: float, compress_level: int, threads: int,
+                       executor, depth: int = 1, progress=None) -> None:
+    """Встраивание с полным декодированием через PIL"""
+    image_file.seek(0)
     img = Image.open(image_file)
     
     if img.mode != 'RGB':
         img = img.convert('RGB')
-    
-    # Кодируем текст в UTF-8 байты + маркер конца
-    text_bytes = text.encode('utf-8')
-    text_bytes += END_MARKER
-    
-    # Преобразуем байты в биты (от старшего к младшему)
-    bits = []
-    for byte in text_bytes:
-        for i in range(7, -1, -1):
-            bits.append((byte >> i) & 1)
-    
-    # Проверяем размер
-    total_pixels = img.width * img.height
-    
-    if len(bits) > total_pixels * 3:
-        raise ValueError(f"Текст слишком длинный")
-    
-    # Генерируем псевдослучайные позиции
-    positions = generate_pseudo_random_positions(total_pixels, len(bits), seed_key)
-    
-    # Создаём копию для модификации
-    encoded_img = img.copy()
-    pixels = encoded_img.load()
-    
-    # Создаем массив пикселей для доступа по индексу
-    pixel_array = []
-    for y in range(img.height):
-        for x in range(img.width):
-            pixel_array.append((x, y))
-    
-    # Встраиваем биты
-    for bit_idx, (pixel_idx, channel) in enumerate(positions):
-        x, y = pixel_array[pixel_idx]
-        r, g, b = encoded_img.getpixel((x, y))
-        
-        bit_val = bits[bit_idx]
-        
-        if channel == 0:
-            r = (r & 0xFE) | bit_val
-        elif channel == 1:
-            g = (g & 0xFE) | bit_val
+    if progress is not None:
+        progress(0.3)
+    
+    pixels = img.width * img.height
+    profile, options = resolve_profile('png', profile, pixels, latency_budget)
+    if compress_level is not None:
+        options['compress_level'] = compress_level
+    parallel = (threads or os.cpu_count() or 1) > 1
+    
+    # Порог параллельности - по размеру встраиваемого (сжатого) сообщения
+    payload = build_payload(text, pixels, depth)
+    if parallel and executor is not None and len(payload) * 8 >= PARALLEL_MIN_BITS:
+        # Процессы пишут биты в разделяемую память, write_png читает тот же буфер
+        with SharedImage.from_image(img) as shared:
+            embed_payload_shared(shared, payload, seed_key, scheme, executor, depth=depth)
+            if progress is not None:
+                progress(0.5)
+            with timed_encode('png', profile, pixels):
+                write_png(output_file, shared.array, options['compress_level'], threads, img.info)
+        return
+    
+    # Встраиваем биты через общий векторный LSB-движок (сообщение уже собрано)
+    pixel_data = np.array(img, dtype=np.uint8)
+    embed_payload(pixel_data.reshape(-1), pixels, payload, seed_key, scheme, depth=depth)
+    encoded_img = Image.fromarray(pixel_data)
+    encoded_img.info = img.info.copy()
+    if progress is not None:
+        progress(0.5)
+    
+    # На одном ядре кодировщик Pillow быстрее, на нескольких - параллельный
+    with timed_encode('png', profile, pixels):
+        if parallel:
+            write_png(output_file, np.asarray(encoded_img), options['compress_level'], threads, encoded_img.info)
         else:
-            b = (b & 0xFE) | bit_val
-            
-        pixels[x, y] = (r, g, b)
-    
-    # Сохраняем результат
-    output = io.BytesIO()
-    encoded_img.save(output, format='PNG', optimize=False)
-    output.seek(0)
-    return output
+            encoded_img.save(output_file, format='PNG', optimize=False, **options)
 
-def extract_text_png(image_file, seed_key: str = "stegano_key") -> str:
+def extract_text_png(image_file, seed_key: str = "stegano_key", scheme: str = None) -> str:
     """
     Извлекает скрытый текст из PNG-изображения.
     """
@@ -113,59 +119,4 @@ def extract_text_png(image_file, seed_key: str = "stegano_key") -> str:
     if img.mode != 'RGB':
         img = img.convert('RGB')
     
-    total_pixels = img.width * img.height
-    total_bits = total_pixels * 3
-    
-    # Создаем массив пикселей
-    pixel_array = []
-    for y in range(img.height):
-        for x in range(img.width):
-            pixel_array.append((x, y))
-    
-    # Генерируем те же позиции (используем тот же ключ)
-    # Берем с запасом, но не все возможные
-    max_bits_to_extract = min(total_bits, 50000)  # Ограничиваем для скорости
-    positions = generate_pseudo_random_positions(total_pixels, max_bits_to_extract, seed_key)
-    
-    bits = []
-    bytes_list = []
-    
-    # Извлекаем биты
-    for bit_idx, (pixel_idx, channel) in enumerate(positions):
-        x, y = pixel_array[pixel_idx]
-        r, g, b = img.getpixel((x, y))
-        
-        if channel == 0:
-            bits.append(r & 1)
-        elif channel == 1:
-            bits.append(g & 1)
-        else:
-            bits.append(b & 1)
-        
-        # Формируем байты
-        if len(bits) >= 8:
-            byte_val = 0
-            for i in range(8):
-                byte_val = (byte_val << 1) | bits[i]
-            bits = bits[8:]
-            
-            bytes_list.append(byte_val)
-            
-            # Проверяем маркер конца
-            if len(bytes_list) >= len(END_MARKER):
-                last_bytes = bytes(bytes_list[-len(END_MARKER):])
-                if last_bytes == END_MARKER:
-                    text_bytes = bytes(bytes_list[:-len(END_MARKER)])
-                    try:
-                        return text_bytes.decode('utf-8')
-                    except:
-                        try:
-                            return text_bytes.decode('cp1251')
-                        except:
-                            return text_bytes.decode('latin-1')
-    
-    # Если не нашли маркер
-    try:
-        return bytes(bytes_list).decode('utf-8')
-    except:
-        return bytes(bytes_list).decode('latin-1')
\ No newline at end of file
+    return extract_text_lsb(img, seed_key, scheme)
@@ -0,0 +1,146 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# Предел суммарного размера файлов хранилища, байт
+STORAGE_QUOTA_BYTES = 1 << 30
+# Сколько секунд файл живёт без обращений
+STORAGE_TTL = 24 * 3600
+# Размер куска при хешировании файла
+HASH_CHUNK_SIZE = 1 << 20
+
+# Имя файла хранилища: <sha256 содержимого><расширение>
+ARTIFACT_NAME = re.compile(r'^([0-9a-f]{64})(\.[a-z]+)$')
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ArtifactStore:
+    """
+    Хранилище результатов в каталоге root с адресацией по содержимому.
+
+    Файл называется SHA-256 своего содержимого, поэтому одинаковые
+    результаты хранятся один раз, а имена не пересекаются. Файлы,
+    к которым не обращались дольше ttl, удаляются; при превышении квоты
+    удаляются давно не запрошенные. Время обращения пишется в mtime,
+    так что после перезапуска порядок вытеснения сохраняется.
+    Потокобезопасно.
+    """
+
+    def __init__(self, root: str, quota_bytes: int = STORAGE_QUOTA_BYTES, ttl: float = STORAGE_TTL):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.ttl = ttl
+        # имя -> размер, от давно не запрошенных к недавним
+        self._entries = OrderedDict()
+        self._accessed = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self) -> None:
+        names = [name for name in os.listdir(self.root) if ARTIFACT_NAME.match(name)]
+        stats = sorted(((os.stat(os.path.join(self.root, name)), name) for name in names),
+                       key=lambda item: item[0].st_mtime)
+        with self._lock:
+            for stat, name in stats:
+                self._entries[name] = stat.st_size
+                self._accessed[name] = stat.st_mtime
+                self._bytes += stat.st_size
+            self._evict(time.time())
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def _touch(self, name: str, now: float) -> None:
+        self._entries.move_to_end(name)
+        self._accessed[name] = now
+        try:
+            os.utime(self._path(name), (now, now))
+        except FileNotFoundError:
+            pass
+
+    def _remove(self, name: str) -> None:
+        self._bytes -= self._entries.pop(name)
+        del self._accessed[name]
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self, now: float, keep: str = None) -> None:
+        """Удаляет просроченные, затем лишние сверх квоты; вызывается под блокировкой"""
+        for name in list(self._entries):
+            if now - self._accessed[name] <= self.ttl:
+                break
+            if name != keep:
+                self._remove(name)
+
+        # Только что положенный (или последний запрошенный) файл остаётся,
+        # даже если он один больше квоты, - иначе его нельзя было бы скачать
+        if keep is None and self._entries:
+            keep = next(reversed(self._entries))
+        for name in list(self._entries):
+            if self._bytes <= self.quota_bytes:
+                break
+            if name != keep:
+                self._remove(name)
+
+    def put(self, tmp_path: str, ext: str) -> str:
+        """
+        Переносит готовый файл tmp_path в хранилище и возвращает его имя.
+        Если такое содержимое уже есть, tmp_path удаляется.
+        """
+        name = f"{file_digest(tmp_path)}{ext}"
+        path = self._path(name)
+        now = time.time()
+
+        with self._lock:
+            if name in self._entries and os.path.exists(path):
+                os.remove(tmp_path)
+                self._touch(name, now)
+            else:
+                if name in self._entries:
+                    self._remove(name)
+                os.replace(tmp_path, path)
+                self._entries[name] = os.path.getsize(path)
+                self._bytes += self._entries[name]
+                self._touch(name, now)
+            self._evict(now, keep=name)
+        return name
+
+    def get(self, name: str):
+        """Путь к файлу хранилища или None, если его нет (или имя не из хранилища)"""
+        if not ARTIFACT_NAME.match(name):
+            return None
+        now = time.time()
+        with self._lock:
+            self._evict(now)
+            if name not in self._entries or not os.path.exists(self._path(name)):
+                return None
+            self._touch(name, now)
+            return self._path(name)
+
+    def __contains__(self, name: str) -> bool:
+        """Есть ли файл в хранилище; просроченные удаляются до проверки, как в get"""
+        with self._lock:
+            self._evict(time.time())
+            return name in self._entries and os.path.exists(self._path(name))
+
+    @staticmethod
+    def etag(name: str) -> str:
+        """ETag файла - хеш его содержимого"""
+        return ARTIFACT_NAME.match(name).group(1)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'files': len(self._entries), 'bytes': self._bytes, 'quota_bytes': self.quota_bytes}
@@ -0,0 +1,119 @@
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import app as app_module
+from result_cache import ResultCache
+from storage import ArtifactStore
+
+
+def image_bytes(fmt: str = 'PNG', size: tuple = (64, 48)) -> bytes:
+    rng = np.random.default_rng(1)
+    pixels = rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, fmt)
+    return buf.getvalue()
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """Клиент Flask с хранилищем результатов во временном каталоге"""
+    store = ArtifactStore(str(tmp_path))
+    monkeypatch.setattr(app_module, 'artifact_store', store)
+    monkeypatch.setattr(app_module, 'result_cache', ResultCache(store))
+    app_module.app.config['TESTING'] = True
+    return app_module.app.test_client()
+
+
+def hide(client, data: bytes, filename: str = 'cover.png', **form):
+    form = {'image': (io.BytesIO(data), filename), 'text': 'secret', **form}
+    return client.post('/hide_text', data=form, content_type='multipart/form-data')
+
+
+def test_latency_budget_selects_separate_artifacts(client):
+    data = image_bytes()
+    fast = hide(client, data, latency_budget='0').get_json()
+    slow = hide(client, data, latency_budget='100').get_json()
+    slow_again = hide(client, data, latency_budget='100').get_json()
+
+    # Бюджет 0 - профиль 'fastest', большой бюджет - 'smallest'
+    assert fast['download_url'] != slow['download_url']
+    assert slow_again['cached'] and slow_again['download_url'] == slow['download_url']
+
+
+def test_auto_profile_shares_artifact_with_resolved_profile(client):
+    data = image_bytes()
+    auto = hide(client, data, latency_budget='100').get_json()
+    explicit = hide(client, data, profile='smallest').get_json()
+    assert explicit['cached'] and explicit['download_url'] == auto['download_url']
+
+
+def extract_keys(client, data: bytes, filename: str, keys: str = 'a\nb'):
+    form = {'image': (io.BytesIO(data), filename), 'keys': keys}
+    return client.post('/extract_keys', data=form, content_type='multipart/form-data')
+
+
+def test_extract_keys_finds_key(client, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'STEGANO_KEY', 'b')
+    form = {'image': (io.BytesIO(image_bytes()), 'cover.png'), 'text': 'secret'}
+    stego = client.post('/hide_text?binary=1', data=form, content_type='multipart/form-data')
+    assert stego.mimetype == 'image/png'
+
+    response = extract_keys(client, stego.data, 'stego.png')
+    assert response.status_code == 200
+    assert response.get_json()['key_index'] == 1
+    assert response.get_json()['text'] == 'secret'
+
+
+@pytest.mark.parametrize('data, filename', [
+    (image_bytes('JPEG'), 'cover.jpg'),
+    (b'not an image', 'notes.txt'),
+])
+def test_extract_keys_rejects_unsupported_input(client, data, filename):
+    response = extract_keys(client, data, filename)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_download_uses_original_name(client):
+    url = hide(client, image_bytes(), filename='отпуск.png').get_json()['download_url']
+    response = client.get(url)
+    assert response.status_code == 200
+    disposition = response.headers['Content-Disposition']
+    assert "filename*=UTF-8''%D0%BE%D1%82%D0%BF%D1%83%D1%81%D0%BA_stego.png" in disposition
+
+
+@pytest.mark.parametrize('name, expected', [
+    ('../../etc/passwd', 'passwd.png'),
+    ('', None),
+])
+def test_download_name_is_sanitized(client, name, expected):
+    url = hide(client, image_bytes()).get_json()['download_url']
+    artifact = url.split('?')[0]
+    response = client.get(artifact, query_string={'name': name})
+    disposition = response.headers['Content-Disposition']
+    assert f'filename={expected or artifact.rsplit("/", 1)[1]}' in disposition
+
+
+def test_download_supports_etag_and_range(client):
+    url = hide(client, image_bytes()).get_json()['download_url']
+    artifact = url.split('?')[0].rsplit('/', 1)[1]
+    with open(app_module.artifact_store.get(artifact), 'rb') as f:
+        data = f.read()
+
+    response = client.get(url)
+    assert response.status_code == 200 and response.headers['ETag'] == f'"{ArtifactStore.etag(artifact)}"'
+
+    response = client.get(url, headers={'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 304
+
+    response = client.get(url, headers={'Range': 'bytes=10-19'})
+    assert response.status_code == 206 and response.data == data[10:20]
+
+    assert client.get('/download/' + '0' * 64 + '.png').status_code == 404
@@ -0,0 +1,132 @@
+import io
+import json
+import os
+import sys
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import batch
+from batch import BatchTooLarge, assign_texts, collect_batch_items, iter_batch_zip
+from jobs import JobManager, JobQueueFull
+from stegano_formats import detect_format, extract_image_text
+
+KEY = 'batch_key'
+
+
+class Upload:
+    """Загруженный файл в духе werkzeug.FileStorage"""
+
+    def __init__(self, filename: str, data: bytes):
+        self.filename = filename
+        self.data = data
+
+    def save(self, path: str) -> None:
+        with open(path, 'wb') as f:
+            f.write(self.data)
+
+
+def png_bytes(seed: int = 0) -> bytes:
+    pixels = np.random.default_rng(seed).integers(0, 256, (40, 50, 3), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, 'PNG')
+    return buf.getvalue()
+
+
+def zip_bytes(entries: dict) -> io.BytesIO:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for name, data in entries.items():
+            zf.writestr(name, data)
+    buf.seek(0)
+    return buf
+
+
+@pytest.fixture
+def manager():
+    manager = JobManager(workers=2, queue_limit=2)
+    yield manager
+    manager.shutdown()
+
+
+def run_batch(manager, batch_dir, items) -> tuple:
+    archive = zipfile.ZipFile(io.BytesIO(b''.join(iter_batch_zip(manager, batch_dir, items, KEY,
+                                                                  'fastest', None))))
+    report = json.loads(archive.read(batch.REPORT_NAME))
+    return archive, report
+
+
+def test_batch_roundtrip_respects_queue_limit(manager, tmp_path):
+    batch_dir = str(tmp_path / 'batch')
+    os.makedirs(batch_dir)
+    uploads = [Upload(f'img{i}.png', png_bytes(i)) for i in range(5)]
+    items, _ = collect_batch_items(batch_dir, uploads)
+    assign_texts(items, 'общий', {'img3.png': 'свой'})
+
+    archive, report = run_batch(manager, batch_dir, items)
+
+    assert [entry['status'] for entry in report] == ['ok'] * 5
+    for entry in report:
+        data = archive.read(entry['stego_file'])
+        expected = 'свой' if entry['file'] == 'img3.png' else 'общий'
+        assert extract_image_text(detect_format(entry['stego_file']), io.BytesIO(data), KEY) == expected
+    # Все места очереди освобождены, временный каталог удалён
+    assert manager._tasks == 0
+    assert not os.path.exists(batch_dir)
+
+
+def test_submit_task_counts_toward_queue_limit(manager):
+    first = manager.submit_task(time.sleep, 0.5)
+    second = manager.submit_task(time.sleep, 0.5)
+    with pytest.raises(JobQueueFull):
+        manager.submit_task(time.sleep, 0)
+    with pytest.raises(JobQueueFull):
+        manager.submit('extract', time.sleep)
+    first.result()
+    second.result()
+
+
+def test_errors_do_not_leak_paths(manager, tmp_path):
+    batch_dir = str(tmp_path / 'batch')
+    os.makedirs(batch_dir)
+    uploads = [Upload('broken.png', b'garbage'), Upload('ok.png', png_bytes())]
+    items, _ = collect_batch_items(batch_dir, uploads)
+    assign_texts(items, 'text', {})
+
+    _archive, report = run_batch(manager, batch_dir, items)
+
+    errors = {entry['file']: entry.get('error') for entry in report}
+    assert errors['broken.png'] == 'Cannot identify image file'
+    assert errors['ok.png'] is None
+    assert 'batch' not in json.dumps(report)
+
+
+def test_zip_entry_size_is_checked_before_extraction(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch, 'BATCH_MAX_FILE_BYTES', 1000)
+    archive = zip_bytes({'bomb.png': b'\0' * 100000})
+    with pytest.raises(BatchTooLarge):
+        collect_batch_items(str(tmp_path), [], archive)
+    assert os.listdir(tmp_path) == []
+
+
+def test_zip_total_size_is_limited(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch, 'BATCH_MAX_TOTAL_BYTES', 3 * 1000)
+    archive = zip_bytes({f'{i}.png': b'\0' * 1000 for i in range(4)})
+    with pytest.raises(BatchTooLarge):
+        collect_batch_items(str(tmp_path), [], archive)
+    assert os.listdir(tmp_path) == []
+
+
+def test_zip_manifest_and_names(tmp_path):
+    manifest = json.dumps([{'file': 'x.png', 'text': 'икс'}])
+    archive = zip_bytes({'dir/x.png': png_bytes(), 'notes.txt': b'x', 'manifest.json': manifest})
+    items, zip_manifest = collect_batch_items(str(tmp_path), [], archive)
+
+    assert [(item.name, item.fmt) for item in items] == [('x.png', 'png'), ('notes.txt', None)]
+    assert items[1].error
+    assert batch.parse_manifest(zip_manifest) == {'x.png': 'икс'}
@@ -0,0 +1,102 @@
+import io
+import os
+import struct
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from stegano_bmp import (
+    _hide_text_bmp_pil,
+    extract_text_bmp,
+    hide_text_bmp,
+    hide_text_bmp_file,
+    parse_bmp_layout,
+)
+
+KEY = 'bmp_key'
+TEXT = 'Сообщение в BMP'
+
+
+def bmp_bytes(width: int = 37, height: int = 23, mode: str = 'RGB', seed: int = 0) -> bytes:
+    pixels = np.random.default_rng(seed).integers(0, 256, (height, width, len(mode)), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels, mode).save(buf, 'BMP')
+    return buf.getvalue()
+
+
+def top_down(data: bytes) -> bytes:
+    """Тот же BMP со строками сверху вниз (отрицательная высота)"""
+    layout = parse_bmp_layout(data, len(data))
+    rows = [data[layout.offset + y * layout.stride:layout.offset + (y + 1) * layout.stride]
+            for y in range(layout.height)]
+    header = bytearray(data[:layout.offset])
+    struct.pack_into('<i', header, 22, -layout.height)
+    return bytes(header) + b''.join(reversed(rows))
+
+
+def pixels(data: bytes) -> np.ndarray:
+    return np.asarray(Image.open(io.BytesIO(data)).convert('RGB'))
+
+
+def test_layout_accounts_for_row_padding():
+    data = bmp_bytes(width=37)
+    layout = parse_bmp_layout(data, len(data))
+    assert (layout.width, layout.height, layout.stride, layout.top_down) == (37, 23, 112, False)
+    assert parse_bmp_layout(data, len(data) - 1) is None
+
+
+@pytest.mark.parametrize('depth', [1, 3])
+def test_in_place_matches_pil_path(depth):
+    data = bmp_bytes()
+    fast = hide_text_bmp(io.BytesIO(data), TEXT, KEY, depth=depth).getvalue()
+    slow = _hide_text_bmp_pil(io.BytesIO(data), TEXT, KEY, 'feistel', depth).getvalue()
+
+    # Заголовок и длина файла сохраняются, пиксели совпадают с путём через PIL
+    assert len(fast) == len(data) and fast[:54] == data[:54]
+    np.testing.assert_array_equal(pixels(fast), pixels(slow))
+    assert extract_text_bmp(io.BytesIO(fast), KEY) == TEXT
+
+
+def test_top_down_bmp():
+    data = top_down(bmp_bytes())
+    assert parse_bmp_layout(data, len(data)).top_down
+    np.testing.assert_array_equal(pixels(data), pixels(bmp_bytes()))
+
+    stego = hide_text_bmp(io.BytesIO(data), TEXT, KEY).getvalue()
+    assert len(stego) == len(data)
+    assert extract_text_bmp(io.BytesIO(stego), KEY) == TEXT
+
+
+def test_32_bit_bmp_falls_back_to_pil():
+    data = bmp_bytes(mode='RGBA')
+    assert parse_bmp_layout(data, len(data)) is None
+    stego = hide_text_bmp(io.BytesIO(data), TEXT, KEY)
+    assert extract_text_bmp(stego, KEY) == TEXT
+
+
+def test_file_is_edited_in_place(tmp_path):
+    source = tmp_path / 'source.bmp'
+    target = tmp_path / 'stego.bmp'
+    data = bmp_bytes(width=64, height=48)
+    source.write_bytes(data)
+
+    hide_text_bmp_file(str(target), TEXT, KEY, source_path=str(source))
+
+    stego = target.read_bytes()
+    assert source.read_bytes() == data
+    assert stego == hide_text_bmp(io.BytesIO(data), TEXT, KEY).getvalue()
+    # Изменились только младшие биты
+    diff = np.frombuffer(stego, dtype=np.uint8) ^ np.frombuffer(data, dtype=np.uint8)
+    assert diff.max() == 1
+
+
+def test_file_fallback_rewrites_unsupported_bmp(tmp_path):
+    path = tmp_path / 'rgba.bmp'
+    path.write_bytes(bmp_bytes(mode='RGBA'))
+    hide_text_bmp_file(str(path), TEXT, KEY)
+    with open(path, 'rb') as f:
+        assert extract_text_bmp(f, KEY) == TEXT
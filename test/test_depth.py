@@ -0,0 +1,94 @@
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from stegano_formats import CapacityError, extract_image_text, hide_image_to_stream, image_capacity
+from stegano_lsb import (
+    bits_to_values,
+    data_slots,
+    generate_positions,
+    hide_text_lsb,
+    payload_slots,
+    read_payload_lsb,
+    values_to_bits,
+)
+from stegano_payload import HEADER_BITS, header_depth, parse_header
+
+KEY = 'depth_key'
+SAVE_AS = {'png': 'PNG', 'bmp': 'BMP', 'webp': 'WEBP'}
+
+
+def image_bytes(fmt: str, size: tuple = (60, 40)) -> bytes:
+    pixels = np.random.default_rng(7).integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, SAVE_AS[fmt], **({'lossless': True} if fmt == 'webp' else {}))
+    return buf.getvalue()
+
+
+@pytest.mark.parametrize('depth', [1, 2, 3, 4])
+def test_values_roundtrip(depth):
+    bits = np.random.default_rng(depth).integers(0, 2, 8 * 13, dtype=np.uint8)
+    values = bits_to_values(bits, depth)
+    assert len(values) == data_slots(13, depth) and values.max() < (1 << depth)
+    np.testing.assert_array_equal(values_to_bits(values, depth)[:len(bits)], bits)
+
+
+@pytest.mark.parametrize('fmt', ['png', 'bmp', 'webp'])
+@pytest.mark.parametrize('depth', [1, 2, 3, 4])
+def test_format_roundtrip(fmt, depth):
+    text = os.urandom(200).hex()
+    stego = hide_image_to_stream(fmt, io.BytesIO(image_bytes(fmt)), text, KEY, depth=depth)
+    assert extract_image_text(fmt, io.BytesIO(stego.getvalue()), KEY) == text
+
+
+@pytest.mark.parametrize('depth', [2, 4])
+def test_header_stays_one_bit_per_slot(depth):
+    img = Image.open(io.BytesIO(image_bytes('png'))).convert('RGB')
+    original = np.asarray(img, dtype=np.uint8).reshape(-1)
+    text = os.urandom(100).hex()
+    stego = np.asarray(hide_text_lsb(img, text, KEY, depth=depth), dtype=np.uint8).reshape(-1)
+    total_pixels = img.width * img.height
+
+    header_slots = generate_positions(total_pixels, HEADER_BITS, KEY)
+    assert np.all((stego[header_slots] ^ original[header_slots]) <= 1)
+    header = parse_header(np.packbits(stego[header_slots] & 1).tobytes())
+    assert header_depth(header.flags) == depth
+
+    # Данные занимают в depth раз меньше слотов и меняют только depth младших бит
+    slots, _, _ = payload_slots(total_pixels, text, KEY, depth=depth)
+    assert len(slots) == HEADER_BITS + data_slots(header.length, depth)
+    assert np.all((stego ^ original) < (1 << depth))
+    assert read_payload_lsb(stego, total_pixels, KEY) == text
+
+
+def test_capacity_scales_with_depth():
+    image = io.BytesIO(image_bytes('png'))
+    capacities = [image_capacity('png', image, depth) for depth in (1, 2, 3, 4)]
+    slots = 60 * 40 * 3
+    assert [info['bits'] for info in capacities] == [slots * depth for depth in (1, 2, 3, 4)]
+    assert [info['payload_bytes'] for info in capacities] == [(slots - HEADER_BITS) * depth // 8
+                                                              for depth in (1, 2, 3, 4)]
+
+    # Сообщение, которое не помещается при depth=1, помещается при depth=4
+    text = os.urandom(capacities[0]['payload_bytes']).hex()[:capacities[0]['payload_bytes'] * 2]
+    with pytest.raises(CapacityError):
+        hide_image_to_stream('png', image, text, KEY, depth=1)
+    stego = hide_image_to_stream('png', image, text, KEY, depth=4)
+    assert extract_image_text('png', io.BytesIO(stego.getvalue()), KEY) == text
+
+
+def test_jpeg_capacity_ignores_depth():
+    buf = io.BytesIO()
+    Image.new('RGB', (64, 48)).save(buf, 'JPEG')
+    assert image_capacity('jpg', buf, 4) == image_capacity('jpg', buf, 1)
+
+
+def test_unsupported_depth_is_rejected():
+    with pytest.raises(ValueError):
+        hide_image_to_stream('png', io.BytesIO(image_bytes('png')), 'text', KEY, depth=5)
@@ -0,0 +1,53 @@
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import stegano_formats
+from stegano_formats import extract_auto, hide_image_to_stream
+
+KEY = 'formats_key'
+
+
+def image_bytes(fmt: str = 'PNG', size: tuple = (96, 64), seed: int = 0) -> bytes:
+    pixels = np.random.default_rng(seed).integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, fmt)
+    return buf.getvalue()
+
+
+@pytest.mark.parametrize('fmt, save_as', [('png', 'PNG'), ('bmp', 'BMP'), ('webp', 'WEBP')])
+def test_extract_auto_finds_lsb(fmt, save_as):
+    stego = hide_image_to_stream(fmt, io.BytesIO(image_bytes(save_as)), 'auto text', KEY)
+    found = extract_auto(io.BytesIO(stego.getvalue()), KEY)
+    assert (found.fmt, found.algorithm, found.payload) == (fmt, 'lsb', 'auto text')
+
+
+def test_extract_auto_does_not_wait_for_slow_candidates(monkeypatch):
+    stego = hide_image_to_stream('png', io.BytesIO(image_bytes()), 'fast', KEY).getvalue()
+
+    def slow_dct(img):
+        time.sleep(2)
+        return None
+
+    monkeypatch.setattr(stegano_formats, '_dct_candidate', slow_dct)
+    started = time.time()
+    found = extract_auto(io.BytesIO(stego), KEY)
+    assert found.payload == 'fast'
+    assert time.time() - started < 1
+
+
+def test_extract_auto_wrong_key_finds_nothing():
+    stego = hide_image_to_stream('png', io.BytesIO(image_bytes()), 'text', KEY).getvalue()
+    assert extract_auto(io.BytesIO(stego), 'other key') is None
+
+
+def test_extract_auto_rejects_unknown_container():
+    with pytest.raises(ValueError):
+        extract_auto(io.BytesIO(b'plain text'), KEY)
@@ -0,0 +1,104 @@
+import io
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from encoder_profiles import EncoderTimings
+from jobs import JobManager, TaskResult, hide_file_task, run_extract_job, run_hide_job
+from stegano_formats import extract_image_text
+
+KEY = 'jobs_key'
+
+
+def write_png(path: str, seed: int = 0) -> None:
+    pixels = np.random.default_rng(seed).integers(0, 256, (80, 120, 3), dtype=np.uint8)
+    Image.fromarray(pixels).save(path, 'PNG')
+
+
+def wait_job(manager: JobManager, job_id: str, timeout: float = 30) -> dict:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = manager.get(job_id)
+        if job['status'] in ('done', 'error'):
+            return job
+        time.sleep(0.02)
+    raise TimeoutError(job_id)
+
+
+@pytest.fixture
+def manager():
+    manager = JobManager(workers=2, timings=EncoderTimings())
+    yield manager
+    manager.shutdown()
+
+
+def test_hide_job_roundtrip_and_timings(manager, tmp_path):
+    source = str(tmp_path / 'source.png')
+    output = str(tmp_path / 'stego.png')
+    write_png(source)
+
+    job_id = manager.submit('hide', run_hide_job, 'png', source, output, 'задача', KEY, 'fastest', None)
+    job = wait_job(manager, job_id)
+
+    assert job['status'] == 'done' and job['progress'] == 1.0
+    assert job['result'] == output
+    assert not os.path.exists(source)
+    with open(output, 'rb') as f:
+        assert extract_image_text('png', f, KEY) == 'задача'
+    # Время кодирования в процессе-исполнителе попало в историю менеджера
+    assert 'png/fastest' in manager.timings.snapshot()
+
+    extract_source = str(tmp_path / 'extract.png')
+    os.replace(output, extract_source)
+    job = wait_job(manager, manager.submit('extract', run_extract_job, 'png', extract_source, KEY))
+    assert job['result'] == 'задача'
+
+
+def test_hide_job_error_is_reported(manager, tmp_path):
+    source = str(tmp_path / 'source.png')
+    write_png(source)
+    job_id = manager.submit('hide', run_hide_job, 'png', source, str(tmp_path / 'out.png'),
+                            os.urandom(50000).hex(), KEY, 'fastest', None)
+    job = wait_job(manager, job_id)
+    assert job['status'] == 'error' and job['error']
+    assert not os.path.exists(tmp_path / 'out.png')
+
+
+def test_task_result_merges_timings(manager, tmp_path):
+    source = str(tmp_path / 'source.png')
+    write_png(source)
+    future = manager.submit_task(hide_file_task, 'png', source, str(tmp_path / 'out.png'), 'text', KEY,
+                                 'balanced', None)
+    assert isinstance(future.result(), TaskResult)
+    assert manager.task_result(future) == str(tmp_path / 'out.png')
+    assert 'png/balanced' in manager.timings.snapshot()
+
+
+def test_collect_gathers_only_inner_samples():
+    timings = EncoderTimings()
+    timings.record('png', 'fastest', 10 ** 6, 0.5)
+    with timings.collect() as samples:
+        timings.record('png', 'balanced', 10 ** 6, 1.0)
+    timings.record('png', 'smallest', 10 ** 6, 2.0)
+    assert samples == [('png', 'balanced', 10 ** 6, 1.0)]
+
+    parent = EncoderTimings()
+    parent.merge(samples)
+    assert parent.estimate('png', 'balanced', 2 * 10 ** 6) == pytest.approx(2.0)
+
+
+def test_executor_is_created_once(manager):
+    executors = []
+    threads = [threading.Thread(target=lambda: executors.append(manager.executor())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(executor) for executor in executors}) == 1
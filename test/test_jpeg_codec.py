@@ -0,0 +1,115 @@
+import io
+import logging
+import os
+import sys
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from jpeg_codec import HuffmanTable, HuffmanTableFull, _embed_block_signs_rebuilt
+from stegano_jpg import COEF_POS, QUANT_STEP, extract_text_jpg, hide_text_jpg
+from stegano_payload import encode_payload, pack_payload
+
+
+def make_jpeg(mode: str = 'RGB', size: tuple = (256, 192), **save_kwargs) -> bytes:
+    rng = np.random.default_rng(5)
+    h, w = size[1], size[0]
+    gradient = np.linspace(0, 255, w, dtype=np.float32)[None, :, None]
+    noise = rng.normal(0, 20, (h, w, 3))
+    pixels = np.clip(gradient + noise, 0, 255).astype(np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).convert(mode).save(buf, 'JPEG', **save_kwargs)
+    return buf.getvalue()
+
+
+def payload_bits(text: str) -> np.ndarray:
+    return np.unpackbits(np.frombuffer(pack_payload(*encode_payload(text)), dtype=np.uint8))
+
+
+def last_changed_row(src: bytes, out: bytes) -> int:
+    a = np.asarray(Image.open(io.BytesIO(src))).astype(int)
+    b = np.asarray(Image.open(io.BytesIO(out))).astype(int)
+    rows = np.flatnonzero(np.abs(a - b).reshape(a.shape[0], -1).max(1))
+    return int(rows[-1]) + 1 if rows.size else 0
+
+
+@pytest.mark.parametrize('save_kwargs', [
+    {'quality': 90},
+    {'quality': 75, 'optimize': True},
+    {'quality': 75, 'optimize': True, 'restart_marker_blocks': 3},
+    {'quality': 90, 'subsampling': 0, 'optimize': True},
+])
+def test_coefficient_roundtrip_keeps_size(save_kwargs, caplog):
+    src = make_jpeg(**save_kwargs)
+    text = 'Привет, JPEG!'
+
+    with caplog.at_level(logging.WARNING, logger='stegano_jpg'):
+        out = hide_text_jpg(io.BytesIO(src), text).getvalue()
+
+    assert not caplog.records, 'ожидался путь через коэффициенты без пересжатия'
+    assert extract_text_jpg(io.BytesIO(out)) == text
+    assert len(out) < len(src) * 1.1
+    # Меняются только строки блоков с битами (при 4:2:0 - строки MCU)
+    block_rows = -(-len(payload_bits(text)) // (256 // 8))
+    assert last_changed_row(src, out) <= 16 * (-(-block_rows // 2))
+
+
+def test_grayscale_optimized_roundtrip():
+    src = make_jpeg('L', quality=80, optimize=True)
+    out = hide_text_jpg(io.BytesIO(src), 'gray').getvalue()
+    assert extract_text_jpg(io.BytesIO(out)) == 'gray'
+
+
+def test_progressive_falls_back_with_warning(caplog):
+    src = make_jpeg(quality=90, progressive=True)
+    with caplog.at_level(logging.WARNING, logger='stegano_jpg'):
+        out = hide_text_jpg(io.BytesIO(src), 'progressive').getvalue()
+    assert any('пересжимается' in record.getMessage() for record in caplog.records)
+    assert extract_text_jpg(io.BytesIO(out)) == 'progressive'
+
+
+def test_rebuilt_tables_roundtrip():
+    src = make_jpeg(quality=75, optimize=True, restart_marker_blocks=5)
+    out = _embed_block_signs_rebuilt(src, payload_bits('rebuilt'), COEF_POS, QUANT_STEP * 2)
+    assert extract_text_jpg(io.BytesIO(out)) == 'rebuilt'
+    assert len(out) < len(src) * 1.1
+
+
+def test_extend_keeps_existing_codes():
+    # Коды 0 и 10, остальное пространство свободно
+    table = HuffmanTable(bytes([1, 1] + [0] * 14), bytes([0x01, 0x02]))
+    before = dict(table.codes)
+
+    table.extend([0x03, 0x11])
+
+    assert all(table.codes[symbol] == code for symbol, code in before.items())
+    assert table.codes[0x03] == (0xC000, 16)
+    assert table.lookup[0xC000] == (0x03 << 5) | 16
+    rebuilt = HuffmanTable(bytes(table.counts), bytes(table.symbols))
+    assert rebuilt.codes == table.codes
+    assert table.segment(1, 0)[:2] == b'\xFF\xC4'
+
+
+def test_extend_full_table_raises():
+    # По одному коду каждой длины: свободен только зарезервированный 0xFFFF
+    table = HuffmanTable(bytes([1] * 16), bytes(range(1, 17)))
+    with pytest.raises(HuffmanTableFull):
+        table.extend([0x03])
+
+
+def test_optimal_table_is_valid_prefix_code():
+    # Геометрические частоты дают коды длиннее 16 бит до укорачивания
+    freqs = Counter({symbol: 2 ** min(i, 30) for i, symbol in enumerate(range(0, 40))})
+    table = HuffmanTable.optimal(freqs)
+
+    assert set(table.codes) == set(freqs)
+    lengths = [length for _code, length in table.codes.values()]
+    assert max(lengths) <= 16
+    # Нет кода из одних единиц и ни один код не префикс другого
+    assert all(code != (1 << length) - 1 for code, length in table.codes.values())
+    words = sorted(format(code, f'0{length}b') for code, length in table.codes.values())
+    assert all(not b.startswith(a) for a, b in zip(words, words[1:]))
@@ -0,0 +1,93 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+
+from stegano_lsb import (
+    PositionCache,
+    feistel_positions,
+    generate_positions,
+    generate_pseudo_random_positions,
+    iter_positions,
+    positions_to_indices,
+)
+
+KEY = 'positions_key'
+
+
+@pytest.mark.parametrize('total_slots', [1, 7, 300, 4099])
+def test_feistel_is_a_permutation(total_slots):
+    positions = feistel_positions(total_slots, 0, total_slots, KEY)
+    np.testing.assert_array_equal(np.sort(positions), np.arange(total_slots))
+
+
+def test_feistel_ranges_are_consistent():
+    whole = feistel_positions(10 ** 5, 0, 5000, KEY)
+    np.testing.assert_array_equal(feistel_positions(10 ** 5, 1234, 100, KEY), whole[1234:1334])
+    np.testing.assert_array_equal(np.concatenate(list(iter_positions(5000, KEY, chunk_size=700))),
+                                  feistel_positions(5000, 0, 5000, KEY))
+    assert not np.array_equal(feistel_positions(10 ** 5, 0, 5000, 'other'), whole)
+
+
+def test_legacy_scheme_matches_original_generator():
+    expected = positions_to_indices(generate_pseudo_random_positions(500, 300, KEY))
+    np.testing.assert_array_equal(generate_positions(500, 300, KEY, 'legacy', cache=None), expected)
+    np.testing.assert_array_equal(generate_positions(500, 100, KEY, 'legacy', start=200, cache=None),
+                                  expected[200:])
+
+
+def test_generate_positions_rejects_bad_requests():
+    with pytest.raises(ValueError):
+        generate_positions(10, 31, KEY)
+    with pytest.raises(ValueError):
+        generate_positions(10, 5, KEY, 'unknown')
+
+
+def test_cache_serves_prefixes_and_extends_entries():
+    cache = PositionCache()
+    long = generate_positions(10 ** 4, 10000, KEY, cache=cache)
+    short = generate_positions(10 ** 4, 2000, KEY, cache=cache)
+
+    np.testing.assert_array_equal(short, long[:2000])
+    assert np.shares_memory(short, long) and not short.flags.writeable
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'entries': 1, 'bytes': long.nbytes}
+
+    longer = generate_positions(10 ** 4, 20000, KEY, cache=cache)
+    np.testing.assert_array_equal(longer, feistel_positions(3 * 10 ** 4, 0, 20000, KEY))
+    assert cache.stats()['bytes'] == longer.nbytes and cache.misses == 2
+
+
+def test_cache_keys_include_size_and_scheme():
+    cache = PositionCache()
+    generate_positions(1000, 100, KEY, cache=cache)
+    generate_positions(1001, 100, KEY, cache=cache)
+    generate_positions(1000, 100, KEY, 'legacy', cache=cache)
+    generate_positions(1000, 100, 'other', cache=cache)
+    assert cache.stats()['entries'] == 4 and cache.hits == 0
+
+
+def test_cache_evicts_least_recently_used():
+    cache = PositionCache(max_bytes=3 * 400)
+    for key in ('a', 'b', 'c'):
+        generate_positions(1000, 100, key, cache=cache)
+    generate_positions(1000, 100, 'a', cache=cache)
+    generate_positions(1000, 100, 'd', cache=cache)
+
+    assert set(key[0] for key in cache._entries) == {'a', 'c', 'd'}
+    assert cache.stats()['bytes'] <= cache.max_bytes
+
+
+def test_cache_skips_arrays_larger_than_limit():
+    cache = PositionCache(max_bytes=100)
+    generate_positions(1000, 100, KEY, cache=cache)
+    assert cache.stats()['entries'] == 0
+
+
+def test_chunk_ranges_are_not_cached():
+    cache = PositionCache()
+    chunk = generate_positions(10 ** 4, 100, KEY, start=5000, cache=cache)
+    np.testing.assert_array_equal(chunk, feistel_positions(3 * 10 ** 4, 5000, 100, KEY))
+    assert cache.stats()['entries'] == 0
@@ -0,0 +1,167 @@
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import stegano_payload
+import stegano_lsb
+from stegano_formats import CapacityError, check_capacity, extract_image_text, hide_image_to_stream
+from stegano_lsb import generate_positions, hide_text_lsb, read_payload_lsb
+from stegano_payload import (
+    COMPRESSION_METHODS,
+    FLAG_BINARY,
+    FLAG_BZ2,
+    FLAG_LZMA,
+    FLAG_ZLIB,
+    HEADER_BITS,
+    HEADER_SIZE,
+    PAYLOAD_MAGIC,
+    EncodedPayload,
+    decode_payload,
+    depth_flags,
+    encode_payload,
+    header_depth,
+    pack_payload,
+    parse_header,
+    verify_payload,
+)
+
+KEY = 'payload_key'
+TEXT = 'Съешь же ещё этих мягких французских булок, да выпей чаю. ' * 40
+
+
+def png_bytes(size: tuple = (120, 80)) -> bytes:
+    pixels = np.random.default_rng(3).integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, 'PNG')
+    return buf.getvalue()
+
+
+@pytest.mark.parametrize('method, flag', [('zlib', FLAG_ZLIB), ('bz2', FLAG_BZ2), ('lzma', FLAG_LZMA)])
+def test_compression_roundtrip(method, flag):
+    data, flags = encode_payload(TEXT, method)
+    assert flags & flag and len(data) < len(TEXT.encode('utf-8'))
+    assert decode_payload(data, flags) == TEXT
+
+
+def test_binary_payload_keeps_flag():
+    raw = bytes(range(256)) * 4
+    payload = encode_payload(raw, 'zlib')
+    assert payload.flags & FLAG_BINARY
+    assert decode_payload(*payload) == raw
+
+
+def test_incompressible_data_is_stored():
+    raw = os.urandom(4096)
+    assert encode_payload(raw, 'lzma') == (raw, FLAG_BINARY)
+
+
+def test_auto_skips_short_messages():
+    assert encode_payload('short', 'auto') == (b'short', 0)
+
+
+def test_large_payload_is_not_compressed(monkeypatch):
+    monkeypatch.setattr(stegano_payload, 'MAX_DECOMPRESSED_SIZE', 1000)
+    data, flags = encode_payload(b'\0' * 2000, 'zlib')
+    assert flags == FLAG_BINARY and len(data) == 2000
+
+
+def test_decompression_limit():
+    data, flags = encode_payload(b'\0' * 10000, 'zlib')
+    with pytest.raises(ValueError):
+        stegano_payload.decompress(data, flags, limit=1000)
+
+
+def test_unknown_method_is_rejected():
+    assert 'brotli' not in COMPRESSION_METHODS
+    with pytest.raises(ValueError):
+        encode_payload(TEXT, 'brotli')
+
+
+def test_encoded_payload_passes_through():
+    payload = encode_payload(TEXT, 'bz2')
+    assert isinstance(payload, EncodedPayload)
+    assert encode_payload(payload, 'none') is payload
+
+
+def test_hide_compresses_once(monkeypatch):
+    calls = []
+    compress = stegano_payload.compress
+    monkeypatch.setattr(stegano_payload, 'compress', lambda data, method: calls.append(method) or compress(data, method))
+
+    stego = hide_image_to_stream('png', io.BytesIO(png_bytes()), TEXT, KEY, compression='zlib')
+
+    assert calls == ['zlib']
+    assert extract_image_text('png', io.BytesIO(stego.getvalue()), KEY) == TEXT
+
+
+def test_check_capacity_uses_requested_method():
+    image = io.BytesIO(png_bytes((40, 30)))
+    # Несжатый текст не помещается, сжатый - помещается
+    assert len(TEXT.encode('utf-8')) > 40 * 30 * 3 // 8
+    assert check_capacity('png', image, TEXT, compression='lzma').flags & FLAG_LZMA
+    with pytest.raises(CapacityError):
+        check_capacity('png', image, TEXT, compression='none')
+
+
+def test_header_roundtrip():
+    data = 'заголовок'.encode('utf-8')
+    packed = pack_payload(data, FLAG_BINARY | depth_flags(3))
+    header = parse_header(packed)
+
+    assert len(packed) == HEADER_SIZE + len(data) and packed.startswith(PAYLOAD_MAGIC)
+    assert header.length == len(data) and header.flags & FLAG_BINARY
+    assert header_depth(header.flags) == 3
+    assert verify_payload(header, packed[HEADER_SIZE:])
+
+
+@pytest.mark.parametrize('raw', [b'', b'SG\x01', b'XX' + bytes(HEADER_SIZE), b'SG\x02' + bytes(HEADER_SIZE)])
+def test_parse_header_rejects_foreign_data(raw):
+    assert parse_header(raw) is None
+
+
+def test_verify_payload_checks_length_and_crc():
+    packed = pack_payload(b'payload')
+    header = parse_header(packed)
+    assert not verify_payload(header, b'payloa')
+    assert not verify_payload(header, b'paylaod')
+
+
+def test_depth_flags_do_not_overlap_compression():
+    for depth in (1, 2, 3, 4):
+        flags = depth_flags(depth) | FLAG_BINARY | FLAG_ZLIB | FLAG_BZ2 | FLAG_LZMA
+        assert header_depth(flags) == depth
+    with pytest.raises(ValueError):
+        depth_flags(5)
+
+
+def test_lsb_reads_only_positions_of_the_payload(monkeypatch):
+    img = Image.open(io.BytesIO(png_bytes())).convert('RGB')
+    stego = hide_text_lsb(img, 'коротко', KEY)
+    flat = np.asarray(stego, dtype=np.uint8).reshape(-1)
+    total_pixels = stego.width * stego.height
+
+    requested = []
+    monkeypatch.setattr(stegano_lsb, 'generate_positions',
+                        lambda *args, **kwargs: requested.append(args[1]) or generate_positions(*args, **kwargs))
+
+    assert read_payload_lsb(flat, total_pixels, KEY) == 'коротко'
+    assert requested == [HEADER_BITS, len('коротко'.encode('utf-8')) * 8]
+
+
+def test_lsb_rejects_corrupted_crc():
+    img = Image.open(io.BytesIO(png_bytes())).convert('RGB')
+    stego = hide_text_lsb(img, 'контрольная сумма', KEY)
+    flat = np.asarray(stego, dtype=np.uint8).reshape(-1).copy()
+    total_pixels = stego.width * stego.height
+
+    # Портим первый бит данных сразу после заголовка
+    index = generate_positions(total_pixels, 1, KEY, start=HEADER_BITS)[0]
+    flat[index] ^= 1
+
+    assert read_payload_lsb(flat, total_pixels, KEY) is None
@@ -0,0 +1,95 @@
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+from PIL import Image, PngImagePlugin
+
+import png_codec
+from png_codec import UnsupportedPng, read_png_header, write_png
+from stegano_png import _hide_text_png_pil, extract_text_png, hide_text_png_file
+
+KEY = 'png_key'
+TEXT = 'Построчное встраивание ' * 10
+
+
+def png_bytes(mode: str = 'RGB', size: tuple = (70, 50), seed: int = 0, **params) -> bytes:
+    rng = np.random.default_rng(seed)
+    # Плавный градиент с шумом - Pillow выбирает для строк разные фильтры
+    base = np.add.outer(np.arange(size[1]), np.arange(size[0])).astype(np.int64)
+    pixels = (base[..., None] + rng.integers(0, 8, (size[1], size[0], 4))) % 256
+    img = Image.fromarray(pixels.astype(np.uint8), 'RGBA')
+    if mode != 'RGBA':
+        img = img.convert('RGB' if mode == 'P' else mode).convert(mode)
+    buf = io.BytesIO()
+    img.save(buf, 'PNG', **params)
+    return buf.getvalue()
+
+
+def hide_stream(data: bytes, depth: int = 1, progress=None) -> bytes:
+    output = io.BytesIO()
+    hide_text_png_file(io.BytesIO(data), output, TEXT, KEY, threads=2, depth=depth, progress=progress)
+    return output.getvalue()
+
+
+def decoded(data: bytes) -> np.ndarray:
+    return np.asarray(Image.open(io.BytesIO(data)))
+
+
+@pytest.mark.parametrize('depth', [1, 2])
+def test_streaming_matches_pil_path(depth):
+    data = png_bytes()
+    streamed = hide_stream(data, depth)
+    full = io.BytesIO()
+    _hide_text_png_pil(io.BytesIO(data), full, TEXT, KEY, 'feistel', 'fastest', None, None, 1, None, depth)
+
+    np.testing.assert_array_equal(decoded(streamed), decoded(full.getvalue()))
+    assert extract_text_png(io.BytesIO(streamed), KEY) == TEXT
+
+
+def test_streaming_keeps_alpha_and_chunks():
+    info = PngImagePlugin.PngInfo()
+    info.add_text('Comment', 'сохранить')
+    data = png_bytes('RGBA', pnginfo=info)
+
+    stego = hide_stream(data)
+
+    img = Image.open(io.BytesIO(stego))
+    assert img.mode == 'RGBA' and img.text['Comment'] == 'сохранить'
+    np.testing.assert_array_equal(decoded(stego)[..., 3], decoded(data)[..., 3])
+    assert extract_text_png(io.BytesIO(stego), KEY) == TEXT
+
+
+def test_progress_is_reported_per_window(monkeypatch):
+    # Окно в несколько строк - изображение обрабатывается за несколько проходов
+    monkeypatch.setattr(png_codec, 'STREAM_WINDOW_BYTES', 8 * (70 * 3 + 1))
+    reports = []
+    stego = hide_stream(png_bytes(), progress=reports.append)
+
+    assert len(reports) >= 7
+    assert reports == sorted(reports) and reports[-1] == 1.0
+    assert extract_text_png(io.BytesIO(stego), KEY) == TEXT
+
+
+@pytest.mark.parametrize('mode', ['P', 'L', 'LA'])
+def test_unsupported_png_falls_back_to_pil(mode):
+    data = png_bytes(mode)
+    with pytest.raises(UnsupportedPng):
+        read_png_header(io.BytesIO(data))
+    stego = hide_stream(data)
+    assert extract_text_png(io.BytesIO(stego), KEY) == TEXT
+
+
+@pytest.mark.parametrize('channels, threads', [(3, 1), (3, 4), (4, 3)])
+def test_write_png_roundtrip(channels, threads, monkeypatch):
+    monkeypatch.setattr(png_codec, 'IDAT_CHUNK_SIZE', 1000)
+    pixels = np.random.default_rng(5).integers(0, 256, (90, 33, channels), dtype=np.uint8)
+    output = io.BytesIO()
+    write_png(output, pixels, threads=threads, info={'dpi': (300, 300)})
+
+    img = Image.open(io.BytesIO(output.getvalue()))
+    np.testing.assert_array_equal(np.asarray(img), pixels)
+    assert tuple(round(value) for value in img.info['dpi']) == (300, 300)
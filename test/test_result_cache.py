@@ -0,0 +1,111 @@
+import io
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from result_cache import ResultCache, result_key
+from storage import ArtifactStore
+
+KEY_ARGS = ('текст', 'key', 'png', 'feistel', 'balanced')
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ArtifactStore(str(tmp_path))
+
+
+def writer(data: bytes, calls: list = None, delay: float = 0):
+    def produce(path):
+        if calls is not None:
+            calls.append(path)
+        time.sleep(delay)
+        with open(path, 'wb') as f:
+            f.write(data)
+    return produce
+
+
+def test_result_key_covers_every_field():
+    image = io.BytesIO(b'image bytes')
+    base = result_key(image, *KEY_ARGS)
+    assert image.tell() == 0 and result_key(image, *KEY_ARGS) == base
+
+    variants = [
+        result_key(io.BytesIO(b'other bytes'), *KEY_ARGS),
+        result_key(image, 'другой', *KEY_ARGS[1:]),
+        result_key(image, 'текст'.encode('utf-8'), *KEY_ARGS[1:]),
+        result_key(image, 'текст', 'key2', *KEY_ARGS[2:]),
+        result_key(image, *KEY_ARGS[:2], 'bmp', *KEY_ARGS[3:]),
+        result_key(image, *KEY_ARGS[:3], 'legacy', 'balanced'),
+        result_key(image, *KEY_ARGS[:4], 'fastest'),
+        result_key(image, *KEY_ARGS, depth=2),
+        result_key(image, *KEY_ARGS, compression='lzma'),
+    ]
+    assert len(set(variants + [base])) == len(variants) + 1
+
+
+def test_hit_returns_same_artifact(store):
+    cache = ResultCache(store)
+    calls = []
+    first, cached = cache.get_or_create('k', '.png', writer(b'result', calls))
+    assert not cached and cache.get('k') == first
+
+    second, cached = cache.get_or_create('k', '.png', writer(b'other', calls))
+    assert cached and second == first and len(calls) == 1
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'entries': 1}
+    assert cache.get('missing') is None
+
+
+def test_concurrent_requests_compute_once(store):
+    cache = ResultCache(store)
+    calls, results = [], []
+
+    def request():
+        results.append(cache.get_or_create('k', '.png', writer(b'result', calls, delay=0.2)))
+
+    threads = [threading.Thread(target=request) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert len({name for name, _ in results}) == 1
+    assert sorted(cached for _, cached in results) == [False] + [True] * 5
+    assert cache.stats()['misses'] == 1 and cache.stats()['hits'] == 5
+
+
+def test_failed_producer_lets_waiters_retry(store):
+    cache = ResultCache(store)
+
+    def fail(path):
+        raise RuntimeError('encode failed')
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_create('k', '.png', fail)
+    name, cached = cache.get_or_create('k', '.png', writer(b'result'))
+    assert not cached and name in store
+    # Временные файлы неудачной попытки не остаются
+    assert os.listdir(store.root) == [name]
+
+
+def test_evicted_artifact_is_rebuilt(tmp_path):
+    store = ArtifactStore(str(tmp_path), quota_bytes=10)
+    cache = ResultCache(store)
+    first, _ = cache.get_or_create('a', '.png', writer(b'0123456789'))
+    cache.get_or_create('b', '.png', writer(b'abcdefghij'))
+
+    assert first not in store and cache.get('a') is None
+    rebuilt, cached = cache.get_or_create('a', '.png', writer(b'0123456789'))
+    assert rebuilt == first and not cached
+
+
+def test_entries_are_bounded(store):
+    cache = ResultCache(store, max_entries=2)
+    for key in 'abc':
+        cache.get_or_create(key, '.png', writer(key.encode()))
+    assert list(cache._entries) == ['b', 'c']
@@ -215,11 +215,11 @@ class SteganoAnalyzer:
             result['error'] = f"General: {str(e)[:30]}"
         return result
     
-    def calculate_capacity(self, image: Image.Image, algorithm: str) -> Dict:
+    def calculate_capacity(self, image: Image.Image, algorithm: str, depth: int = 1) -> Dict:
         width, height = image.size
         pixels = width * height
         if algorithm in ['png', 'bmp', 'webp']:
-            return {'bits': pixels * 3, 'bytes': (pixels * 3) // 8}
+            return {'bits': pixels * 3 * depth, 'bytes': (pixels * 3 * depth) // 8}
         else:
             blocks_h = height // 8
             blocks_w = width // 8
@@ -422,6 +422,92 @@ class SteganoAnalyzer:
         plt.close()
         print(f"\nГрафик изменения размера сохранён: {charts_dir / 'size_vs_length.png'}")
 
+    # ========================================================================
+    # ТЕСТ: Глубина LSB - качество против ёмкости
+    # ========================================================================
+    def test_lsb_depth_tradeoff(self):
+        print(f"\n{'='*70}")
+        print(f"ТЕСТ: Глубина LSB (бит на канал) - PSNR/SSIM и ёмкость")
+        print(f"{'='*70}")
+        depths = [1, 2, 3, 4]
+        formats = ['png', 'bmp', 'webp']
+        images_per_format = 3
+        # Одно и то же несжимаемое сообщение для всех глубин: половина ёмкости при depth=1
+        fill = 0.5
+        rng = np.random.default_rng(2026)
+        depth_data = {fmt: {depth: {'psnr': [], 'ssim': [], 'changed': [], 'capacity': []}
+                            for depth in depths}
+                      for fmt in formats}
+
+        for fmt in formats:
+            images = self.test_images.get(fmt, [])[:images_per_format]
+            if not images:
+                print(f"Предупреждение: нет изображений для {fmt}, пропускаем")
+                continue
+            algo = self.ALGORITHMS[fmt]
+            print(f"\n{algo['label']} ({len(images)} изображений)")
+            for image_path in images:
+                with open(image_path, 'rb') as f:
+                    original_bytes = f.read()
+                original = Image.open(io.BytesIO(original_bytes))
+                payload = rng.bytes(int(self.calculate_capacity(original, fmt)['bytes'] * fill))
+                for depth in depths:
+                    print(f"  {image_path.name[:20]:20s} - depth {depth}...", end='', flush=True)
+                    try:
+                        stego_stream = algo['hide'](io.BytesIO(original_bytes), payload, self.STEGANO_KEY,
+                                                    depth=depth)
+                        extracted = algo['extract'](stego_stream, self.STEGANO_KEY)
+                        if extracted != payload:
+                            print(f" ✗ Extraction mismatch")
+                            continue
+                        stego_stream.seek(0)
+                        metrics = self.calculate_metrics(original, Image.open(stego_stream))
+                    except Exception as e:
+                        print(f" ✗ {str(e)[:30]}")
+                        continue
+                    capacity = self.calculate_capacity(original, fmt, depth)['bytes']
+                    depth_data[fmt][depth]['psnr'].append(metrics['psnr'])
+                    depth_data[fmt][depth]['ssim'].append(metrics['ssim'])
+                    depth_data[fmt][depth]['changed'].append(metrics['changed_pixels_percent'])
+                    depth_data[fmt][depth]['capacity'].append(capacity)
+                    print(f" ✓ PSNR:{metrics['psnr']:.1f} SSIM:{metrics['ssim']:.4f} "
+                          f"изменено:{metrics['changed_pixels_percent']:.1f}% ёмкость:{capacity} байт")
+        self._plot_lsb_depth_tradeoff(depth_data, depths, formats)
+        return depth_data
+
+    def _plot_lsb_depth_tradeoff(self, depth_data, depths, formats):
+        charts_dir = self.output_dir / 'charts'
+        fig, axes = plt.subplots(1, 3, figsize=(18, 5))
+        markers = {'png': 'o', 'bmp': 's', 'webp': '^'}
+        panels = [
+            ('psnr', 'PSNR (dB)', 'PSNR от глубины'),
+            ('ssim', 'SSIM', 'SSIM от глубины'),
+            ('changed', 'Изменённые пиксели (%)', 'Доля изменённых пикселей'),
+        ]
+        for ax, (metric, ylabel, title) in zip(axes, panels):
+            for fmt in formats:
+                means = [np.mean(depth_data[fmt][depth][metric]) if depth_data[fmt][depth][metric] else np.nan
+                         for depth in depths]
+                valid = ~np.isnan(means)
+                if np.any(valid):
+                    ax.plot(np.array(depths)[valid], np.array(means)[valid],
+                            marker=markers.get(fmt, 'o'),
+                            color=self.ALGORITHMS[fmt]['color'],
+                            label=self.ALGORITHMS[fmt]['label'],
+                            linewidth=2.5, markersize=8)
+            ax.set_xticks(depths)
+            ax.set_xlabel('Глубина LSB (бит на канал)', fontsize=12)
+            ax.set_ylabel(ylabel, fontsize=12)
+            ax.set_title(title, fontsize=13, fontweight='bold')
+            ax.grid(True, alpha=0.3)
+            ax.legend()
+        fig.suptitle('Глубина LSB: качество при одинаковом сообщении (ёмкость растёт в depth раз)',
+                     fontsize=14, fontweight='bold')
+        plt.tight_layout()
+        plt.savefig(charts_dir / 'lsb_depth_tradeoff.png', dpi=150, bbox_inches='tight')
+        plt.close()
+        print(f"\nГрафик глубины LSB сохранён: {charts_dir / 'lsb_depth_tradeoff.png'}")
+
     # ========================================================================
     # ТЕСТ 3: BER для JPG
     # ========================================================================
@@ -770,6 +856,7 @@ class SteganoAnalyzer:
         self.test_message_length_impact()
         self.test_jpg_compression_ber()
         self.test_size_vs_message_length()   # НОВЫЙ ТЕСТ размера vs длина
+        self.test_lsb_depth_tradeoff()
         
         print("\n" + "█" * 70)
         print("Все тесты завершены!")
@@ -782,6 +869,7 @@ class SteganoAnalyzer:
         print("  - charts/summary_table.png")
         print("  - charts/message_length_impact.png")
         print("  - charts/jpg_ber_vs_quality.png")
+        print("  - charts/lsb_depth_tradeoff.png (PSNR/SSIM от глубины LSB)")
 
 
 def main():
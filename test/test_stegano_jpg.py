@@ -0,0 +1,137 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from stegano_jpg import (
+    COEF_BASIS,
+    QUANT_STEP,
+    bands_to_payload,
+    block_coefficients,
+    block_view,
+    dct_basis,
+    embed_block_bits,
+    embed_block_rows,
+    pixel_band_bits,
+    rgb_to_luma,
+    rgb_to_ycbcr,
+    ycbcr_to_rgb,
+)
+from stegano_payload import encode_payload, pack_payload
+
+
+def payload_bits(text: str) -> np.ndarray:
+    return np.unpackbits(np.frombuffer(pack_payload(*encode_payload(text)), dtype=np.uint8))
+
+
+def test_dct_basis_is_orthonormal():
+    basis = np.stack([dct_basis(u, v).reshape(-1) for u in range(8) for v in range(8)]).astype(np.float64)
+    np.testing.assert_allclose(basis @ basis.T, np.eye(64), atol=1e-5)
+
+
+def test_block_view_drops_partial_blocks_without_copy():
+    plane = np.arange(21 * 35, dtype=np.float32).reshape(21, 35)
+    blocks = block_view(plane)
+    assert blocks.shape == (2, 4, 8, 8)
+    assert np.shares_memory(blocks, plane)
+    np.testing.assert_array_equal(blocks[1, 2], plane[8:16, 16:24])
+
+
+def test_block_coefficients_match_per_block_product():
+    plane = np.random.default_rng(0).uniform(0, 255, (24, 40)).astype(np.float32)
+    expected = np.array([[np.sum(plane[r:r + 8, c:c + 8] * COEF_BASIS) for c in range(0, 40, 8)]
+                         for r in range(0, 24, 8)])
+    np.testing.assert_allclose(block_coefficients(block_view(plane)), expected, rtol=1e-4, atol=1e-2)
+
+
+def test_embed_block_bits_sets_signs_in_place():
+    plane = np.random.default_rng(1).uniform(0, 255, (32, 48)).astype(np.float32)
+    original = plane.copy()
+    bits = np.array([1, 0, 0, 1, 1, 0, 1, 0, 1], dtype=np.uint8)
+
+    embed_block_bits(plane, bits)
+
+    coefs = block_coefficients(block_view(plane)).reshape(-1)
+    np.testing.assert_allclose(coefs[:len(bits)], np.where(bits == 1, 2, -2) * QUANT_STEP, atol=1e-2)
+    # Блоки после последнего бита не тронуты
+    blocks_after = block_view(plane).reshape(-1, 8, 8)[len(bits):]
+    np.testing.assert_array_equal(blocks_after, block_view(original).reshape(-1, 8, 8)[len(bits):])
+
+
+def test_embed_block_rows_touches_only_carrier_rows():
+    rgb = np.random.default_rng(2).integers(0, 256, (64, 40, 3), dtype=np.uint8)
+    original = rgb.copy()
+    blocks_w = 40 // 8
+    bits = payload_bits('ab')[:2 * blocks_w + 3]
+
+    # Биты со второй строки блоков: строки 8..32 пикселей
+    embed_block_rows(rgb, bits, first_bit=blocks_w)
+
+    np.testing.assert_array_equal(rgb[:8], original[:8])
+    np.testing.assert_array_equal(rgb[32:], original[32:])
+    # Неполная последняя строка блоков: блоки справа не меняются
+    np.testing.assert_array_equal(rgb[24:32, 3 * 8:], original[24:32, 3 * 8:])
+    luma = rgb.astype(np.float32) @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    signs = (block_coefficients(block_view(luma)) > 0).astype(np.uint8).reshape(-1)
+    np.testing.assert_array_equal(signs[blocks_w:blocks_w + len(bits)], bits)
+
+
+@pytest.mark.parametrize('text', ['DCT', 'Длинное сообщение ' * 20])
+def test_bands_roundtrip_with_header(text):
+    rgb = np.random.default_rng(3).integers(40, 216, (8 * 40, 8 * 30, 3), dtype=np.uint8)
+    bits = payload_bits(text)
+    embed_block_rows(rgb, bits)
+    img = Image.fromarray(rgb)
+
+    assert bands_to_payload(pixel_band_bits(img), require_header=True) == text
+
+
+def test_bands_without_header():
+    bands = iter([np.zeros(64, dtype=np.uint8)] * 4)
+    assert bands_to_payload(bands, require_header=True) is None
+
+
+def random_rgb(seed: int = 4, shape: tuple = (37, 29, 3)) -> np.ndarray:
+    return np.random.default_rng(seed).integers(0, 256, shape, dtype=np.uint8)
+
+
+def test_rgb_to_ycbcr_matches_bt601():
+    rgb = random_rgb().astype(np.float64)
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    y = 0.299 * r + 0.587 * g + 0.114 * b
+    expected = np.stack([y, 128 - 0.1687 * r - 0.3313 * g + 0.5 * b, 128 + 0.5 * r - 0.4187 * g - 0.0813 * b], axis=-1)
+
+    ycbcr = rgb_to_ycbcr(random_rgb())
+
+    assert ycbcr.dtype == np.float32
+    np.testing.assert_allclose(ycbcr, expected, atol=1e-3)
+    np.testing.assert_allclose(rgb_to_luma(random_rgb()), y, atol=1e-3)
+
+
+def test_ycbcr_roundtrip():
+    rgb = random_rgb()
+    restored = ycbcr_to_rgb(rgb_to_ycbcr(rgb))
+    np.testing.assert_array_equal(np.clip(np.round(restored), 0, 255).astype(np.uint8), rgb)
+
+
+@pytest.mark.parametrize('chunk_rows', [1, 5, 36, 1000])
+def test_chunked_conversion_matches_single_pass(chunk_rows):
+    rgb = random_rgb()
+    whole = rgb_to_ycbcr(rgb, chunk_rows=rgb.shape[0])
+    np.testing.assert_array_equal(rgb_to_ycbcr(rgb, chunk_rows=chunk_rows), whole)
+    np.testing.assert_array_equal(ycbcr_to_rgb(whole, chunk_rows=chunk_rows),
+                                  ycbcr_to_rgb(whole, chunk_rows=rgb.shape[0]))
+
+
+def test_conversion_into_given_buffer():
+    rgb = random_rgb()
+    buffer = np.empty(rgb.shape, dtype=np.float32)
+    assert rgb_to_ycbcr(rgb, out=buffer, chunk_rows=8) is buffer
+    expected = ycbcr_to_rgb(buffer.copy())
+    # Обратное преобразование на месте
+    assert ycbcr_to_rgb(buffer, out=buffer, chunk_rows=8) is buffer
+    np.testing.assert_allclose(buffer, expected, atol=1e-4)
@@ -0,0 +1,86 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from storage import ArtifactStore, file_digest
+
+
+def put(store: ArtifactStore, data: bytes, ext: str = '.png') -> str:
+    tmp_path = os.path.join(store.root, '.tmp' + ext)
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    return store.put(tmp_path, ext)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ArtifactStore(str(tmp_path))
+
+
+def test_put_names_by_content_and_deduplicates(store):
+    name = put(store, b'artifact')
+    assert name == file_digest(store.get(name)) + '.png'
+    assert ArtifactStore.etag(name) == name[:-4]
+
+    assert put(store, b'artifact') == name
+    assert sorted(os.listdir(store.root)) == [name]
+    assert store.stats()['files'] == 1 and store.stats()['bytes'] == len(b'artifact')
+
+
+@pytest.mark.parametrize('name', ['../app.py', 'cover.png', '0' * 64 + '.PNG', '0' * 64 + '.png'])
+def test_get_rejects_foreign_names(store, name):
+    assert store.get(name) is None
+    assert name not in store
+
+
+def test_quota_evicts_least_recently_used(tmp_path):
+    store = ArtifactStore(str(tmp_path), quota_bytes=25)
+    a, b = put(store, b'a' * 10), put(store, b'b' * 10)
+    assert store.get(a)
+    c = put(store, b'c' * 10)
+
+    assert a in store and c in store and b not in store
+    assert not os.path.exists(os.path.join(store.root, b))
+
+
+def test_single_file_above_quota_is_kept(tmp_path):
+    store = ArtifactStore(str(tmp_path), quota_bytes=5)
+    name = put(store, b'x' * 10)
+    assert name in store
+
+
+def test_ttl_expires_unused_files(tmp_path):
+    store = ArtifactStore(str(tmp_path), ttl=60)
+    old, fresh = put(store, b'old'), put(store, b'fresh')
+    past = time.time() - 120
+    store._accessed[old] = past
+    os.utime(os.path.join(store.root, old), (past, past))
+
+    assert old not in store and store.get(old) is None
+    assert fresh in store
+
+
+def test_restart_keeps_files_and_access_order(tmp_path):
+    store = ArtifactStore(str(tmp_path), quota_bytes=25)
+    a, b = put(store, b'a' * 10), put(store, b'b' * 10)
+    past = time.time() - 10
+    os.utime(os.path.join(store.root, b), (past, past))
+    # Посторонние файлы не подхватываются
+    (tmp_path / 'notes.txt').write_bytes(b'x' * 100)
+
+    restarted = ArtifactStore(str(tmp_path), quota_bytes=25)
+    assert restarted.stats()['files'] == 2
+    put(restarted, b'c' * 10)
+    assert a in restarted and b not in restarted
+
+
+def test_file_removed_from_disk_is_missing(store):
+    name = put(store, b'artifact')
+    os.remove(os.path.join(store.root, name))
+    assert name not in store and store.get(name) is None
+    assert put(store, b'artifact') == name and name in store
+